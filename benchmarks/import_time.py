@@ -0,0 +1,119 @@
+'''
+Mede o tempo de importação do pacote, para detectar regressões na
+inicialização de clientes, bots e ferramentas de curta duração.
+
+Cada alvo é importado em um interpretador novo, com `python -X importtime`,
+em um diretório temporário; o resultado é a mediana do tempo acumulado do
+módulo nas repetições. Também são verificados os efeitos colaterais: quais
+módulos pesados foram carregados junto (o servidor, o asyncio, o
+importlib.metadata) e se algum arquivo foi criado no diretório de trabalho.
+
+Exemplo:
+    python benchmarks/import_time.py --output importacao.json
+    python benchmarks/import_time.py --baseline importacao.json --tolerance 0.25
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Alvo -> (importação medida, módulos pesados que o alvo usa de fato).
+TARGETS = {
+    "twotter": ("import twotter", ()),
+    "twotter.TwotterClient": ("from twotter import TwotterClient", ()),
+    "twotter.AsyncTwotterClient": ("from twotter import AsyncTwotterClient", ("asyncio",)),
+    "twotter.TwotterServer": ("from twotter import TwotterServer", ("twotter.entitites.server", "asyncio")),
+}
+# Módulos que não devem ser carregados por um alvo que não os usa.
+HEAVY_MODULES = ("twotter.entitites.server", "twotter.entitites.async_server", "asyncio", "importlib.metadata")
+
+_PROBE = '''
+import json, sys
+{statement}
+print(json.dumps(sorted(name for name in {heavy!r} if name in sys.modules)))
+'''
+
+
+def measure(statement, repeat):
+    '''
+    Importa o alvo em repeat interpretadores novos.
+
+    Returns:
+        dict: A mediana e o mínimo do tempo de importação (ms), os módulos pesados carregados e os arquivos criados.
+    '''
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [SRC_DIR, os.environ.get("PYTHONPATH")])))
+    times = []
+    loaded = []
+    created = set()
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as directory:
+            result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                                     _PROBE.format(statement=statement, heavy=HEAVY_MODULES)],
+                                    cwd=directory, env=env, capture_output=True, text=True, check=True)
+            created.update(os.listdir(directory))
+        loaded = json.loads(result.stdout)
+        total = 0
+        for line in result.stderr.splitlines():
+            # "import time: self [us] | cumulative | módulo"; a indentação indica a profundidade.
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line.split("|")
+            if name.strip().startswith("twotter") and not name[1:].startswith(" "):
+                total += int(cumulative)
+        times.append(total / 1000)
+    return {"median_ms": statistics.median(times), "min_ms": min(times), "heavy_modules": loaded,
+            "created_files": sorted(created)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede o tempo de importação do Twotter.")
+    parser.add_argument("--repeat", type=int, default=15, help="Número de interpretadores por alvo (padrão: 15).")
+    parser.add_argument("--target", action="append", choices=sorted(TARGETS),
+                        help="Mede apenas este alvo (pode ser repetido).")
+    parser.add_argument("--baseline", help="Arquivo JSON de uma execução anterior, para comparação.")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Aumento relativo tolerado em relação ao baseline (padrão: 0.25).")
+    parser.add_argument("--output", help="Arquivo JSON em que o resultado é salvo.")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    results = {}
+    failed = False
+    print(f"{'alvo':<28} {'mediana (ms)':>13} {'mínimo (ms)':>12}  observações")
+    for target in args.target or TARGETS:
+        statement, allowed = TARGETS[target]
+        result = results[target] = measure(statement, args.repeat)
+        notes = []
+        unexpected = [name for name in result["heavy_modules"] if name not in allowed]
+        if unexpected:
+            notes.append("carrega " + ", ".join(unexpected))
+            failed = True
+        if result["created_files"]:
+            notes.append("cria " + ", ".join(result["created_files"]))
+            failed = True
+        if target in baseline:
+            previous = baseline[target]["median_ms"]
+            change = result["median_ms"] / previous - 1 if previous else 0.0
+            notes.append(f"{change:+.0%} em relação ao baseline")
+            failed = failed or change > args.tolerance
+        print(f"{target:<28} {result['median_ms']:>13.1f} {result['min_ms']:>12.1f}  {'; '.join(notes)}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if failed:
+        print("Regressão no tempo ou nos efeitos colaterais da importação.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+'''
+Gerador de carga para o TwotterServer.
+
+Inicia um servidor em loopback (ou usa um servidor já em execução) e simula
+milhares de clientes falando o protocolo real: HELLO, MESSAGE (unicast e
+broadcast), GET_ONLINE_CLIENTS e BYE. Ao final, informa mensagens por
+segundo, percentis de latência e taxa de perda, e pode salvar o resultado em
+JSON para comparação entre versões.
+
+Exemplo:
+    python benchmarks/loadgen.py --clients 2000 --rate 5000 --duration 10 --output resultado.json
+    python benchmarks/loadgen.py --baseline resultado.json
+'''
+import argparse
+import collections
+import json
+import logging
+import multiprocessing
+import platform
+import random
+import selectors
+import socket
+import sys
+import threading
+import time
+
+from twotter import TwotterServer, AsyncTwotterServer, __version__
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.utils import encode_message, decode_message_lazy, logger, message_log, configure_logging
+from twotter.utils.message_v2 import V2_FEATURE, V2_PREFIX, decode_records, encode_record, parse_features
+
+HELLO_BATCH = 100
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def _serve(server_class, conn):
+    # O servidor roda em outro processo para não disputar o GIL com o gerador.
+    logger.setLevel(logging.WARNING)
+    message_log.configure(enabled=False)
+    configure_logging(filename=None)
+    server = server_class(("127.0.0.1", 0))
+    conn.send(server.sock.getsockname())
+    conn.close()
+    server.run()
+
+
+def start_server(mode):
+    '''
+    Inicia um servidor em loopback em um processo separado.
+
+    Returns:
+        tuple: O processo do servidor e o endereço em que ele escuta.
+    '''
+    server_class = AsyncTwotterServer if mode == "asyncio" else TwotterServer
+    parent_conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serve, args=(server_class, child_conn), daemon=True)
+    process.start()
+    address = parent_conn.recv()
+    return process, address
+
+
+def percentiles(samples):
+    '''
+    Calcula os percentis (em milissegundos) de uma lista de latências em nanossegundos.
+    '''
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    result = {}
+    for p in PERCENTILES:
+        index = min(len(samples) - 1, int(len(samples) * p / 100))
+        result[f"p{p:g}"] = samples[index] / 1e6
+    result["max"] = samples[-1] / 1e6
+    return result
+
+
+class LoadGenerator:
+    '''
+    Simula num_clients clientes, cada um com seu próprio socket UDP, contra um servidor Twotter.
+
+    Args:
+        server_address (tuple): O endereço do servidor.
+        num_clients (int): Número de clientes simulados.
+        first_id (int): O ID do primeiro cliente simulado.
+        wire_version (int): Versão do protocolo pedida no HELLO (1 ou 2).
+    '''
+    def __init__(self, server_address, num_clients, first_id=1, wire_version=1):
+        self.server_address = server_address
+        self.wire_version = wire_version
+        self._v2_clients = set()
+        self.ids = list(range(first_id, first_id + num_clients))
+        self.socks = {}
+        self.selector = selectors.DefaultSelector()
+        for client_id in self.ids:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 18)
+            sock.bind(("127.0.0.1", 0))
+            sock.setblocking(False)
+            self.socks[client_id] = sock
+            self.selector.register(sock, selectors.EVENT_READ, client_id)
+
+        self.sent = collections.Counter()
+        self.expected = collections.Counter()
+        self.delivered = collections.Counter()
+        self.latencies = collections.defaultdict(list)
+        self.errors = 0
+        self._roster_pending = collections.defaultdict(collections.deque)
+        self._accepted = set()
+        self._running = False
+
+    def _send(self, client_id, message):
+        try:
+            if client_id in self._v2_clients:
+                data = V2_PREFIX + encode_record(message)
+            else:
+                data = encode_message(message)
+            self.socks[client_id].sendto(data, self.server_address)
+        except BlockingIOError:
+            self.sent["blocked"] += 1
+
+    def _receive(self, timeout):
+        for key, _ in self.selector.select(timeout):
+            sock, client_id = key.fileobj, key.data
+            while True:
+                try:
+                    data = sock.recv(2048)
+                except BlockingIOError:
+                    break
+                self._handle(client_id, data, time.perf_counter_ns())
+
+    def _handle(self, client_id, data, now):
+        if data[:1] == V2_PREFIX:
+            for message in decode_records(data):
+                self._handle_message(client_id, message, now)
+        else:
+            self._handle_message(client_id, decode_message_lazy(data), now)
+
+    def _handle_message(self, client_id, message, now):
+        message_type = message.message_type
+        if message_type == MessageType.HELLO.value:
+            if V2_FEATURE in parse_features(message.text):
+                self._v2_clients.add(client_id)
+            self._accepted.add(client_id)
+        elif message_type == MessageType.ERROR.value:
+            self.errors += 1
+        elif message_type == MessageType.GET_ONLINE_CLIENTS.value:
+            pending = self._roster_pending[client_id]
+            if pending:
+                self.delivered["roster"] += 1
+                self.latencies["roster"].append(now - pending.popleft())
+        elif message_type == MessageType.MESSAGE.value and message.origin_id != 0:
+            kind, _, sent_at = message.text.partition(":")
+            if kind in ("unicast", "broadcast"):
+                self.delivered[kind] += 1
+                self.latencies[kind].append(now - int(sent_at))
+
+    def _receive_loop(self):
+        while self._running:
+            self._receive(0.05)
+
+    def connect(self, timeout=10):
+        '''
+        Registra todos os clientes no servidor, em lotes, aguardando as respostas.
+
+        Raises:
+            TimeoutError: Se algum cliente não for aceito dentro de timeout segundos.
+        '''
+        deadline = time.monotonic() + timeout
+        for start in range(0, len(self.ids), HELLO_BATCH):
+            batch = self.ids[start:start + HELLO_BATCH]
+            for client_id in batch:
+                features = V2_FEATURE if self.wire_version == 2 else ""
+                self._send(client_id, TwotterMessage(MessageType.HELLO, client_id, 0, f"bot{client_id}", features))
+            while not self._accepted.issuperset(batch):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"{len(self.ids) - len(self._accepted)} clientes não foram aceitos")
+                self._receive(0.1)
+
+    def run(self, duration, rate, broadcast_ratio, roster_ratio, seed=0):
+        '''
+        Gera tráfego a uma taxa fixa de rate mensagens por segundo durante duration segundos.
+        '''
+        rng = random.Random(seed)
+        receiver = threading.Thread(target=self._receive_loop, daemon=True)
+        self._running = True
+        receiver.start()
+
+        interval_ns = int(1e9 / rate)
+        start = time.perf_counter_ns()
+        end = start + int(duration * 1e9)
+        next_send = start
+        while True:
+            now = time.perf_counter_ns()
+            if now >= end:
+                break
+            if now < next_send:
+                time.sleep(min(next_send - now, 1_000_000) / 1e9)
+                continue
+            next_send += interval_ns
+
+            origin = rng.choice(self.ids)
+            draw = rng.random()
+            if draw < broadcast_ratio:
+                self._send(origin, TwotterMessage(MessageType.MESSAGE, origin, 0, "bot", f"broadcast:{now}"))
+                self.sent["broadcast"] += 1
+                self.expected["broadcast"] += len(self.ids)
+            elif draw < broadcast_ratio + roster_ratio:
+                self._roster_pending[origin].append(now)
+                self._send(origin, TwotterMessage(MessageType.GET_ONLINE_CLIENTS, origin, 0, "bot", ""))
+                self.sent["roster"] += 1
+                self.expected["roster"] += 1
+            else:
+                destination = rng.choice(self.ids)
+                self._send(origin, TwotterMessage(MessageType.MESSAGE, origin, destination, "bot", f"unicast:{now}"))
+                self.sent["unicast"] += 1
+                self.expected["unicast"] += 1
+        elapsed = (time.perf_counter_ns() - start) / 1e9
+
+        # Aguarda as entregas ainda em trânsito.
+        time.sleep(1.0)
+        self._running = False
+        receiver.join()
+        return elapsed
+
+    def disconnect(self):
+        for client_id in self.ids:
+            self._send(client_id, TwotterMessage(MessageType.BYE, client_id, 0, f"bot{client_id}", ""))
+        for sock in self.socks.values():
+            self.selector.unregister(sock)
+            sock.close()
+
+    def report(self, elapsed):
+        '''
+        Monta o relatório de resultados da execução.
+        '''
+        kinds = {}
+        for kind in ("unicast", "broadcast", "roster"):
+            expected = self.expected[kind]
+            delivered = self.delivered[kind]
+            kinds[kind] = {
+                "sent": self.sent[kind],
+                "expected_deliveries": expected,
+                "deliveries": delivered,
+                "drop_rate": (1 - delivered / expected) if expected else 0.0,
+                "latency_ms": percentiles(self.latencies[kind]),
+            }
+        sent = sum(self.sent[kind] for kind in kinds)
+        return {
+            "elapsed_s": elapsed,
+            "sent_per_sec": sent / elapsed,
+            "deliveries_per_sec": sum(self.delivered.values()) / elapsed,
+            "blocked_sends": self.sent["blocked"],
+            "errors": self.errors,
+            "kinds": kinds,
+        }
+
+
+def compare(result, baseline, tolerance):
+    '''
+    Compara um resultado com uma execução de referência.
+
+    Returns:
+        list: Descrição das regressões encontradas.
+    '''
+    regressions = []
+    if result["deliveries_per_sec"] < baseline["deliveries_per_sec"] * (1 - tolerance):
+        regressions.append(f"entregas/s: {result['deliveries_per_sec']:.0f} < {baseline['deliveries_per_sec']:.0f}")
+    for kind, stats in result["kinds"].items():
+        base = baseline["kinds"].get(kind)
+        if not base:
+            continue
+        if stats["drop_rate"] > base["drop_rate"] + tolerance:
+            regressions.append(f"{kind} perda: {stats['drop_rate']:.3f} > {base['drop_rate']:.3f}")
+        p99, base_p99 = stats["latency_ms"].get("p99"), base["latency_ms"].get("p99")
+        if p99 is not None and base_p99 is not None and p99 > base_p99 * (1 + tolerance):
+            regressions.append(f"{kind} p99: {p99:.2f} ms > {base_p99:.2f} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gerador de carga para o TwotterServer.")
+    parser.add_argument("--clients", type=int, default=1000, help="Número de clientes simulados.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Duração da geração de carga, em segundos.")
+    parser.add_argument("--rate", type=float, default=2000.0, help="Mensagens enviadas por segundo.")
+    parser.add_argument("--broadcast-ratio", type=float, default=0.01, help="Fração das mensagens enviadas para todos.")
+    parser.add_argument("--roster-ratio", type=float, default=0.05, help="Fração de pedidos GET_ONLINE_CLIENTS.")
+    parser.add_argument("--server-mode", choices=["thread", "asyncio"], default="thread",
+                        help="Motor do servidor iniciado em loopback.")
+    parser.add_argument("--server", metavar="HOST:PORTA", help="Usa um servidor já em execução em vez de iniciar um.")
+    parser.add_argument("--wire", type=int, choices=[1, 2], default=1,
+                        help="Versão do protocolo usada pelos clientes simulados.")
+    parser.add_argument("--seed", type=int, default=0, help="Semente do gerador de tráfego.")
+    parser.add_argument("--output", help="Arquivo JSON em que o resultado é salvo.")
+    parser.add_argument("--baseline", help="Resultado JSON de referência; sai com código 1 em caso de regressão.")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Tolerância relativa na comparação (padrão: 0.1).")
+    args = parser.parse_args(argv)
+
+    server_process = None
+    if args.server:
+        host, port = args.server.rsplit(":", 1)
+        server_address = (host, int(port))
+    else:
+        server_process, server_address = start_server(args.server_mode)
+
+    generator = LoadGenerator(server_address, args.clients, wire_version=args.wire)
+    try:
+        generator.connect()
+        elapsed = generator.run(args.duration, args.rate, args.broadcast_ratio, args.roster_ratio, args.seed)
+        generator.disconnect()
+    finally:
+        if server_process is not None:
+            server_process.terminate()
+            server_process.join()
+
+    result = {
+        "version": __version__,
+        "python": platform.python_version(),
+        "timestamp": time.time(),
+        "config": vars(args),
+        "results": generator.report(elapsed),
+    }
+    print(json.dumps(result["results"], indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(result["results"], baseline["results"], args.tolerance)
+        for regression in regressions:
+            print("Regressão:", regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
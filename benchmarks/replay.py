@@ -0,0 +1,145 @@
+'''
+Reproduz um trace gravado com `start_server.py --trace` no TwotterServer,
+no mesmo processo e contra um socket falso, para reproduzir e medir os
+pontos quentes de produção sem rede. Ao final, informa datagramas por
+segundo e o tempo gasto em cada handler; opcionalmente, executa a
+reprodução sob o cProfile ou um profiler por amostragem.
+
+Exemplo:
+    python start_server.py --trace trace.bin
+    python benchmarks/replay.py trace.bin --profile cprofile --top 30
+    python benchmarks/replay.py trace.bin --realtime --speed 2 --profile sample
+'''
+import argparse
+import cProfile
+import json
+import logging
+import pstats
+
+from twotter import TwotterServer
+from twotter.entitites import MessageType
+from twotter.utils import logger, message_log, configure_logging, MESSAGE_SIZE
+from twotter.utils.trace import read_trace, replay_trace, StubSocket, HandlerProfile, SamplingProfiler
+
+
+def print_handler_report(profile):
+    print(f"{'método':<42} {'chamadas':>10} {'total (ms)':>12} {'médio (µs)':>12} {'%':>7}")
+    for name, calls, total, mean, share in profile.report():
+        print(f"{name:<42} {calls:>10} {total:>12.2f} {mean:>12.2f} {share:>7.1f}")
+
+
+def print_summary(records):
+    '''
+    Resume os datagramas v1 do trace: mensagens por tipo e os remetentes mais ativos.
+    '''
+    try:
+        import numpy as np
+        from twotter.utils.message_batch import decode_frames
+    except ImportError:
+        print("O resumo do trace requer o NumPy (pip install numpy).")
+        return
+    batch = decode_frames([record.data for record in records if len(record.data) == MESSAGE_SIZE], errors="replace")
+    print(f"{len(batch)} mensagens v1 de {len(records)} datagramas")
+    types, counts = np.unique(batch.message_type, return_counts=True)
+    for message_type, count in zip(types.tolist(), counts.tolist()):
+        try:
+            name = MessageType(message_type).name
+        except ValueError:
+            name = str(message_type)
+        print(f"{name:<24} {count:>10}")
+    origins, counts = np.unique(batch.origin_id, return_counts=True)
+    top = np.argsort(counts)[::-1][:10]
+    print("remetentes mais ativos: " + ", ".join(f"{origins[i]} ({counts[i]})" for i in top))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reproduz um trace de datagramas no TwotterServer.")
+    parser.add_argument("trace", help="Arquivo de trace gravado com start_server.py --trace.")
+    parser.add_argument("--realtime", action="store_true",
+                        help="Mantém o espaçamento original entre os datagramas (padrão: o mais rápido possível).")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Fator de aceleração do espaçamento original, com --realtime (padrão: 1).")
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="Mantém os limites de taxa do servidor na reprodução acelerada (por padrão só valem com --realtime).")
+    parser.add_argument("--repeat", type=int, default=1, help="Número de reproduções, cada uma em um servidor novo.")
+    parser.add_argument("--profile", choices=["cprofile", "sample"], help="Executa a reprodução sob um profiler.")
+    parser.add_argument("--profile-output", metavar="ARQUIVO",
+                        help="Salva as estatísticas do cProfile neste arquivo (para snakeviz, pstats etc.).")
+    parser.add_argument("--sample-interval", type=float, default=0.001,
+                        help="Intervalo entre amostras do profiler por amostragem, em segundos (padrão: 0.001).")
+    parser.add_argument("--top", type=int, default=20, help="Número de funções exibidas pelo profiler.")
+    parser.add_argument("--no-handler-times", action="store_true",
+                        help="Não mede o tempo de cada handler (remove a sobrecarga da medição).")
+    parser.add_argument("--log", action="store_true", help="Mantém o log do servidor durante a reprodução.")
+    parser.add_argument("--summary", action="store_true",
+                        help="Apenas resume as mensagens v1 do trace, sem reproduzi-lo (requer NumPy).")
+    parser.add_argument("--output", help="Arquivo JSON em que o resultado é salvo.")
+    args = parser.parse_args(argv)
+
+    if not args.log:
+        logger.setLevel(logging.WARNING)
+        message_log.configure(enabled=False)
+        configure_logging(filename=None)
+
+    records = read_trace(args.trace)
+    print(f"{len(records)} datagramas, {records[-1].timestamp if records else 0:.1f} s de tráfego original")
+    if args.summary:
+        print_summary(records)
+        return
+
+    profiler = None
+    if args.profile == "cprofile":
+        profiler = cProfile.Profile()
+    elif args.profile == "sample":
+        profiler = SamplingProfiler(interval=args.sample_interval)
+
+    results = []
+    for run in range(args.repeat):
+        stub = StubSocket()
+        server = TwotterServer(sock=stub)
+        server.periodic_tasks = False
+        if not args.realtime and not args.keep_rate_limits:
+            # Comprimido no tempo, o tráfego original estouraria os limites de taxa.
+            server.admission.client_rate = 0
+            server.admission.global_rate = 0
+        handlers = None if args.no_handler_times else HandlerProfile(server)
+        if args.profile == "cprofile":
+            profiler.enable()
+        elif profiler is not None:
+            profiler.start()
+        try:
+            result = replay_trace(server, records, args.realtime, args.speed)
+        finally:
+            if args.profile == "cprofile":
+                profiler.disable()
+            elif profiler is not None:
+                profiler.stop()
+        server.fanout.stop()
+        result["sent_datagrams"] = stub.sent
+        result["clients"] = len(server.clients)
+        results.append(result)
+        print(f"reprodução {run + 1}: {result['datagrams_per_second']:.0f} datagramas/s em "
+              f"{result['elapsed_seconds']:.3f} s, {stub.sent} datagramas enviados, {result['clients']} clientes no final")
+        if handlers is not None:
+            result["handlers"] = {name: {"calls": calls, "total_ms": total}
+                                  for name, calls, total, _, _ in handlers.report()}
+            if run == args.repeat - 1:
+                print_handler_report(handlers)
+
+    if args.profile == "cprofile":
+        if args.profile_output:
+            profiler.dump_stats(args.profile_output)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(args.top)
+    elif profiler is not None:
+        print(f"\n{profiler.samples} amostras")
+        print(f"{'própria %':>10} {'total %':>8}  função")
+        for location, own, cumulative in profiler.report(args.top):
+            print(f"{own:>10.1f} {cumulative:>8.1f}  {location}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,43 @@
-import sys
-
-if sys.version_info[:2] >= (3, 8):
-    # TODO: Import directly (no need for conditional) when `python_requires = >= 3.8`
-    from importlib.metadata import PackageNotFoundError, version  # pragma: no cover
-else:
-    from importlib_metadata import PackageNotFoundError, version  # pragma: no cover
-
-try:
-    # Change here if project is renamed and does not equal the package name
-    dist_name = __name__
-    __version__ = version(dist_name)
-except PackageNotFoundError:  # pragma: no cover
-    __version__ = "unknown"
-finally:
-    del version, PackageNotFoundError
-
-
-from .entitites.server import TwotterServer
-from .entitites.client import TwotterClient
-from .entitites.message import TwotterMessage
+'''
+As classes públicas são carregadas sob demanda (PEP 562): `import twotter`
+não importa o servidor, o asyncio nem o importlib.metadata, e
+`from twotter import TwotterClient` carrega apenas o cliente.
+'''
+import importlib
+
+# Nome público -> módulo que o define.
+_LAZY_ATTRIBUTES = {
+    "TwotterServer": "twotter.entitites.server",
+    "TwotterClient": "twotter.entitites.client",
+    "TwotterMessage": "twotter.entitites.message",
+    "AsyncTwotterServer": "twotter.entitites.async_server",
+    "AsyncTwotterClient": "twotter.entitites.async_client",
+}
+
+__all__ = ["__version__", *_LAZY_ATTRIBUTES]
+
+
+def _read_version():
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        # Change here if project is renamed and does not equal the package name
+        return version(__name__)
+    except PackageNotFoundError:  # pragma: no cover
+        return "unknown"
+
+
+def __getattr__(name):
+    if name == "__version__":
+        value = _read_version()
+    elif name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # Guardado no módulo, o atributo não passa mais por __getattr__.
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
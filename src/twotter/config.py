@@ -2,5 +2,11 @@
 SERVER_ADDRESS = ('0.0.0.0', 12345)
 SERVER_PORT = 12345
 
+# Número máximo de mensagens guardadas pelo cliente e quantas são exibidas por página na UI.
+MESSAGE_HISTORY_SIZE = 500
+MESSAGE_PAGE_SIZE = 50
+# Intervalo de atualização das mensagens e da lista de clientes online na UI, em segundos.
+UI_REFRESH_INTERVAL_IN_SECONDS = 0.4
+
 EMOJI_LIST = ["😀", "😍","🤢", "🥵", "🥶", "🤯", "🤠", "🥳", "😎", "🤓", "🤔", "😱", "💩", "🤡", "👻", "👽", 
       "🧡", "💛", "💚", "💙", "💜", "🤎", "🖤", "🤍", "FRANBERTO"]
@@ -0,0 +1,213 @@
+import array
+
+from twotter.entitites import MessageType
+
+# Limite de cada cliente: taxa de reposição (tokens por segundo) e capacidade do balde. O limite
+# é opcional (start_server.py --client-rate): por padrão a taxa é 0 e só o limite global se aplica.
+CLIENT_RATE_PER_SECOND = 0.0
+CLIENT_BURST = 40.0
+# Custo, em tokens do cliente, de uma mensagem para todos ou para um canal.
+BROADCAST_COST = 5.0
+# Limite global em pacotes enviados por segundo: um broadcast ou uma mensagem de canal custa um pacote por destinatário.
+GLOBAL_PACKETS_PER_SECOND = 200000.0
+GLOBAL_BURST = 400000.0
+# Limite de HELLO por endereço de origem. Um gateway registra muitas sessões de uma vez, então a rajada é grande.
+HELLO_RATE_PER_SECOND = 256.0
+HELLO_BURST = 1024.0
+# Os baldes de HELLO ficam em uma tabela de tamanho fixo, indexada pelo hash do endereço:
+# origens forjadas não crescem a memória, e endereços que colidem compartilham o balde.
+HELLO_BUCKETS = 4096
+
+# Texto do ERROR com que o servidor avisa o remetente de uma mensagem descartada, por motivo (veja stats).
+REJECTION_TEXTS = {
+    "client_rate": "Mensagem descartada: limite de envio excedido.",
+    "global_rate": "Mensagem descartada: servidor sobrecarregado.",
+    "overload": "Mensagem descartada: servidor sobrecarregado.",
+    "hello_rate": "HELLO descartado: limite de conexões excedido.",
+}
+
+# Datagramas processados seguidos, sem esvaziar a fila do socket, a partir
+# dos quais o servidor é considerado sobrecarregado.
+SHED_LOW_PRIORITY_BACKLOG = 512
+SHED_CHAT_BACKLOG = 2048
+
+# Prioridades: quanto menor, mais tempo a mensagem continua sendo aceita sob sobrecarga.
+PRIORITY_CONTROL = 0
+PRIORITY_CHAT = 1
+PRIORITY_LOW = 2
+_PRIORITIES = {
+    MessageType.HELLO.value: PRIORITY_CONTROL,
+    MessageType.BYE.value: PRIORITY_CONTROL,
+    MessageType.ERROR.value: PRIORITY_CONTROL,
+    MessageType.KEEPALIVE.value: PRIORITY_CONTROL,
+    MessageType.MESSAGE.value: PRIORITY_CHAT,
+    MessageType.CHANNEL_SUBSCRIBE.value: PRIORITY_CHAT,
+    MessageType.CHANNEL_UNSUBSCRIBE.value: PRIORITY_CHAT,
+}
+
+
+def is_broadcast(message):
+    '''
+    Se a mensagem é entregue a vários destinatários: uma mensagem para todos ou para um canal.
+    '''
+    message_type = message.message_type
+    return ((message_type == MessageType.MESSAGE.value and message.destination_id == 0)
+            or message_type == MessageType.CHANNEL_MESSAGE.value)
+
+
+def message_priority(message):
+    '''
+    Prioridade de uma mensagem. Broadcasts, mensagens de canal e consultas são os primeiros a ser descartados.
+    '''
+    if is_broadcast(message):
+        return PRIORITY_LOW
+    return _PRIORITIES.get(message.message_type, PRIORITY_LOW)
+
+
+class AdmissionController:
+    '''
+    Controle de admissão do servidor. Cada cliente conectado tem um balde de
+    tokens, guardado de forma compacta em dois arrays de doubles (tokens e
+    instante da última atualização) indexados por um slot atribuído ao
+    origin_id; um balde global limita os pacotes enviados pelo servidor.
+    Quando a fila de recepção cresce, as mensagens de menor prioridade são
+    descartadas antes de serem processadas, preservando HELLO e BYE. O HELLO
+    não passa pelos baldes dos clientes (a origem ainda não está conectada),
+    mas é limitado por endereço de origem, para que um único socket não
+    registre IDs sem limite.
+
+    Args:
+        client_rate (float): Tokens repostos por segundo em cada cliente. 0 (o padrão) desativa os limites por cliente.
+        client_burst (float): Capacidade do balde de cada cliente.
+        global_rate (float): Pacotes por segundo permitidos no total. 0 desativa o limite global.
+        global_burst (float): Capacidade do balde global.
+        hello_rate (float): HELLO por segundo permitidos a cada endereço de origem. 0 desativa o limite.
+        hello_burst (float): Capacidade do balde de HELLO de cada endereço.
+
+    Attributes:
+        stats (dict): Mensagens rejeitadas por motivo.
+        last_rejection (str): O motivo da última rejeição, uma das chaves de stats.
+    '''
+    def __init__(self, client_rate=CLIENT_RATE_PER_SECOND, client_burst=CLIENT_BURST,
+                 global_rate=GLOBAL_PACKETS_PER_SECOND, global_burst=GLOBAL_BURST,
+                 hello_rate=HELLO_RATE_PER_SECOND, hello_burst=HELLO_BURST):
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self._slots = {}
+        self._free = []
+        self._tokens = array.array('d')
+        self._updated = array.array('d')
+        self._global_tokens = global_burst
+        self._global_updated = None
+        self.hello_rate = hello_rate
+        self.hello_burst = hello_burst
+        self._hello_tokens = array.array('d', [hello_burst]) * HELLO_BUCKETS
+        self._hello_updated = array.array('d', [float('-inf')]) * HELLO_BUCKETS
+        self.stats = {"client_rate": 0, "global_rate": 0, "overload": 0, "hello_rate": 0}
+        self.last_rejection = None
+
+    def shed_level(self, backlog):
+        '''
+        Prioridade a partir da qual as mensagens são descartadas, para um backlog (datagramas
+        processados seguidos sem esvaziar a fila). None se nada deve ser descartado.
+        '''
+        if backlog >= SHED_CHAT_BACKLOG:
+            return PRIORITY_CHAT
+        if backlog >= SHED_LOW_PRIORITY_BACKLOG:
+            return PRIORITY_LOW
+        return None
+
+    def admit(self, message, now, connected, recipients=1, backlog=0, address=None):
+        '''
+        Decide se uma mensagem deve ser processada.
+
+        Args:
+            message (TwotterMessage | LazyTwotterMessage | LazyV2Message): A mensagem recebida.
+            now (float): O instante atual, em segundos (relógio monotônico).
+            connected (bool): Se a origem da mensagem é um cliente conectado.
+            recipients (int): Número de pacotes que um broadcast (ou uma mensagem de canal) geraria.
+            backlog (int): Datagramas processados seguidos sem esvaziar a fila do socket.
+            address (tuple): O endereço de origem, usado no limite de HELLO.
+
+        Returns:
+            bool: False se a mensagem deve ser descartada.
+        '''
+        priority = message_priority(message)
+        if priority == PRIORITY_CONTROL:
+            if message.message_type == MessageType.HELLO.value and address is not None and self.hello_rate:
+                if not self._take_hello(address, now):
+                    return self._reject("hello_rate")
+            return True
+
+        level = self.shed_level(backlog)
+        if level is not None and priority >= level:
+            return self._reject("overload")
+
+        # Mensagens de origens desconhecidas são rejeitadas pelos handlers; não ocupam um balde.
+        if connected and self.client_rate:
+            cost = BROADCAST_COST if is_broadcast(message) else 1.0
+            if not self._take(message.origin_id, cost, now):
+                return self._reject("client_rate")
+
+        if self.global_rate:
+            packets = recipients if is_broadcast(message) else 1
+            if self._global_updated is not None:
+                self._global_tokens = min(self.global_burst,
+                                          self._global_tokens + (now - self._global_updated) * self.global_rate)
+            self._global_updated = now
+            if self._global_tokens < packets:
+                return self._reject("global_rate")
+            self._global_tokens -= packets
+        return True
+
+    def _reject(self, reason):
+        self.stats[reason] += 1
+        self.last_rejection = reason
+        return False
+
+    def _take(self, client_id, cost, now):
+        slot = self._slots.get(client_id)
+        if slot is None:
+            slot = self._allocate(client_id, now)
+        tokens = min(self.client_burst, self._tokens[slot] + (now - self._updated[slot]) * self.client_rate)
+        self._updated[slot] = now
+        if tokens < cost:
+            self._tokens[slot] = tokens
+            return False
+        self._tokens[slot] = tokens - cost
+        return True
+
+    def _take_hello(self, address, now):
+        bucket = hash(address) % HELLO_BUCKETS
+        tokens = min(self.hello_burst, self._hello_tokens[bucket] + (now - self._hello_updated[bucket]) * self.hello_rate)
+        self._hello_updated[bucket] = now
+        if tokens < 1.0:
+            self._hello_tokens[bucket] = tokens
+            return False
+        self._hello_tokens[bucket] = tokens - 1.0
+        return True
+
+    def _allocate(self, client_id, now):
+        if self._free:
+            slot = self._free.pop()
+            self._tokens[slot] = self.client_burst
+            self._updated[slot] = now
+        else:
+            slot = len(self._tokens)
+            self._tokens.append(self.client_burst)
+            self._updated.append(now)
+        self._slots[client_id] = slot
+        return slot
+
+    def forget(self, client_id):
+        '''
+        Libera o balde de um cliente que saiu.
+        '''
+        slot = self._slots.pop(client_id, None)
+        if slot is not None:
+            self._free.append(slot)
+
+    def __len__(self):
+        return len(self._slots)
@@ -0,0 +1,412 @@
+import asyncio
+import time
+
+from twotter.utils import encode_message
+from twotter.utils.message_v2 import V2_FEATURE, V2_PREFIX, decode_datagram, encode_record, parse_features
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.entitites.history import MessageHistory
+from twotter.entitites.presence import Roster, parse_delta, parse_snapshot, PRESENCE_UNAVAILABLE_TEXT
+from twotter.entitites.channels import ChannelDirectory, channel_id, parse_channel_list
+from twotter.entitites.client import HELLO_RETRY_INTERVAL_IN_SECONDS
+from twotter.entitites.reliability import (ReliablePeer, REL_FEATURE, REL_DATA, REL_ACK, RETRANSMIT_TICK_IN_SECONDS,
+                                           CHANNEL_RESET_TEXT)
+from twotter.config import MESSAGE_HISTORY_SIZE
+
+CONNECT_TIMEOUT_IN_SECONDS = 5
+REQUEST_TIMEOUT_IN_SECONDS = 5
+# Mensagens recebidas e ainda não consumidas pelo iterador; as mais antigas são descartadas.
+MAX_PENDING_MESSAGES = 1000
+_CLOSED = object()
+
+
+class TwotterClientProtocol(asyncio.DatagramProtocol):
+    '''
+    Protocolo asyncio que repassa os datagramas recebidos para um AsyncTwotterClient.
+
+    Args:
+        client (AsyncTwotterClient): O cliente que processa os datagramas.
+    '''
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, addr):
+        self.client.datagram_received(data)
+
+    def error_received(self, exc):
+        self.client.error_received(exc)
+
+
+class AsyncTwotterClient:
+    '''
+    Cliente Twotter baseado em asyncio. Cada sessão usa apenas um transporte
+    UDP no loop de eventos, sem threads, então centenas de sessões podem
+    rodar no mesmo processo (bots e testes de integração).
+
+    As mensagens recebidas (MESSAGE e CHANNEL_MESSAGE) são lidas com async for:
+
+        async with AsyncTwotterClient(("127.0.0.1", 12345), 1, "bot") as client:
+            client.send_message("olá", 0)
+            async for message in client:
+                ...
+
+    Args:
+        server_address (tuple): O endereço do servidor.
+        client_id (int): O ID do cliente.
+        username (str): O nome de usuário do cliente.
+        history_size (int): Número máximo de mensagens recebidas guardadas.
+        wire_version (int): Versão do protocolo pedida ao servidor (1 ou 2).
+        reliable (bool): Pede ao servidor entrega confiável e ordenada (requer o protocolo v2).
+        max_pending (int): Número máximo de mensagens recebidas aguardando o iterador.
+
+    Attributes:
+        received_messages (MessageHistory): O histórico limitado de mensagens recebidas.
+        roster (Roster): A lista de clientes online mantida pelos deltas de presença do servidor.
+        channels (ChannelDirectory): Os canais inscritos e a última lista de canais recebida.
+        accepted (bool): Status de aceitação do cliente pelo servidor.
+        wire_version (int): Versão do protocolo em uso.
+        channel (ReliablePeer): O canal confiável com o servidor, se a entrega confiável foi aceita.
+        reconnecting (bool): Se o HELLO foi refeito para recomeçar o canal confiável e a resposta ainda não chegou.
+        presence_supported (bool): Se o servidor mantém a lista de presença; passa a False quando ele recusa a inscrição.
+        last_error (str): O texto do último ERROR recebido do servidor depois da aceitação
+            (por exemplo, uma mensagem descartada pelo limite de envio).
+        dropped (int): Mensagens descartadas porque o iterador não as consumiu a tempo.
+    '''
+    def __init__(self, server_address, client_id, username, history_size=MESSAGE_HISTORY_SIZE, wire_version=2,
+                 reliable=True, max_pending=MAX_PENDING_MESSAGES):
+        self.server_address = server_address
+        self.client_id = client_id
+        self.username = username[:20]
+        self.received_messages = MessageHistory(history_size)
+        self.roster = Roster()
+        self.channels = ChannelDirectory()
+        self.requested_wire_version = wire_version
+        self.wire_version = 1
+        self.reliable = reliable and wire_version == 2
+        self.channel = None
+        self.reconnecting = False
+        self.last_error = None
+        self.presence_supported = True
+        self.accepted = False
+        self.dropped = 0
+        self.transport = None
+        self._queue = asyncio.Queue(max_pending)
+        self._hello = None
+        self._online_request = None
+        self._channel_list_request = None
+        self._roster_synced = None
+        self._poll_handle = None
+        self._hello_handle = None
+        self._unsent = []
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    async def connect(self, timeout=CONNECT_TIMEOUT_IN_SECONDS):
+        '''
+        Conecta ao servidor, reenviando o HELLO a cada HELLO_RETRY_INTERVAL_IN_SECONDS até a resposta.
+
+        Raises:
+            TimeoutError: Se o servidor não responder dentro de timeout segundos.
+            ConnectionError: Se o ID do cliente já estiver em uso.
+        '''
+        loop = asyncio.get_running_loop()
+        if self.transport is None:
+            self.transport, _ = await loop.create_datagram_endpoint(
+                lambda: TwotterClientProtocol(self), remote_addr=self.server_address)
+        self._hello = loop.create_future()
+        deadline = loop.time() + timeout
+        try:
+            while True:
+                self.send_hello()
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise TimeoutError("Tempo de espera excedido")
+                try:
+                    await asyncio.wait_for(asyncio.shield(self._hello),
+                                           min(HELLO_RETRY_INTERVAL_IN_SECONDS, remaining))
+                    return
+                except asyncio.TimeoutError:
+                    continue
+        except BaseException:
+            self.transport.close()
+            self.transport = None
+            raise
+        finally:
+            self._hello = None
+
+    def close(self):
+        '''
+        Envia BYE, fecha o transporte e encerra os iteradores de mensagens.
+        '''
+        if self.transport is None:
+            return
+        if self.accepted:
+            self.send(TwotterMessage(MessageType.BYE, self.client_id, 0, self.username, ''))
+        if self._poll_handle is not None:
+            self._poll_handle.cancel()
+        if self._hello_handle is not None:
+            self._hello_handle.cancel()
+            self._hello_handle = None
+        self.transport.close()
+        self.transport = None
+        self.accepted = False
+        self._enqueue(_CLOSED)
+
+    # Envio
+
+    def send(self, message):
+        '''
+        Envia uma mensagem ao servidor na versão de protocolo negociada.
+        '''
+        if self.wire_version == 2:
+            self._send_payload(V2_PREFIX + encode_record(message))
+        else:
+            self.transport.sendto(encode_message(message))
+
+    def _send_payload(self, data):
+        if self.reconnecting:
+            self._unsent.append(data)
+            return
+        if self.channel is not None:
+            data = self.channel.send(data, time.monotonic())
+            self._schedule_poll()
+            if data is None:  # Janela cheia: enviado por poll_channel.
+                return
+        self.transport.sendto(data)
+
+    def reconnect(self):
+        '''
+        Recomeça o canal confiável com o servidor, depois que ele falhou (o
+        servidor não confirmou os dados) ou foi encerrado pelo servidor. O HELLO
+        é reenviado até a resposta, e as mensagens ainda não confirmadas, e as
+        enviadas enquanto isso, seguem pelo novo canal.
+        '''
+        if self.channel is not None:
+            self._unsent[:0] = self.channel.pending()
+            self.channel = None
+        self.reconnecting = True
+        self._retry_hello()
+
+    def _retry_hello(self):
+        self._hello_handle = None
+        if not self.reconnecting or self.transport is None:
+            return
+        self.send_hello()
+        self._hello_handle = asyncio.get_running_loop().call_later(HELLO_RETRY_INTERVAL_IN_SECONDS, self._retry_hello)
+
+    def send_hello(self):
+        features = []
+        if self.requested_wire_version == 2:
+            features.append(V2_FEATURE)
+            if self.reliable:
+                features.append(REL_FEATURE)
+        self.transport.sendto(encode_message(
+            TwotterMessage(MessageType.HELLO, self.client_id, 0, self.username, ','.join(features))))
+
+    def send_message(self, text, destination_id):
+        '''
+        Envia uma mensagem de texto a outro cliente (ou a todos, com destination_id 0).
+        '''
+        self.send(TwotterMessage(MessageType.MESSAGE, self.client_id, destination_id, self.username, text))
+
+    def send_channel_message(self, text, name):
+        '''
+        Envia uma mensagem de texto aos membros de um canal em que o cliente está inscrito.
+        '''
+        self.send(TwotterMessage(MessageType.CHANNEL_MESSAGE, self.client_id, channel_id(name), self.username, text))
+
+    def subscribe_channel(self, name):
+        self.send(TwotterMessage(MessageType.CHANNEL_SUBSCRIBE, self.client_id, 0, self.username, name))
+
+    def unsubscribe_channel(self, name):
+        self.send(TwotterMessage(MessageType.CHANNEL_UNSUBSCRIBE, self.client_id, 0, self.username, name))
+
+    def poll_channel(self):
+        '''
+        Envia as retransmissões vencidas, as mensagens que esperavam espaço na
+        janela e os ACKs pendentes. Se o canal falhou, refaz o HELLO (veja reconnect).
+        '''
+        self._poll_handle = None
+        if self.channel is None or self.transport is None:
+            return
+        for data in self.channel.poll(time.monotonic()):
+            self.transport.sendto(data)
+        if self.channel.failed:
+            self.reconnect()
+            return
+        self._schedule_poll()
+
+    def _schedule_poll(self):
+        # Um temporizador por sessão, apenas enquanto há dados confiáveis em trânsito.
+        if self._poll_handle is None and self.channel is not None and self.channel.busy:
+            self._poll_handle = asyncio.get_running_loop().call_later(RETRANSMIT_TICK_IN_SECONDS, self.poll_channel)
+
+    # Consultas
+
+    async def online_clients(self, timeout=REQUEST_TIMEOUT_IN_SECONDS):
+        '''
+        Consulta a lista de clientes online com GET_ONLINE_CLIENTS. A resposta
+        ocupa uma única mensagem, então é truncada com muitos clientes; a lista
+        completa é obtida por roster_members.
+
+        Returns:
+            list: Os IDs dos clientes online.
+
+        Raises:
+            TimeoutError: Se a resposta não chegar dentro de timeout segundos.
+        '''
+        if self._online_request is None or self._online_request.done():
+            self._online_request = asyncio.get_running_loop().create_future()
+            self.send(TwotterMessage(MessageType.GET_ONLINE_CLIENTS, self.client_id, 0, self.username, ''))
+        text = await self._wait(self._online_request, timeout)
+        return [int(client_id) for client_id in text.split(", ") if client_id]
+
+    async def channel_list(self, timeout=REQUEST_TIMEOUT_IN_SECONDS):
+        '''
+        Consulta a lista de canais com CHANNEL_LIST.
+
+        Returns:
+            list: Pares (nome, número de membros).
+        '''
+        if self._channel_list_request is None or self._channel_list_request.done():
+            self._channel_list_request = asyncio.get_running_loop().create_future()
+            self.send(TwotterMessage(MessageType.CHANNEL_LIST, self.client_id, 0, self.username, ''))
+        await self._wait(self._channel_list_request, timeout)
+        return list(self.channels.available)
+
+    async def roster_members(self, timeout=REQUEST_TIMEOUT_IN_SECONDS):
+        '''
+        Retorna a lista de clientes online mantida pelos deltas de presença,
+        inscrevendo-se na presença na primeira chamada (ou após uma perda de deltas).
+        Se o servidor recusou a inscrição, usa online_clients.
+
+        Returns:
+            list: Os IDs dos clientes online.
+        '''
+        if self.presence_supported and not self.roster.synced:
+            if self._roster_synced is None or self._roster_synced.done():
+                self._roster_synced = asyncio.get_running_loop().create_future()
+                self.send_presence_subscribe()
+            await self._wait(self._roster_synced, timeout)
+        if not self.presence_supported:
+            return await self.online_clients(timeout)
+        return self.roster.members()
+
+    def send_presence_subscribe(self):
+        self.roster.reset()
+        self.send(TwotterMessage(MessageType.PRESENCE_SUBSCRIBE, self.client_id, 0, self.username, ''))
+
+    async def _wait(self, future, timeout):
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise TimeoutError("Tempo de espera excedido") from None
+
+    # Recepção
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self._queue.get()
+        if message is _CLOSED:
+            self._queue.put_nowait(_CLOSED)  # Encerra também os demais iteradores.
+            raise StopAsyncIteration
+        return message
+
+    def _enqueue(self, item):
+        queue = self._queue
+        if queue.full():
+            queue.get_nowait()
+            self.dropped += 1
+        queue.put_nowait(item)
+
+    def datagram_received(self, data):
+        if data[0] == REL_DATA or data[0] == REL_ACK:
+            if self.channel is None:
+                return
+            datagrams = self.channel.receive(data, time.monotonic())
+            self._schedule_poll()
+        else:
+            datagrams = (data,)
+        for datagram in datagrams:
+            try:
+                messages = decode_datagram(datagram)
+            except Exception as e:
+                print("Erro ao receber mensagem", e)
+                continue
+            for message in messages:
+                self.handle_message(message)
+
+    def error_received(self, exc):
+        print("Erro no socket do cliente", exc)
+
+    def handle_message(self, message):
+        '''
+        Processa uma mensagem recebida do servidor conforme o tipo de mensagem.
+        '''
+        message_type = message.message_type
+        if message_type == MessageType.HELLO.value:
+            self.accept(message)
+        elif not self.accepted:
+            if message_type == MessageType.ERROR.value and self._hello is not None and not self._hello.done():
+                self._hello.set_exception(ConnectionError("Já existe um cliente com esse ID, por favor, conecte-se com outro ID"))
+        elif message_type == MessageType.ERROR.value:
+            if message.text == CHANNEL_RESET_TEXT:
+                self.reconnect()
+            elif message.text == PRESENCE_UNAVAILABLE_TEXT:
+                self.presence_supported = False
+                self._resolve(self._roster_synced, None)
+            else:
+                self.last_error = message.text
+        elif message_type == MessageType.MESSAGE.value or message_type == MessageType.CHANNEL_MESSAGE.value:
+            self.received_messages.append(message)
+            self._enqueue(message)
+        elif message_type == MessageType.GET_ONLINE_CLIENTS.value:
+            self._resolve(self._online_request, message.text)
+        elif message_type == MessageType.PRESENCE_DELTA.value:
+            if not self.roster.apply_delta(*parse_delta(message.text)):
+                self.send_presence_subscribe()
+        elif message_type == MessageType.PRESENCE_SNAPSHOT.value:
+            self.roster.apply_snapshot(*parse_snapshot(message.text))
+            if self.roster.synced:
+                self._resolve(self._roster_synced, None)
+        elif message_type == MessageType.CHANNEL_SUBSCRIBE.value:
+            self.channels.subscribed(message.text)
+        elif message_type == MessageType.CHANNEL_UNSUBSCRIBE.value:
+            self.channels.unsubscribed(message.text)
+        elif message_type == MessageType.CHANNEL_LIST.value:
+            part, total, channels = parse_channel_list(message.text)
+            self.channels.apply_list(part, total, channels)
+            if part == total:
+                self._resolve(self._channel_list_request, None)
+
+    def accept(self, message):
+        '''
+        Marca o cliente como aceito e adota as capacidades confirmadas na resposta ao HELLO.
+        '''
+        features = parse_features(message.text)
+        if V2_FEATURE in features:
+            self.wire_version = 2
+            if REL_FEATURE in features and self.channel is None:
+                self.channel = ReliablePeer()
+        self.accepted = True
+        self._resolve(self._hello, None)
+        if self.reconnecting:
+            self.reconnecting = False
+            if self._hello_handle is not None:
+                self._hello_handle.cancel()
+                self._hello_handle = None
+            unsent, self._unsent = self._unsent, []
+            for data in unsent:
+                self._send_payload(data)
+
+    @staticmethod
+    def _resolve(future, result):
+        if future is not None and not future.done():
+            future.set_result(result)
@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+from twotter.entitites.server import TwotterServer, MAX_DATAGRAMS_PER_BATCH
+from twotter.entitites.reliability import RETRANSMIT_TICK_IN_SECONDS
+from twotter.utils import logger
+from twotter.config import SERVER_ADDRESS
+
+
+class TwotterDatagramProtocol(asyncio.DatagramProtocol):
+    '''
+    Protocolo asyncio que repassa os datagramas recebidos para um AsyncTwotterServer.
+
+    Args:
+        server (AsyncTwotterServer): O servidor que processa os datagramas.
+    '''
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        # O transporte lê apenas um datagrama por evento de leitura, então o
+        # restante da fila do socket é drenado aqui mesmo.
+        self.server.process_datagram(data, addr)
+        self.server.drain_socket()
+        self.server.flush()
+
+    def error_received(self, exc):
+        logger.error("Erro no socket do servidor: %s", exc)
+
+
+class AsyncTwotterServer(TwotterServer):
+    '''
+    Servidor Twotter baseado em asyncio. Recebe datagramas por meio de um
+    asyncio.DatagramProtocol, drena todos os datagramas pendentes a cada
+    iteração do loop e executa as tarefas periódicas (status e remoção de
+    clientes inativos) no mesmo loop, sem threads auxiliares.
+
+    Args:
+        address (tuple): O endereço (host, porta) em que o servidor escuta.
+        reuse_port (bool): Habilita SO_REUSEPORT, permitindo que vários processos escutem na mesma porta.
+        max_batch (int): Número máximo de datagramas drenados por iteração do loop.
+        sock (socket): Um socket UDP já associado, recebido de outro processo em um handover.
+
+    Attributes:
+        transport (asyncio.DatagramTransport): O transporte asyncio associado ao socket.
+    '''
+    def __init__(self, address=SERVER_ADDRESS, reuse_port=False, max_batch=MAX_DATAGRAMS_PER_BATCH, sock=None):
+        super().__init__(address, reuse_port, max_batch, sock)
+        self.transport = None
+        self._stopped = None
+        self._loop = None
+
+    async def scheduler_task(self):
+        '''
+        Tarefa que executa as tarefas agendadas no scheduler (status, expiração
+        de clientes inativos etc.), acordando apenas quando alguma vence.
+        '''
+        while True:
+            try:
+                self.scheduler.run_due(time.monotonic())
+                self.flush()
+                if self.snapshots is not None:
+                    self.snapshots.maybe_write(time.monotonic())
+            except Exception as e:
+                logger.error("Erro na tarefa periódica: %s", e)
+            await asyncio.sleep(self.scheduler.next_deadline(time.monotonic()))
+
+    async def retransmit_task(self):
+        '''
+        Tarefa que verifica os temporizadores de retransmissão dos canais confiáveis.
+        '''
+        while True:
+            await asyncio.sleep(RETRANSMIT_TICK_IN_SECONDS)
+            if self.reliability.active:
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error("Erro ao retransmitir mensagens: %s", e)
+
+    async def federation_task(self):
+        '''
+        Tarefa que envia os heartbeats da federação e detecta os nós que pararam de responder.
+        '''
+        while True:
+            try:
+                self.federation.tick(time.monotonic())
+                self.flush()
+            except Exception as e:
+                logger.error("Erro na federação: %s", e)
+            await asyncio.sleep(self.federation.heartbeat_interval)
+
+    async def serve(self):
+        '''
+        Registra o socket no loop de eventos e processa mensagens até que stop seja chamado.
+        '''
+        self.start_logging()
+        loop = self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: TwotterDatagramProtocol(self), sock=self.sock)
+        if self._handover_request is not None:
+            self._handover_in_loop()
+        self.schedule_jobs()
+        tasks = [asyncio.create_task(self.scheduler_task()), asyncio.create_task(self.retransmit_task())]
+        if self.federation is not None:
+            tasks.append(asyncio.create_task(self.federation_task()))
+        try:
+            await self._stopped.wait()
+        finally:
+            if self.federation is not None:
+                self.federation.leave()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.transport.close()
+
+    def request_handover(self, conn):
+        '''
+        Agenda o handover no loop de eventos. Chamado pela thread do HandoverListener.
+        '''
+        super().request_handover(conn)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._handover_in_loop)
+
+    def _handover_in_loop(self):
+        if self._handover_request is None:
+            return
+        self.transport.pause_reading()
+        if self.complete_handover():
+            self.stop()
+        else:
+            self.transport.resume_reading()
+
+    def stop(self):
+        '''
+        Solicita o encerramento do loop de serve. Deve ser chamado a partir do loop de eventos.
+        '''
+        if self._stopped is not None:
+            self._stopped.set()
+
+    def run(self):
+        '''
+        Inicia o servidor em um novo loop de eventos asyncio.
+        '''
+        asyncio.run(self.serve())
@@ -0,0 +1,212 @@
+import hashlib
+import re
+import threading
+
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.entitites.presence import MAX_TEXT_LENGTH
+
+# Nomes de canal: letras, números, "_" e "-", para caber na lista de canais sem escape.
+CHANNEL_NAME = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+MAX_CHANNELS_PER_CLIENT = 64
+
+
+def channel_id(name):
+    '''
+    Identificador numérico de um canal, usado como destination_id das
+    CHANNEL_MESSAGE. É derivado do nome, então cliente e servidor (e os nós de
+    uma federação) chegam ao mesmo valor sem troca de mensagens. Nunca é 0, que indica broadcast.
+    '''
+    value = int.from_bytes(hashlib.blake2b(name.encode(), digest_size=4).digest(), 'big')
+    return value or 1
+
+
+def valid_channel_name(name):
+    return CHANNEL_NAME.match(name) is not None
+
+
+def format_channel_list(channels):
+    '''
+    Divide a lista de canais em textos de CHANNEL_LIST que cabem no campo de
+    texto de uma mensagem, no formato "<parte>/<total> nome=membros,nome=membros,...".
+
+    Args:
+        channels (iterable): Pares (nome, número de membros).
+    '''
+    entries = [f"{name}={count}" for name, count in sorted(channels)]
+    budget = MAX_TEXT_LENGTH - len("99999/99999 ")
+    chunks = []
+    current = []
+    size = 0
+    for entry in entries:
+        added = len(entry) + (1 if current else 0)
+        if current and size + added > budget:
+            chunks.append(current)
+            current, size = [], 0
+            added = len(entry)
+        current.append(entry)
+        size += added
+    chunks.append(current)
+    total = len(chunks)
+    return [f"{part}/{total} {','.join(chunk)}" for part, chunk in enumerate(chunks, 1)]
+
+
+def parse_channel_list(text):
+    '''
+    Interpreta o texto de uma CHANNEL_LIST.
+
+    Returns:
+        tuple: O número da parte, o total de partes e a lista de pares (nome, número de membros) da parte.
+    '''
+    parts, entries = (text.split(" ", 1) + [""])[:2]
+    part, total = parts.split("/")
+    channels = []
+    for entry in entries.split(","):
+        if entry:
+            name, count = entry.split("=")
+            channels.append((name, int(count)))
+    return int(part), int(total), channels
+
+
+class ChannelIndex:
+    '''
+    Índice de inscrições em canais do servidor. Para cada canal guarda os
+    endereços dos membros, então uma CHANNEL_MESSAGE é distribuída em tempo
+    proporcional ao número de membros, sem percorrer todos os clientes; o
+    índice reverso (canais de cada cliente) permite remover um cliente que
+    sai em tempo proporcional ao número de canais em que ele está.
+
+    Um canal é criado pela primeira inscrição e removido quando fica sem membros.
+
+    Args:
+        server_name (str): O nome de usuário usado nas mensagens do servidor.
+        max_channels_per_client (int): Número máximo de canais de cada cliente.
+
+    Attributes:
+        names (dict): O nome de cada canal, pelo seu identificador.
+    '''
+    def __init__(self, server_name, max_channels_per_client=MAX_CHANNELS_PER_CLIENT):
+        self.server_name = server_name
+        self.max_channels_per_client = max_channels_per_client
+        self.names = {}
+        self._members = {}
+        self._memberships = {}
+
+    def subscribe(self, client_id, address, name):
+        '''
+        Inscreve um cliente em um canal, criando-o se necessário.
+
+        Returns:
+            int: O identificador do canal.
+
+        Raises:
+            ValueError: Se o nome é inválido, colide com outro canal ou o cliente está em canais demais.
+        '''
+        if not valid_channel_name(name):
+            raise ValueError("Nome de canal inválido.")
+        channel = channel_id(name)
+        existing = self.names.get(channel)
+        if existing is not None and existing != name:
+            raise ValueError("Nome de canal indisponível.")
+        memberships = self._memberships.setdefault(client_id, set())
+        if channel not in memberships and len(memberships) >= self.max_channels_per_client:
+            raise ValueError("Limite de canais atingido.")
+        self.names[channel] = name
+        self._members.setdefault(channel, {})[client_id] = address
+        memberships.add(channel)
+        return channel
+
+    def unsubscribe(self, client_id, channel):
+        '''
+        Remove a inscrição de um cliente em um canal.
+
+        Returns:
+            bool: False se o cliente não estava inscrito no canal.
+        '''
+        memberships = self._memberships.get(client_id)
+        if memberships is None or channel not in memberships:
+            return False
+        memberships.discard(channel)
+        if not memberships:
+            del self._memberships[client_id]
+        members = self._members[channel]
+        del members[client_id]
+        if not members:
+            del self._members[channel]
+            del self.names[channel]
+        return True
+
+    def remove_client(self, client_id):
+        '''
+        Remove todas as inscrições de um cliente que saiu.
+        '''
+        for channel in list(self._memberships.get(client_id, ())):
+            self.unsubscribe(client_id, channel)
+
+    def is_member(self, client_id, channel):
+        return channel in self._memberships.get(client_id, ())
+
+    def addresses(self, channel):
+        '''
+        Endereços dos membros de um canal.
+        '''
+        members = self._members.get(channel)
+        return members.values() if members is not None else ()
+
+    def members(self, channel):
+        '''
+        IDs dos membros de um canal.
+        '''
+        return tuple(self._members.get(channel, ()))
+
+    def list_messages(self, destination_id):
+        '''
+        Monta as mensagens CHANNEL_LIST com todos os canais e seus números de membros.
+        '''
+        channels = [(name, len(self._members[channel])) for channel, name in self.names.items()]
+        return [TwotterMessage(MessageType.CHANNEL_LIST, 0, destination_id, self.server_name, text)
+                for text in format_channel_list(channels)]
+
+    def __len__(self):
+        return len(self.names)
+
+
+class ChannelDirectory:
+    '''
+    Lado cliente dos canais: os canais em que o cliente está inscrito e a
+    última lista de canais recebida do servidor, montada a partir das partes de CHANNEL_LIST.
+
+    Attributes:
+        subscriptions (dict): O nome de cada canal inscrito, pelo seu identificador.
+        available (list): Pares (nome, número de membros) da última lista completa recebida.
+    '''
+    def __init__(self):
+        self.subscriptions = {}
+        self.available = []
+        self._parts = {}
+        self._lock = threading.Lock()
+
+    def subscribed(self, name):
+        with self._lock:
+            self.subscriptions[channel_id(name)] = name
+
+    def unsubscribed(self, name):
+        with self._lock:
+            self.subscriptions.pop(channel_id(name), None)
+
+    def name(self, channel):
+        '''
+        Nome de um canal inscrito, ou None se o identificador não é de um canal inscrito.
+        '''
+        return self.subscriptions.get(channel)
+
+    def apply_list(self, part, total, channels):
+        '''
+        Aplica uma parte de uma CHANNEL_LIST. A lista é substituída quando todas as partes chegam.
+        '''
+        with self._lock:
+            if part == 1:
+                self._parts = {}
+            self._parts[part] = channels
+            if len(self._parts) == total:
+                self.available = sorted(channel for chunk in self._parts.values() for channel in chunk)
+                self._parts = {}
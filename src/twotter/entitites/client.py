@@ -2,8 +2,22 @@ import threading
 import socket
 import time
 
-from twotter.utils import decode_message, encode_message
+from twotter.utils import encode_message
+from twotter.utils.message_v2 import V2_FEATURE, V2_PREFIX, decode_datagram, encode_record, parse_features
 from twotter.entitites import TwotterMessage, MessageType
+from twotter.entitites.history import MessageHistory
+from twotter.entitites.presence import Roster, parse_delta, parse_snapshot, PRESENCE_UNAVAILABLE_TEXT
+from twotter.entitites.channels import ChannelDirectory, channel_id, parse_channel_list
+from twotter.entitites.reliability import (ReliablePeer, REL_FEATURE, REL_DATA, REL_ACK, RETRANSMIT_TICK_IN_SECONDS,
+                                           MIN_RTO_IN_SECONDS, CHANNEL_RESET_TEXT)
+from twotter.config import MESSAGE_HISTORY_SIZE
+
+PRESENCE_RESYNC_INTERVAL_IN_SECONDS = 2
+RECEIVE_BUFFER_SIZE = 2048
+HELLO_RETRY_INTERVAL_IN_SECONDS = 1
+# Espera máxima da thread de recepção com o canal confiável ocioso: uma mensagem
+# enviada pela UI enquanto a thread espera é retransmitida com atraso de no máximo este valor.
+IDLE_POLL_INTERVAL_IN_SECONDS = MIN_RTO_IN_SECONDS
 
 
 class TwotterClient:   
@@ -14,22 +28,46 @@ class TwotterClient:
         server_address (tuple): O endereço do servidor.
         client_id (int): O ID do cliente.
         username (str): O nome de usuário do cliente.
+        history_size (int): Número máximo de mensagens recebidas guardadas.
+        wire_version (int): Versão do protocolo pedida ao servidor (1 ou 2).
+        reliable (bool): Pede ao servidor entrega confiável e ordenada (requer o protocolo v2).
 
     Attributes:
         server_address (tuple): O endereço do servidor.
         client_id (int): O ID do cliente.
         username (str): O nome de usuário do cliente.
         sock (socket): O socket utilizado para comunicação.
-        received_messages (list): A lista de mensagens recebidas.
+        received_messages (MessageHistory): O histórico limitado de mensagens recebidas.
+        roster (Roster): A lista de clientes online mantida pelos deltas de presença do servidor.
+        channels (ChannelDirectory): Os canais inscritos e a última lista de canais recebida.
         accepted (bool): Status de aceitação do cliente pelo servidor.
+        wire_version (int): Versão do protocolo em uso; passa a 2 quando o servidor aceita o v2 no HELLO.
+        channel (ReliablePeer): O canal confiável com o servidor, se a entrega confiável foi aceita.
+        reconnecting (bool): Se o HELLO foi refeito para recomeçar o canal confiável e a resposta ainda não chegou.
+        presence_supported (bool): Se o servidor mantém a lista de presença; passa a False quando ele recusa a inscrição.
+        last_error (str): O texto do último ERROR recebido do servidor depois da aceitação
+            (por exemplo, uma mensagem descartada pelo limite de envio).
     '''
-    def __init__(self, server_address, client_id, username):
+    def __init__(self, server_address, client_id, username, history_size=MESSAGE_HISTORY_SIZE, wire_version=2,
+                 reliable=True):
         self.server_address = server_address
         self.client_id = client_id
         self.username = username[:20].ljust(20, '\0') 
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  
-        self.received_messages = []
-        self.online_users = ""
+        self.received_messages = MessageHistory(history_size)
+        self.online_users_text = ""
+        self.roster = Roster()
+        self.channels = ChannelDirectory()
+        self.presence_requested_at = 0
+        self.requested_wire_version = wire_version
+        self.wire_version = 1
+        self.reliable = reliable and wire_version == 2
+        self.channel = None
+        self.reconnecting = False
+        self.last_error = None
+        self.presence_supported = True
+        self.hello_sent_at = 0
+        self._unsent = []
         print("Cliente iniciado")
         self.accepted = False
         self.start()
@@ -40,10 +78,12 @@ class TwotterClient:
         '''
         self.connect()
         threading.Thread(target=self.receive_messages, daemon=True).start()
+        self.send_presence_subscribe()
         
     def connect(self):
         '''
         Conecta o cliente ao servidor enviando uma mensagem de saudação e aguardando aceitação.
+        O HELLO é reenviado a cada HELLO_RETRY_INTERVAL_IN_SECONDS, caso ele ou a resposta se percam.
 
         Raises:
             TimeoutError: Se o tempo de espera para aceitação exceder o limite.
@@ -52,18 +92,23 @@ class TwotterClient:
         timeout = 5
         start_time = time.time()
         self.send_hello()
+        self.sock.settimeout(HELLO_RETRY_INTERVAL_IN_SECONDS)
         while not self.accepted:
             if time.time() - start_time > timeout:
                 print("Tempo de espera excedido")
                 self.sock.close()
                 raise TimeoutError("Tempo de espera excedido")
             
-            data, _ = self.sock.recvfrom(1024)      
-            message = decode_message(data)
+            try:
+                data, _ = self.sock.recvfrom(RECEIVE_BUFFER_SIZE)
+            except socket.timeout:
+                self.send_hello()
+                continue
+            message = decode_datagram(data)[0]
             
             if int(message.message_type) == MessageType.HELLO.value:
                 print(f"Cliente {message.username} (ID {message.origin_id}) entrou")
-                self.accepted = True
+                self.accept(message)
             elif int(message.message_type) == MessageType.ERROR.value:
                 print(f"Cliente {message.username} (ID {message.origin_id}) não foi aceito")
                 self.sock.close()    
@@ -72,19 +117,90 @@ class TwotterClient:
                 print("Mensagem inesperada", message)   
                 raise ConnectionError("Mensagem inesperada")
             
+    def accept(self, message):
+        '''
+        Marca o cliente como aceito e adota as capacidades confirmadas na resposta ao HELLO.
+        '''
+        features = parse_features(message.text)
+        if V2_FEATURE in features:
+            self.wire_version = 2
+            if REL_FEATURE in features and self.channel is None:
+                self.channel = ReliablePeer()
+        self.accepted = True
+        if self.reconnecting:
+            self.reconnecting = False
+            unsent, self._unsent = self._unsent, []
+            for data in unsent:
+                self._send_payload(data)
+
+    def reconnect(self):
+        '''
+        Recomeça o canal confiável com o servidor, depois que ele falhou (o
+        servidor não confirmou os dados) ou foi encerrado pelo servidor. O HELLO
+        é reenviado até a resposta, e as mensagens ainda não confirmadas, e as
+        enviadas enquanto isso, seguem pelo novo canal.
+        '''
+        if self.channel is not None:
+            self._unsent[:0] = self.channel.pending()
+            self.channel = None
+        self.reconnecting = True
+        self.hello_sent_at = time.monotonic()
+        self.send_hello()
+
+    def send(self, message):
+        '''
+        Envia uma mensagem ao servidor na versão de protocolo negociada.
+        '''
+        if self.wire_version == 2:
+            self._send_payload(V2_PREFIX + encode_record(message))
+        else:
+            self.sock.sendto(encode_message(message), self.server_address)
+
+    def _send_payload(self, data):
+        if self.reconnecting:
+            self._unsent.append(data)
+            return
+        if self.channel is not None:
+            data = self.channel.send(data, time.monotonic())
+            if data is None:  # Janela cheia: enviado por poll_channel.
+                return
+        self.sock.sendto(data, self.server_address)
+
+    def poll_channel(self):
+        '''
+        Envia as retransmissões vencidas, as mensagens que esperavam espaço na
+        janela e os ACKs pendentes. Se o canal falhou, refaz o HELLO (veja reconnect).
+        '''
+        if self.reconnecting:
+            if time.monotonic() - self.hello_sent_at >= HELLO_RETRY_INTERVAL_IN_SECONDS:
+                self.hello_sent_at = time.monotonic()
+                self.send_hello()
+            return
+        if self.channel is None:
+            return
+        for data in self.channel.poll(time.monotonic()):
+            self.sock.sendto(data, self.server_address)
+        if self.channel.failed:
+            self.reconnect()
+
     def send_hello(self):
         '''
-        Envia uma mensagem de saudação (HELLO) ao servidor.
+        Envia uma mensagem de saudação (HELLO) ao servidor. O HELLO vai sempre
+        em v1 e anuncia no texto as capacidades do cliente.
         '''
-        msg = encode_message(TwotterMessage(MessageType.HELLO, self.client_id, 0, self.username, ''))
+        features = []
+        if self.requested_wire_version == 2:
+            features.append(V2_FEATURE)
+            if self.reliable:
+                features.append(REL_FEATURE)
+        msg = encode_message(TwotterMessage(MessageType.HELLO, self.client_id, 0, self.username, ','.join(features)))
         self.sock.sendto(msg, self.server_address)
 
     def send_bye(self):
         '''
         Envia uma mensagem de despedida (BYE) ao servidor.
         '''
-        msg = encode_message(TwotterMessage(MessageType.BYE, self.client_id, 0, self.username, ''))
-        self.sock.sendto(msg, self.server_address)
+        self.send(TwotterMessage(MessageType.BYE, self.client_id, 0, self.username, ''))
 
     def send_message(self, text, destination_id):
         '''
@@ -94,15 +210,76 @@ class TwotterClient:
             text (str): O texto da mensagem a ser enviada.
             destination_id (int): O ID do cliente destinatário.
         '''
-        msg = encode_message(TwotterMessage(MessageType.MESSAGE, self.client_id, destination_id, self.username, text))
-        self.sock.sendto(msg, self.server_address)
+        self.send(TwotterMessage(MessageType.MESSAGE, self.client_id, destination_id, self.username, text))
     
+    def subscribe_channel(self, name):
+        '''
+        Inscreve o cliente em um canal, criando-o se ele não existir.
+        '''
+        self.send(TwotterMessage(MessageType.CHANNEL_SUBSCRIBE, self.client_id, 0, self.username, name))
+
+    def unsubscribe_channel(self, name):
+        '''
+        Cancela a inscrição do cliente em um canal.
+        '''
+        self.send(TwotterMessage(MessageType.CHANNEL_UNSUBSCRIBE, self.client_id, 0, self.username, name))
+
+    def send_channel_message(self, text, name):
+        '''
+        Envia uma mensagem de texto aos membros de um canal em que o cliente está inscrito.
+
+        Args:
+            text (str): O texto da mensagem a ser enviada.
+            name (str): O nome do canal.
+        '''
+        self.send(TwotterMessage(MessageType.CHANNEL_MESSAGE, self.client_id, channel_id(name), self.username, text))
+
+    def send_get_channels(self):
+        '''
+        Envia uma mensagem ao servidor solicitando a lista de canais.
+        '''
+        self.send(TwotterMessage(MessageType.CHANNEL_LIST, self.client_id, 0, self.username, ''))
+
     def send_get_online_clients(self):
         '''
         Envia uma mensagem ao servidor solicitando a lista de clientes online.
         '''
-        msg = encode_message(TwotterMessage(MessageType.GET_ONLINE_CLIENTS, self.client_id, 0, self.username, ''))
-        self.sock.sendto(msg, self.server_address)
+        self.send(TwotterMessage(MessageType.GET_ONLINE_CLIENTS, self.client_id, 0, self.username, ''))
+
+    def send_presence_subscribe(self):
+        '''
+        Inscreve o cliente para receber os deltas da lista de clientes online.
+        O servidor responde com a lista completa, então também é usada para ressincronizar.
+        '''
+        self.roster.reset()
+        self.presence_requested_at = time.time()
+        self.send(TwotterMessage(MessageType.PRESENCE_SUBSCRIBE, self.client_id, 0, self.username, ''))
+
+    def ensure_presence(self):
+        '''
+        Verifica se a lista de clientes online está sincronizada, refazendo a
+        inscrição se a resposta do servidor não chegou a tempo. Se o servidor
+        recusou a inscrição, ela não é refeita.
+
+        Returns:
+            bool: True se a lista em cache está sincronizada.
+        '''
+        if not self.presence_supported:
+            return False
+        if not self.roster.synced and time.time() - self.presence_requested_at > PRESENCE_RESYNC_INTERVAL_IN_SECONDS:
+            self.send_presence_subscribe()
+        return self.roster.synced
+
+    @property
+    def online_users(self):
+        '''
+        Lista de clientes online, separados por vírgula. Usa a lista mantida
+        pelos deltas de presença e, se ela não estiver sincronizada (por
+        exemplo, com um servidor sem suporte a presença), a última resposta de GET_ONLINE_CLIENTS.
+        '''
+        if self.roster.synced:
+            return ', '.join(str(client_id) for client_id in self.roster.members())
+        return self.online_users_text
 
     def receive_messages(self):
         '''
@@ -110,33 +287,94 @@ class TwotterClient:
         '''
         while True:
             try:
-                data, _ = self.sock.recvfrom(1024)
-                
-                message = decode_message(data)
-                
-                if self.accepted: # Se o cliente foi aceito
-                    message_type = message.message_type
-                    if message_type == MessageType.MESSAGE.value:
-                        self.received_messages.append(message)   
+                # Enquanto há dados confiáveis em trânsito, acorda a tempo de retransmitir. Ocioso, o
+                # canal ainda é verificado periodicamente, pois send pode ser chamado durante a espera.
+                channel = self.channel
+                if self.reconnecting:
+                    timeout = HELLO_RETRY_INTERVAL_IN_SECONDS
+                elif channel is None:
+                    timeout = None
+                else:
+                    timeout = RETRANSMIT_TICK_IN_SECONDS if channel.busy else IDLE_POLL_INTERVAL_IN_SECONDS
+                self.sock.settimeout(timeout)
+                try:
+                    data, _ = self.sock.recvfrom(RECEIVE_BUFFER_SIZE)
+                except socket.timeout:
+                    data = None
 
-                    elif message_type == MessageType.GET_ONLINE_CLIENTS.value:
-                        self.online_users = message.text
-                
-                    elif message_type == MessageType.HELLO.value:
-                        self.send_hello()
-                        
-                else: # Esperando aceitação
-                    if message.message_type == MessageType.HELLO.value:
-                        print(f"Cliente {message.username} (ID {message.origin_id}) entrou")
-                        self.accepted = True
-                    elif message.message_type == MessageType.ERROR.value:
-                        print(f"Cliente {message.username} (ID {message.origin_id}) não foi aceito")
-                        self.send_bye()
-                        self.sock.close()
+                if data:
+                    for datagram in self.unwrap(data):
+                        for message in decode_datagram(datagram):
+                            self.handle_message(message)
+                self.poll_channel()
 
             except Exception as e:
                 print("Erro ao receber mensagem", e)
                 continue
 
+    def unwrap(self, data):
+        '''
+        Retorna os datagramas prontos para decodificação: os datagramas confiáveis
+        passam pelo canal, que os entrega na ordem e descarta duplicados.
+        '''
+        if data[0] == REL_DATA or data[0] == REL_ACK:
+            if self.channel is None:
+                return []
+            return self.channel.receive(data, time.monotonic())
+        return [data]
+
+    def handle_message(self, message):
+        '''
+        Processa uma mensagem recebida do servidor conforme o tipo de mensagem.
+        '''
+        if self.accepted: # Se o cliente foi aceito
+            message_type = message.message_type
+            if message_type == MessageType.MESSAGE.value:
+                self.received_messages.append(message)   
+
+            elif message_type == MessageType.GET_ONLINE_CLIENTS.value:
+                self.online_users_text = message.text
+
+            elif message_type == MessageType.PRESENCE_DELTA.value:
+                if not self.roster.apply_delta(*parse_delta(message.text)):
+                    self.send_presence_subscribe()
+
+            elif message_type == MessageType.PRESENCE_SNAPSHOT.value:
+                self.roster.apply_snapshot(*parse_snapshot(message.text))
+        
+            elif message_type == MessageType.CHANNEL_MESSAGE.value:
+                self.received_messages.append(message)
+
+            elif message_type == MessageType.CHANNEL_SUBSCRIBE.value:
+                self.channels.subscribed(message.text)
+
+            elif message_type == MessageType.CHANNEL_UNSUBSCRIBE.value:
+                self.channels.unsubscribed(message.text)
+
+            elif message_type == MessageType.CHANNEL_LIST.value:
+                self.channels.apply_list(*parse_channel_list(message.text))
+
+            elif message_type == MessageType.HELLO.value:
+                self.accept(message)
+
+            elif message_type == MessageType.ERROR.value:
+                if message.text == CHANNEL_RESET_TEXT:
+                    self.reconnect()
+                elif message.text == PRESENCE_UNAVAILABLE_TEXT:
+                    # Servidor sem lista de presença: a lista vem de uma consulta GET_ONLINE_CLIENTS.
+                    self.presence_supported = False
+                    self.send_get_online_clients()
+                else:
+                    self.last_error = message.text
+                
+        else: # Esperando aceitação
+            if message.message_type == MessageType.HELLO.value:
+                print(f"Cliente {message.username} (ID {message.origin_id}) entrou")
+                self.accept(message)
+            elif message.message_type == MessageType.ERROR.value:
+                print(f"Cliente {message.username} (ID {message.origin_id}) não foi aceito")
+                self.send_bye()
+                self.sock.close()
+
     def __del__(self):
         self.send_bye()
\ No newline at end of file
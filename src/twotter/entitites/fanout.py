@@ -0,0 +1,233 @@
+import ctypes
+import ctypes.util
+import errno
+import queue
+import select
+import socket
+import sys
+import threading
+
+from twotter.utils import logger
+
+MAX_PENDING_BROADCASTS = 64
+MAX_PENDING_PACKETS = 65536
+SEND_BATCH_SIZE = 256
+
+
+class _Iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _SockaddrIn(ctypes.Structure):
+    _fields_ = [
+        ("sin_family", ctypes.c_ushort),
+        ("sin_port", ctypes.c_uint16),
+        ("sin_addr", ctypes.c_uint8 * 4),
+        ("sin_zero", ctypes.c_uint8 * 8),
+    ]
+
+
+class _Msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_Iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _Mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _Msghdr), ("msg_len", ctypes.c_uint)]
+
+
+def _load_sendmmsg():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_Mmsghdr), ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+
+_sendmmsg = _load_sendmmsg()
+
+
+class BroadcastFanout:
+    '''
+    Envia broadcasts fora do caminho de recepção do servidor. Cada broadcast é
+    enfileirado junto com uma cópia dos endereços dos destinatários e uma
+    thread dedicada o envia em lotes, usando sendmmsg quando disponível (Linux)
+    ou sendto como alternativa.
+
+    A fila é limitada tanto em número de broadcasts quanto em pacotes
+    pendentes: quando algum dos limites é atingido o broadcast é descartado e
+    contabilizado, de modo que um broadcast grande nunca bloqueia o
+    roteamento unicast.
+
+    Args:
+        sock (socket): O socket usado para o envio.
+        max_pending_broadcasts (int): Número máximo de broadcasts na fila.
+        max_pending_packets (int): Número máximo de pacotes pendentes somando todos os broadcasts da fila.
+        batch_size (int): Número de destinatários por chamada a sendmmsg.
+
+    Attributes:
+        stats (dict): Contadores de broadcasts enfileirados, pacotes enviados, descartes e erros.
+    '''
+    def __init__(self, sock, max_pending_broadcasts=MAX_PENDING_BROADCASTS,
+                 max_pending_packets=MAX_PENDING_PACKETS, batch_size=SEND_BATCH_SIZE):
+        self.sock = sock
+        self.max_pending_packets = max_pending_packets
+        self.batch_size = batch_size
+        self.use_sendmmsg = _sendmmsg is not None and sock.family == socket.AF_INET
+        self._queue = queue.Queue(maxsize=max_pending_broadcasts)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.pending_packets = 0
+        self.stats = {
+            "queued_broadcasts": 0,
+            "dropped_broadcasts": 0,
+            "dropped_packets": 0,
+            "sent_packets": 0,
+            "send_errors": 0,
+            "max_pending_packets": 0,
+        }
+
+    def start(self):
+        '''
+        Inicia a thread de envio, caso ainda não esteja em execução.
+        '''
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="twotter-fanout", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        '''
+        Encerra a thread de envio depois que os broadcasts já enfileirados forem enviados.
+        '''
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, message, addresses):
+        '''
+        Enfileira o envio de uma mensagem para uma lista de endereços.
+
+        Args:
+            message (bytes): A mensagem codificada a ser enviada.
+            addresses (tuple): Os endereços dos destinatários.
+
+        Returns:
+            bool: False se o broadcast foi descartado por falta de espaço na fila.
+        '''
+        if not addresses:
+            return True
+        self.start()
+        count = len(addresses)
+        with self._lock:
+            if self.pending_packets + count > self.max_pending_packets:
+                return self._drop(count)
+            try:
+                self._queue.put_nowait((message, addresses))
+            except queue.Full:
+                return self._drop(count)
+            self.pending_packets += count
+            self.stats["queued_broadcasts"] += 1
+            if self.pending_packets > self.stats["max_pending_packets"]:
+                self.stats["max_pending_packets"] = self.pending_packets
+        return True
+
+    def _drop(self, count):
+        self.stats["dropped_broadcasts"] += 1
+        self.stats["dropped_packets"] += count
+        logger.warning("Broadcast descartado: fila de envio cheia (%d pacotes pendentes)", self.pending_packets)
+        return False
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            message, addresses = job
+            for start in range(0, len(addresses), self.batch_size):
+                batch = addresses[start:start + self.batch_size]
+                try:
+                    sent = self._send_batch(message, batch)
+                except Exception as e:
+                    logger.error("Erro ao enviar broadcast: %s", e)
+                    sent = 0
+                with self._lock:
+                    self.pending_packets -= len(batch)
+                    self.stats["sent_packets"] += sent
+                    self.stats["send_errors"] += len(batch) - sent
+
+    def _send_batch(self, message, addresses):
+        if self.use_sendmmsg:
+            try:
+                return self._sendmmsg(message, addresses)
+            except OSError as e:
+                # Endereços que não são IPv4 literais, por exemplo; sendto resolve esses casos.
+                logger.warning("sendmmsg indisponível, usando sendto: %s", e)
+                self.use_sendmmsg = False
+        return self._sendto(message, addresses)
+
+    def _sendto(self, message, addresses):
+        sent = 0
+        for address in addresses:
+            while True:
+                try:
+                    self.sock.sendto(message, address)
+                    sent += 1
+                    break
+                except BlockingIOError:
+                    select.select([], [self.sock], [], 1)
+                except OSError as e:
+                    logger.error("Erro ao enviar mensagem para %s: %s", address, e)
+                    break
+        return sent
+
+    def _sendmmsg(self, message, addresses):
+        count = len(addresses)
+        payload = ctypes.create_string_buffer(message, len(message))
+        iov = _Iovec(ctypes.cast(payload, ctypes.c_void_p), len(message))
+        names = (_SockaddrIn * count)()
+        msgs = (_Mmsghdr * count)()
+        for i, (host, port) in enumerate(addresses):
+            name = names[i]
+            name.sin_family = socket.AF_INET
+            name.sin_port = socket.htons(port)
+            name.sin_addr[:] = socket.inet_aton(host)
+            hdr = msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(name)
+            hdr.msg_namelen = ctypes.sizeof(_SockaddrIn)
+            hdr.msg_iov = ctypes.pointer(iov)
+            hdr.msg_iovlen = 1
+
+        fd = self.sock.fileno()
+        base = ctypes.addressof(msgs)
+        position = 0
+        sent = 0
+        while position < count:
+            result = _sendmmsg(fd, ctypes.cast(base + position * ctypes.sizeof(_Mmsghdr), ctypes.POINTER(_Mmsghdr)),
+                               count - position, 0)
+            if result >= 0:
+                position += result
+                sent += result
+                continue
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                select.select([], [self.sock], [], 1)
+                continue
+            if sent == 0 and position == 0:
+                raise OSError(err, "sendmmsg falhou")
+            # Pula o destinatário que provocou o erro e segue com o restante do lote.
+            logger.error("Erro ao enviar mensagem para %s: %s", addresses[position], errno.errorcode.get(err, err))
+            position += 1
+        return sent
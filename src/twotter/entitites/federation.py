@@ -0,0 +1,480 @@
+import bisect
+import hashlib
+import hmac
+import struct
+import time
+
+from twotter.utils import logger
+from twotter.utils.message_v2 import V2_PREFIX, decode_records, to_v2_record
+
+# Os datagramas e payloads entre nós começam com este byte.
+FED_MAGIC = 0xF5
+FED_PREFIX = bytes([FED_MAGIC])
+
+# Tipos enviados em datagramas avulsos, fora do canal confiável.
+MEMBERS = 1
+LEAVE = 2
+# Tipos enviados pelo canal confiável entre nós.
+REGISTER = 3
+UNREGISTER = 4
+FORWARD = 5
+BROADCAST = 6
+ROSTER = 7
+CHANNEL = 8
+HANDOFF = 9
+HANDOFF_ACK = 10
+
+HEARTBEAT_INTERVAL_IN_SECONDS = 1.0
+PEER_TIMEOUT_IN_SECONDS = 5.0
+VIRTUAL_NODES = 64
+MAX_FORWARD_HOPS = 2
+ROSTER_IDS_PER_PART = 300
+MAX_BATCH_SIZE = 1400
+
+# Cabeçalho de cada item de um lote confiável: tipo e tamanho do corpo.
+ITEM_HEADER = struct.Struct('!BH')
+MEMBERS_HEADER = struct.Struct('!BBQ')
+# Código de autenticação anexado aos datagramas avulsos quando há um segredo do cluster.
+MAC_SIZE = 16
+CLIENT_ID = struct.Struct('!I')
+# Corpo de HANDOFF e HANDOFF_ACK: o destinatário e quantas mensagens offline foram transferidas.
+HANDOFF_BODY = struct.Struct('!II')
+
+
+def format_node(address):
+    return f"{address[0]}:{address[1]}"
+
+
+def parse_node(text):
+    host, port = text.rsplit(":", 1)
+    return host, int(port)
+
+
+def _hash(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    '''
+    Anel de hash consistente com nós virtuais. Cada nó ocupa replicas pontos
+    do anel, e o dono de uma chave é o primeiro nó no sentido horário a
+    partir do hash da chave; ao adicionar ou remover um nó, apenas as chaves
+    da sua parte do anel mudam de dono.
+
+    Args:
+        nodes (iterable): Os nós iniciais.
+        replicas (int): Número de pontos de cada nó no anel.
+    '''
+    def __init__(self, nodes=(), replicas=VIRTUAL_NODES):
+        self.replicas = replicas
+        self.nodes = set()
+        self._points = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        name = format_node(node)
+        for replica in range(self.replicas):
+            point = _hash(f"{name}#{replica}".encode())
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        keep = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != node]
+        self._points = [point for point, _ in keep]
+        self._owners = [owner for _, owner in keep]
+
+    def owner(self, client_id):
+        '''
+        Retorna o nó dono de um client_id.
+        '''
+        index = bisect.bisect(self._points, _hash(CLIENT_ID.pack(client_id)))
+        return self._owners[index % len(self._owners)]
+
+    def __contains__(self, node):
+        return node in self.nodes
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+class Federation:
+    '''
+    Federação de vários TwotterServer. Cada client_id tem um nó dono,
+    escolhido pelo anel de hash consistente, que guarda as mensagens offline
+    desse cliente e é o destino das mensagens cuja localização é desconhecida.
+
+    Os nós trocam datagramas MEMBERS periodicamente pelo próprio socket do
+    servidor (heartbeat e lista de membros conhecidos, o que propaga a
+    entrada de novos nós); um nó sem heartbeat por PEER_TIMEOUT_IN_SECONDS,
+    ou que envia LEAVE, sai do anel. As demais mensagens entre nós passam por
+    um canal confiável (ReliablePeer) por par, agrupadas em lotes: cada nó
+    anuncia a todos os outros os clientes conectados a ele (REGISTER,
+    UNREGISTER e ROSTER), encaminha mensagens para clientes de outros nós
+    (FORWARD) e repassa broadcasts (BROADCAST) e mensagens de canal (CHANNEL),
+    entregues por cada nó aos membros do canal conectados a ele. A lista de clientes online é a
+    união dos clientes locais com os anunciados pelos outros nós.
+
+    Quando o anel muda, as mensagens offline de clientes que passaram a ter
+    outro dono são entregues ao novo dono. As mensagens transferidas (também
+    as entregues ao nó em que o cliente se conectou) seguem um HANDOFF e só
+    saem do log local quando o outro nó confirma com HANDOFF_ACK; se ele sai
+    antes disso, elas são reenviadas ao dono seguinte.
+
+    Só nós autorizados entram na federação. Com um segredo do cluster, os
+    datagramas avulsos levam um código de autenticação (BLAKE2b com chave),
+    datagramas sem um código válido são descartados e os membros anunciados
+    pelos outros nós passam a receber heartbeats; os que não respondem em
+    peer_timeout são esquecidos. Sem segredo, a associação é estática: só
+    os nós de peers são aceitos, e cada nó deve listar todos os outros.
+
+    Args:
+        server (TwotterServer): O servidor local.
+        peers (iterable): Endereços de nós já em execução, usados para entrar na federação. Continuam
+            recebendo heartbeats mesmo fora do anel, para que voltem a ele quando reiniciarem.
+        advertise (tuple): Endereço deste nó como visto pelos outros; o padrão é o do socket.
+        heartbeat_interval (float): Intervalo entre heartbeats, em segundos.
+        peer_timeout (float): Tempo sem heartbeat após o qual um nó é considerado fora.
+        secret (str | bytes): Segredo compartilhado pelos nós do cluster.
+
+    Attributes:
+        address (tuple): O endereço deste nó.
+        ring (HashRing): O anel com os nós ativos.
+        peers (dict): Para cada outro nó ativo, a sua encarnação e o instante do último heartbeat.
+        locations (dict): O nó a que está conectado cada cliente dos outros nós.
+        stats (dict): Contadores de mensagens encaminhadas, recebidas e de mudanças no anel.
+    '''
+    def __init__(self, server, peers=(), advertise=None, heartbeat_interval=HEARTBEAT_INTERVAL_IN_SECONDS,
+                 peer_timeout=PEER_TIMEOUT_IN_SECONDS, secret=None):
+        self.server = server
+        self.address = tuple(advertise or server.sock.getsockname())
+        self.heartbeat_interval = heartbeat_interval
+        self.peer_timeout = peer_timeout
+        self.incarnation = time.time_ns()
+        self.ring = HashRing([self.address])
+        self.seeds = {tuple(peer) for peer in peers if tuple(peer) != self.address}
+        self.configured = frozenset(self.seeds)
+        if isinstance(secret, str):
+            secret = secret.encode()
+        self._key = hashlib.blake2b(secret).digest() if secret else None
+        # Membros anunciados por outros nós que ainda não responderam, com o instante em que foram anunciados.
+        self._unanswered = {}
+        self.peers = {}
+        self.locations = {}
+        self._rosters = {}
+        self._pending = {}
+        # Destinatários com mensagens offline transferidas e ainda não confirmadas, e o nó que as recebeu.
+        self._handoffs = {}
+        self._next_heartbeat = 0.0
+        self.stats = {"forwarded": 0, "received": 0, "broadcasts": 0, "dropped": 0, "ring_changes": 0, "rejected": 0}
+
+    # Envio
+
+    def _queue(self, node, kind, body):
+        self._pending.setdefault(node, []).append(ITEM_HEADER.pack(kind, len(body)) + body)
+
+    def _queue_all(self, kind, body):
+        for node in self.peers:
+            self._queue(node, kind, body)
+
+    def _mac(self, data):
+        return hashlib.blake2b(data, key=self._key, digest_size=MAC_SIZE).digest()
+
+    def _send_control(self, node, kind, body=b''):
+        data = MEMBERS_HEADER.pack(FED_MAGIC, kind, self.incarnation) + body
+        if self._key is not None:
+            data += self._mac(data)
+        try:
+            self.server.sock.sendto(data, node)
+        except OSError as e:
+            logger.error("Erro ao enviar mensagem para o nó %s: %s", format_node(node), e)
+
+    def flush(self, now):
+        '''
+        Envia os itens acumulados para cada nó, agrupados em lotes pelo canal confiável.
+        '''
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        reliability = self.server.reliability
+        for node, items in pending.items():
+            if node not in self.peers:
+                continue
+            if node not in reliability:
+                reliability.open(node)
+            batch = bytearray(FED_PREFIX)
+            for item in items:
+                if len(batch) > 1 and len(batch) + len(item) > MAX_BATCH_SIZE:
+                    self._send_batch(node, bytes(batch), now)
+                    batch = bytearray(FED_PREFIX)
+                batch += item
+            if len(batch) > 1:
+                self._send_batch(node, bytes(batch), now)
+
+    def _send_batch(self, node, batch, now):
+        datagram = self.server.reliability.send(node, batch, now)
+        if datagram is not None:
+            try:
+                self.server.sock.sendto(datagram, node)
+            except OSError as e:
+                logger.error("Erro ao enviar mensagem para o nó %s: %s", format_node(node), e)
+
+    def tick(self, now):
+        '''
+        Envia o heartbeat periódico e remove os nós que pararam de responder.
+        '''
+        if now < self._next_heartbeat:
+            return
+        self._next_heartbeat = now + self.heartbeat_interval
+        members = self._members()
+        for node in self.seeds | set(self.peers):
+            self._send_control(node, MEMBERS, members)
+        for node, (_, last_seen) in list(self.peers.items()):
+            if now - last_seen > self.peer_timeout:
+                logger.warning("Nó %s parou de responder", format_node(node))
+                self._remove_peer(node)
+        # Os membros anunciados que nunca responderam (ou deixaram de responder) são esquecidos.
+        for node in self.seeds - self.configured:
+            if node in self.peers:
+                self._unanswered.pop(node, None)
+            elif now - self._unanswered.setdefault(node, now) > self.peer_timeout:
+                self.seeds.discard(node)
+                del self._unanswered[node]
+
+    def _members(self):
+        return ','.join(format_node(node) for node in self.ring.nodes).encode()
+
+    def leave(self):
+        '''
+        Avisa os outros nós de que este nó está saindo da federação.
+        '''
+        for node in self.peers:
+            self._send_control(node, LEAVE)
+
+    # Eventos locais
+
+    def client_up(self, client_id):
+        self._queue_all(REGISTER, CLIENT_ID.pack(client_id))
+
+    def client_down(self, client_id):
+        self._queue_all(UNREGISTER, CLIENT_ID.pack(client_id))
+
+    def online_ids(self):
+        '''
+        IDs dos clientes conectados aos outros nós.
+        '''
+        return self.locations.keys()
+
+    def route(self, message, hops=0):
+        '''
+        Encaminha uma mensagem para um cliente que não está conectado a este
+        nó: diretamente ao nó do cliente, se conhecido, ou ao dono do client_id.
+
+        Returns:
+            bool: False se este nó é o dono e o cliente não está em nenhum nó.
+        '''
+        destination_id = message.destination_id
+        node = self.locations.get(destination_id)
+        if node is None:
+            node = self.ring.owner(destination_id)
+            if node == self.address:
+                return False
+        if hops >= MAX_FORWARD_HOPS:
+            self.stats["dropped"] += 1
+            return True
+        self._queue(node, FORWARD, bytes([hops + 1]) + to_v2_record(message))
+        self.stats["forwarded"] += 1
+        return True
+
+    def broadcast(self, message):
+        '''
+        Repassa um broadcast para os clientes dos outros nós.
+        '''
+        if self.peers:
+            self._queue_all(BROADCAST, to_v2_record(message))
+            self.stats["broadcasts"] += 1
+
+    def publish(self, message):
+        '''
+        Repassa uma mensagem de canal para os outros nós, que a entregam aos seus membros do canal.
+        '''
+        if self.peers:
+            self._queue_all(CHANNEL, to_v2_record(message))
+
+    # Recepção
+
+    def handle_control(self, node, data, now):
+        '''
+        Trata um datagrama avulso (MEMBERS ou LEAVE) de outro nó. Datagramas
+        de nós não autorizados são descartados.
+        '''
+        if self._key is not None:
+            if len(data) < MEMBERS_HEADER.size + MAC_SIZE or not hmac.compare_digest(
+                    self._mac(bytes(data[:-MAC_SIZE])), bytes(data[-MAC_SIZE:])):
+                self.stats["rejected"] += 1
+                return
+            data = data[:-MAC_SIZE]
+        elif node not in self.configured:
+            self.stats["rejected"] += 1
+            return
+        _, kind, incarnation = MEMBERS_HEADER.unpack_from(data)
+        if kind == LEAVE:
+            if node in self.peers:
+                logger.info("Nó %s saiu da federação", format_node(node))
+                self._remove_peer(node)
+            return
+
+        known = self.peers.get(node)
+        if known is None or known[0] != incarnation:
+            if known is not None:
+                # O nó reiniciou: o canal confiável e os clientes anunciados são de outra encarnação.
+                self._remove_peer(node)
+                self.server.reliability.close(node)
+            self._add_peer(node, incarnation, now)
+        else:
+            known[1] = now
+
+        if self._key is None:
+            # Sem segredo, os membros anunciados não podem ser verificados.
+            return
+        for text in bytes(data[MEMBERS_HEADER.size:]).decode().split(','):
+            if text:
+                member = parse_node(text)
+                if member != self.address and member not in self.peers and member not in self.seeds:
+                    # Um membro ainda desconhecido: o próximo heartbeat o alcança.
+                    self.seeds.add(member)
+                    self._unanswered[member] = now
+
+    def handle_batch(self, node, payload):
+        '''
+        Trata um lote recebido pelo canal confiável de outro nó.
+        '''
+        if node not in self.peers:
+            return
+        offset = 1
+        end = len(payload)
+        while offset < end:
+            kind, length = ITEM_HEADER.unpack_from(payload, offset)
+            offset += ITEM_HEADER.size
+            body = payload[offset:offset + length]
+            offset += length
+            self.stats["received"] += 1
+            try:
+                self._handle_item(node, kind, body)
+            except Exception as e:
+                logger.error("Erro ao processar mensagem do nó %s: %s", format_node(node), e)
+
+    def _handle_item(self, node, kind, body):
+        server = self.server
+        if kind == REGISTER:
+            self._register(node, CLIENT_ID.unpack(body)[0])
+        elif kind == UNREGISTER:
+            self._unregister(node, CLIENT_ID.unpack(body)[0])
+        elif kind == ROSTER:
+            if body[0]:
+                for client_id in list(self._rosters.get(node, ())):
+                    self._unregister(node, client_id)
+            for (client_id,) in CLIENT_ID.iter_unpack(body[1:]):
+                self._register(node, client_id)
+        elif kind == FORWARD:
+            message = decode_records(V2_PREFIX + bytes(body[1:]))[0]
+            server.deliver_forwarded(message, body[0])
+        elif kind == BROADCAST:
+            message = decode_records(V2_PREFIX + bytes(body))[0]
+            server.send_message_to_all(message)
+        elif kind == CHANNEL:
+            server.deliver_channel_message(decode_records(V2_PREFIX + bytes(body))[0])
+        elif kind == HANDOFF:
+            # Os FORWARD anteriores do lote já foram tratados: confirma o recebimento.
+            self._queue(node, HANDOFF_ACK, bytes(body))
+        elif kind == HANDOFF_ACK:
+            client_id, count = HANDOFF_BODY.unpack(body)
+            if self._handoffs.get(client_id) == node:
+                del self._handoffs[client_id]
+                if server.offline_log is not None:
+                    server.offline_log.drop(client_id, count)
+
+    def _register(self, node, client_id):
+        self._rosters.setdefault(node, set()).add(client_id)
+        if self.locations.get(client_id) != node:
+            self.locations[client_id] = node
+            self.server.publish_presence(client_id, joined=True)
+        # O dono entrega as mensagens guardadas enquanto o cliente estava offline.
+        if self.ring.owner(client_id) == self.address and self._handoffs.get(client_id) != node:
+            self._hand_off(node, client_id, 1)
+
+    def _hand_off(self, node, client_id, hops):
+        '''
+        Envia a outro nó as mensagens offline de um cliente, mantendo-as no log até o HANDOFF_ACK.
+
+        Returns:
+            int: O número de mensagens enviadas.
+        '''
+        offline_log = self.server.offline_log
+        records = offline_log.peek(client_id) if offline_log is not None else []
+        if not records:
+            return 0
+        for record in records:
+            self._queue(node, FORWARD, bytes([hops]) + record)
+        self._queue(node, HANDOFF, HANDOFF_BODY.pack(client_id, len(records)))
+        self._handoffs[client_id] = node
+        return len(records)
+
+    def _unregister(self, node, client_id):
+        self._rosters.get(node, set()).discard(client_id)
+        if self.locations.get(client_id) == node:
+            del self.locations[client_id]
+            self.server.publish_presence(client_id, joined=False)
+
+    # Membros
+
+    def _add_peer(self, node, incarnation, now):
+        logger.info("Nó %s entrou na federação", format_node(node))
+        self.peers[node] = [incarnation, now]
+        self.ring.add(node)
+        # Responde de imediato, antes do primeiro lote: lotes de nós desconhecidos são descartados.
+        self._send_control(node, MEMBERS, self._members())
+        # O novo nó recebe a lista completa dos clientes locais.
+        ids = self.server.clients.snapshot().ids
+        for start in range(0, max(len(ids), 1), ROSTER_IDS_PER_PART):
+            chunk = ids[start:start + ROSTER_IDS_PER_PART]
+            self._queue(node, ROSTER, bytes([start == 0]) + b''.join(CLIENT_ID.pack(client_id) for client_id in chunk))
+        self._rebalance()
+
+    def _remove_peer(self, node):
+        self.peers.pop(node, None)
+        self._pending.pop(node, None)
+        self.ring.remove(node)
+        for client_id in list(self._rosters.get(node, ())):
+            self._unregister(node, client_id)
+        self._rosters.pop(node, None)
+        self.server.reliability.close(node)
+        # As transferências não confirmadas por este nó são refeitas para o novo dono.
+        for client_id in [client_id for client_id, target in self._handoffs.items() if target == node]:
+            del self._handoffs[client_id]
+        self._rebalance()
+
+    def _rebalance(self):
+        '''
+        Entrega as mensagens offline de clientes que passaram a ter outro dono
+        ao novo dono, exceto as que já aguardam a confirmação dele.
+        '''
+        self.stats["ring_changes"] += 1
+        offline_log = self.server.offline_log
+        if offline_log is None:
+            return
+        moved = 0
+        for client_id in offline_log.destinations():
+            owner = self.ring.owner(client_id)
+            if owner != self.address and self._handoffs.get(client_id) != owner:
+                moved += self._hand_off(owner, client_id, 0)
+        if moved:
+            logger.info("%d mensagens offline transferidas após mudança na federação", moved)
@@ -0,0 +1,270 @@
+import asyncio
+from collections import deque
+
+from twotter.utils.message_v2 import V2_FEATURE, MAX_DATAGRAM_SIZE, decode_datagram, encode_record, pack_records
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.entitites.async_client import AsyncTwotterClient, CONNECT_TIMEOUT_IN_SECONDS
+from twotter.entitites.registry import MUX_FEATURE
+
+# Bem abaixo do prazo de inatividade do servidor (CLIENT_TIMEOUT_IN_SECONDS).
+KEEPALIVE_INTERVAL_IN_SECONDS = 60
+
+
+class _GatewayProtocol(asyncio.DatagramProtocol):
+    def __init__(self, gateway, index):
+        self.gateway = gateway
+        self.index = index
+
+    def datagram_received(self, data, addr):
+        self.gateway.datagram_received(self.index, data)
+
+    def error_received(self, exc):
+        print("Erro no socket do gateway", exc)
+
+
+class _SessionTransport:
+    '''
+    Transporte de uma GatewaySession: entrega os datagramas da sessão ao
+    gateway, que os agrupa com os das demais sessões do mesmo socket.
+    '''
+    def __init__(self, gateway, session):
+        self.gateway = gateway
+        self.session = session
+
+    def sendto(self, data):
+        self.gateway.send(self.session, data)
+
+    def close(self):
+        self.gateway.detach(self.session)
+
+
+class GatewaySession(AsyncTwotterClient):
+    '''
+    Uma sessão (client_id) de um TwotterGateway. Tem a mesma interface do
+    AsyncTwotterClient (send_message, async for, consultas), mas não abre um
+    socket: o tráfego passa pelo socket compartilhado do gateway.
+    '''
+    def __init__(self, gateway, client_id, username, **options):
+        super().__init__(gateway.server_address, client_id, username, wire_version=2, reliable=False, **options)
+        self.gateway = gateway
+        self.transport = _SessionTransport(gateway, self)
+        self.presence_subscribed = False
+
+    def send_hello(self):
+        self.transport.sendto(encode_record(
+            TwotterMessage(MessageType.HELLO, self.client_id, 0, self.username, f"{V2_FEATURE},{MUX_FEATURE}")))
+
+    def send_presence_subscribe(self):
+        self.presence_subscribed = True
+        super().send_presence_subscribe()
+
+    def send(self, message):
+        self.transport.sendto(encode_record(message))
+
+    def subscribe_channel(self, name):
+        self.gateway.channel_request(self, MessageType.CHANNEL_SUBSCRIBE, name)
+        super().subscribe_channel(name)
+
+    def unsubscribe_channel(self, name):
+        self.gateway.channel_request(self, MessageType.CHANNEL_UNSUBSCRIBE, name)
+        super().unsubscribe_channel(name)
+
+
+class TwotterGateway:
+    '''
+    Gateway que hospeda muitos client_ids sobre um socket UDP (ou um pequeno
+    conjunto de sockets), para pontes e fazendas de bots: milhares de IDs sem
+    milhares de sockets e threads.
+
+    Cada sessão é associada a um socket do conjunto pelo client_id. As
+    sessões anunciam "mux" no HELLO, o que permite ao servidor registrar
+    vários client_ids no mesmo endereço, e "v2": as mensagens das sessões de
+    um socket são agrupadas em datagramas v2 a cada iteração do loop. O
+    tráfego recebido é distribuído pelo destination_id para a fila de cada
+    sessão; broadcasts, que o servidor envia uma vez por endereço, são
+    entregues a todas as sessões do socket. Os KEEPALIVE de todas as sessões
+    também vão agrupados, a cada KEEPALIVE_INTERVAL_IN_SECONDS.
+
+        gateway = TwotterGateway(("127.0.0.1", 12345), sockets=2)
+        await gateway.open()
+        sessions = await gateway.connect_many([(id, f"bot{id}") for id in range(1, 1001)])
+
+    Args:
+        server_address (tuple): O endereço do servidor.
+        sockets (int): Número de sockets do gateway.
+        keepalive_interval (float): Intervalo entre os KEEPALIVE, em segundos.
+
+    Attributes:
+        sessions (dict): As sessões conectadas ou conectando, pelo client_id.
+    '''
+    def __init__(self, server_address, sockets=1, keepalive_interval=KEEPALIVE_INTERVAL_IN_SECONDS):
+        self.server_address = server_address
+        self.keepalive_interval = keepalive_interval
+        self.sessions = {}
+        self._socket_count = sockets
+        self._transports = []
+        self._members = [set() for _ in range(sockets)]
+        self._pending = [[] for _ in range(sockets)]
+        self._flush_scheduled = [False] * sockets
+        self._channels = {}
+        self._channel_requests = {}
+        self._keepalive_task = None
+
+    async def open(self):
+        '''
+        Abre os sockets do gateway e inicia o envio periódico de KEEPALIVE.
+        '''
+        loop = asyncio.get_running_loop()
+        for index in range(self._socket_count):
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda index=index: _GatewayProtocol(self, index), remote_addr=self.server_address)
+            self._transports.append(transport)
+        self._keepalive_task = asyncio.create_task(self.keepalive_task())
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        '''
+        Encerra todas as sessões (com BYE) e fecha os sockets.
+        '''
+        for session in list(self.sessions.values()):
+            session.close()
+        for index in range(self._socket_count):
+            self._flush(index)
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+        for transport in self._transports:
+            transport.close()
+        self._transports = []
+
+    async def connect(self, client_id, username, timeout=CONNECT_TIMEOUT_IN_SECONDS, **options):
+        '''
+        Registra um client_id no servidor.
+
+        Returns:
+            GatewaySession: A sessão conectada.
+
+        Raises:
+            TimeoutError: Se o servidor não responder dentro de timeout segundos.
+            ConnectionError: Se o ID do cliente já estiver em uso.
+        '''
+        if client_id in self.sessions:
+            raise ValueError(f"ID {client_id} já está registrado no gateway")
+        session = GatewaySession(self, client_id, username, **options)
+        self.sessions[client_id] = session
+        self._members[self._index(client_id)].add(client_id)
+        await session.connect(timeout)
+        return session
+
+    async def connect_many(self, clients, timeout=CONNECT_TIMEOUT_IN_SECONDS):
+        '''
+        Registra vários client_ids de uma vez; os HELLO saem agrupados.
+
+        Args:
+            clients (iterable): Pares (client_id, nome de usuário).
+
+        Returns:
+            list: As sessões conectadas, na mesma ordem.
+        '''
+        return await asyncio.gather(*(self.connect(client_id, username, timeout) for client_id, username in clients))
+
+    def _index(self, client_id):
+        return client_id % self._socket_count
+
+    # Envio
+
+    def send(self, session, record):
+        '''
+        Acumula um registro v2 de uma sessão; os registros de cada socket são
+        enviados juntos ao final da iteração atual do loop.
+        '''
+        index = self._index(session.client_id)
+        self._pending[index].append(record)
+        if not self._flush_scheduled[index]:
+            self._flush_scheduled[index] = True
+            asyncio.get_running_loop().call_soon(self._flush, index)
+
+    def _flush(self, index):
+        self._flush_scheduled[index] = False
+        records, self._pending[index] = self._pending[index], []
+        if not records or index >= len(self._transports):
+            return
+        transport = self._transports[index]
+        for datagram in pack_records(records, MAX_DATAGRAM_SIZE):
+            transport.sendto(datagram)
+
+    def detach(self, session):
+        '''
+        Remove uma sessão encerrada do gateway.
+        '''
+        if self.sessions.get(session.client_id) is session:
+            del self.sessions[session.client_id]
+            self._members[self._index(session.client_id)].discard(session.client_id)
+            for members in self._channels.values():
+                members.discard(session.client_id)
+
+    async def keepalive_task(self):
+        '''
+        Envia periodicamente um KEEPALIVE de cada sessão conectada, agrupados em poucos datagramas.
+        '''
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            for session in list(self.sessions.values()):
+                if session.accepted:
+                    self.send(session, encode_record(
+                        TwotterMessage(MessageType.KEEPALIVE, session.client_id, 0, session.username, '')))
+
+    # Recepção
+
+    def datagram_received(self, index, data):
+        try:
+            messages = decode_datagram(data)
+        except Exception as e:
+            print("Erro ao receber mensagem", e)
+            return
+        for message in messages:
+            self.dispatch(index, message)
+
+    def dispatch(self, index, message):
+        '''
+        Entrega uma mensagem recebida às sessões a que ela se destina.
+        '''
+        message_type = message.message_type
+        sessions = self.sessions
+        if message_type == MessageType.CHANNEL_MESSAGE.value:
+            for client_id in list(self._channels.get(message.destination_id, ())):
+                if client_id in sessions:
+                    sessions[client_id].handle_message(message)
+        elif message_type == MessageType.CHANNEL_SUBSCRIBE.value or message_type == MessageType.CHANNEL_UNSUBSCRIBE.value:
+            # A confirmação leva o canal em destination_id: a sessão é a que fez o pedido mais antigo.
+            requests = self._channel_requests.get((message_type, message.text))
+            if not requests:
+                return
+            client_id = requests.popleft()
+            if not requests:
+                del self._channel_requests[(message_type, message.text)]
+            if message_type == MessageType.CHANNEL_SUBSCRIBE.value:
+                self._channels.setdefault(message.destination_id, set()).add(client_id)
+            else:
+                self._channels.get(message.destination_id, set()).discard(client_id)
+            if client_id in sessions:
+                sessions[client_id].handle_message(message)
+        elif message.destination_id == 0:
+            # Broadcasts e deltas de presença: uma cópia por endereço, entregue a todas as sessões do socket.
+            presence = message_type == MessageType.PRESENCE_DELTA.value
+            for client_id in list(self._members[index]):
+                session = sessions.get(client_id)
+                if session is not None and session.accepted and (not presence or session.presence_subscribed):
+                    session.handle_message(message)
+        else:
+            session = sessions.get(message.destination_id)
+            if session is not None:
+                session.handle_message(message)
+
+    def channel_request(self, session, message_type, name):
+        self._channel_requests.setdefault((message_type.value, name), deque()).append(session.client_id)
@@ -0,0 +1,74 @@
+import collections
+import threading
+
+from twotter.config import MESSAGE_HISTORY_SIZE
+
+
+class MessageHistory:
+    '''
+    Histórico limitado de mensagens recebidas. Guarda apenas as últimas
+    maxlen mensagens (buffer circular) e numera cada mensagem com um número
+    de sequência monotônico, que serve de cursor para ler apenas o que é novo.
+
+    Args:
+        maxlen (int): Número máximo de mensagens guardadas.
+
+    Attributes:
+        maxlen (int): Número máximo de mensagens guardadas.
+        next_seq (int): Número de sequência que a próxima mensagem receberá.
+    '''
+    def __init__(self, maxlen=MESSAGE_HISTORY_SIZE):
+        self.maxlen = maxlen
+        self.next_seq = 0
+        self._messages = collections.deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    @property
+    def first_seq(self):
+        '''
+        Número de sequência da mensagem mais antiga ainda guardada.
+        '''
+        return self.next_seq - len(self._messages)
+
+    def append(self, message):
+        '''
+        Adiciona uma mensagem, descartando a mais antiga se o histórico estiver cheio.
+
+        Returns:
+            int: O número de sequência atribuído à mensagem.
+        '''
+        with self._lock:
+            self._messages.append(message)
+            self.next_seq += 1
+            return self.next_seq - 1
+
+    def since(self, cursor):
+        '''
+        Retorna as mensagens com número de sequência maior ou igual a cursor que ainda estão no histórico.
+
+        Returns:
+            tuple: A lista de mensagens e o novo cursor (next_seq).
+        '''
+        with self._lock:
+            skip = max(0, cursor - self.first_seq)
+            messages = list(self._messages)[skip:] if skip < len(self._messages) else []
+            return messages, self.next_seq
+
+    def window(self, count, offset=0):
+        '''
+        Retorna até count mensagens, da mais antiga para a mais recente,
+        terminando offset mensagens antes da mais recente.
+        '''
+        with self._lock:
+            end = len(self._messages) - offset
+            if end <= 0:
+                return []
+            start = max(0, end - count)
+            return [self._messages[i] for i in range(start, end)]
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._messages))
@@ -25,4 +25,12 @@ class MessageType(Enum):
     BYE = 1
     MESSAGE = 2
     ERROR = 3
-    GET_ONLINE_CLIENTS = 4
\ No newline at end of file
+    GET_ONLINE_CLIENTS = 4
+    PRESENCE_SUBSCRIBE = 5
+    PRESENCE_DELTA = 6
+    PRESENCE_SNAPSHOT = 7
+    CHANNEL_SUBSCRIBE = 8
+    CHANNEL_UNSUBSCRIBE = 9
+    CHANNEL_MESSAGE = 10
+    CHANNEL_LIST = 11
+    KEEPALIVE = 12
\ No newline at end of file
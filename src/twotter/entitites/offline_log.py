@@ -0,0 +1,394 @@
+import mmap
+import os
+import struct
+import threading
+
+from twotter.utils import logger
+
+LOG_FILE_NAME = "messages.log"
+INDEX_FILE_NAME = "messages.idx"
+
+# Cabeçalho do log: marcador e geração (incrementada a cada compactação).
+LOG_HEADER = struct.Struct('!4sQ')
+LOG_MAGIC = b"TWLG"
+# Cada entrada do log: posição + 1 da entrada anterior do mesmo destinatário
+# (0 se não houver), destinatário e tamanho do registro v2 que vem em seguida.
+LOG_ENTRY = struct.Struct('!QIH')
+
+# Cabeçalho do índice: marcador, geração do log correspondente e número de slots em uso.
+INDEX_HEADER = struct.Struct('!4sQI')
+INDEX_MAGIC = b"TWIX"
+# Cada slot do índice: destinatário, mensagens pendentes, posição + 1 da
+# última entrada pendente e posição a partir da qual as entradas ainda não foram entregues.
+INDEX_SLOT = struct.Struct('!IIQQ')
+INITIAL_INDEX_SLOTS = 1024
+
+MAX_OFFLINE_MESSAGES_PER_CLIENT = 1000
+# Limites globais: destinatários com mensagens pendentes e bytes pendentes no log.
+MAX_OFFLINE_DESTINATIONS = 100_000
+MAX_OFFLINE_LIVE_BYTES = 256 << 20
+COMPACTION_MIN_SIZE = 1 << 20
+COMPACTION_GARBAGE_RATIO = 0.5
+
+
+class OfflineMessageLog:
+    '''
+    Log persistente das mensagens enviadas a clientes offline. As mensagens
+    são anexadas sequencialmente a um arquivo de log (um write bufferizado
+    por mensagem) e encadeadas por destinatário: cada entrada aponta para a
+    anterior do mesmo destinatário. Um índice em um arquivo mapeado em
+    memória (mmap) guarda, por destinatário, a última entrada pendente e o
+    número de mensagens, então entregar todas as mensagens de um cliente
+    não exige percorrer o log.
+
+    As entradas entregues viram lixo no log e são removidas por compact,
+    que reescreve o log e o índice com uma nova geração. Ao abrir, o log é
+    percorrido para descartar uma entrada final incompleta e reconstruir o
+    índice; se a geração do índice não for a do log (queda durante uma
+    compactação), todas as entradas do log são consideradas pendentes.
+
+    Args:
+        directory (str): Diretório em que o log e o índice são guardados.
+        max_per_client (int): Número máximo de mensagens pendentes por destinatário.
+        max_destinations (int): Número máximo de destinatários com mensagens pendentes.
+        max_live_bytes (int): Tamanho máximo das mensagens pendentes no log, em bytes.
+
+    Attributes:
+        stats (dict): Mensagens guardadas, entregues e recusadas, e número de compactações.
+    '''
+    def __init__(self, directory, max_per_client=MAX_OFFLINE_MESSAGES_PER_CLIENT,
+                 max_destinations=MAX_OFFLINE_DESTINATIONS, max_live_bytes=MAX_OFFLINE_LIVE_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.log_path = os.path.join(directory, LOG_FILE_NAME)
+        self.index_path = os.path.join(directory, INDEX_FILE_NAME)
+        self.max_per_client = max_per_client
+        self.max_destinations = max_destinations
+        self.max_live_bytes = max_live_bytes
+        self.stats = {"stored": 0, "delivered": 0, "rejected": 0, "compactions": 0}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._open()
+
+    def _open(self):
+        generation, entries, size = self._scan_log()
+        self._generation = generation
+        self._file = open(self.log_path, 'a+b')
+        self._size = size
+        floors = self._read_floors(generation)
+
+        # Os destinatários sem mensagens pendentes mantêm o slot, para não perder até onde já receberam.
+        slots = {destination_id: (0, 0, floor, 0) for destination_id, floor in floors.items()}
+        for offset, destination_id, entry_size in entries:
+            count, _, floor, live = slots.get(destination_id, (0, 0, 0, 0))
+            if offset >= floor:
+                slots[destination_id] = (count + 1, offset + 1, floor, live + entry_size)
+        self.live_bytes = sum(slot[3] for slot in slots.values())
+        self._write_index(self.index_path, generation,
+                          [(destination_id, count, tail, floor) for destination_id, (count, tail, floor, _) in slots.items()])
+        self._map_index()
+
+    def _scan_log(self):
+        '''
+        Percorre o log, criando-o se não existir e descartando uma entrada final incompleta.
+
+        Returns:
+            tuple: A geração, a lista de entradas (posição, destinatário, tamanho) e o tamanho válido do log.
+        '''
+        if not os.path.exists(self.log_path) or os.path.getsize(self.log_path) < LOG_HEADER.size:
+            with open(self.log_path, 'wb') as f:
+                f.write(LOG_HEADER.pack(LOG_MAGIC, 0))
+            return 0, [], LOG_HEADER.size
+
+        entries = []
+        with open(self.log_path, 'rb') as f:
+            magic, generation = LOG_HEADER.unpack(f.read(LOG_HEADER.size))
+            if magic != LOG_MAGIC:
+                raise ValueError(f"{self.log_path} não é um log de mensagens offline")
+            offset = LOG_HEADER.size
+            while True:
+                header = f.read(LOG_ENTRY.size)
+                if len(header) < LOG_ENTRY.size:
+                    break
+                _, destination_id, length = LOG_ENTRY.unpack(header)
+                if len(f.read(length)) < length:
+                    break
+                entries.append((offset, destination_id, LOG_ENTRY.size + length))
+                offset += LOG_ENTRY.size + length
+
+        if offset != os.path.getsize(self.log_path):
+            logger.warning("Descartando entrada incompleta no final de %s", self.log_path)
+            os.truncate(self.log_path, offset)
+        return generation, entries, offset
+
+    def _read_floors(self, generation):
+        '''
+        Lê do índice existente até onde cada destinatário já recebeu as suas mensagens.
+        '''
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return {}
+        if len(data) < INDEX_HEADER.size:
+            return {}
+        magic, index_generation, used = INDEX_HEADER.unpack_from(data)
+        if magic != INDEX_MAGIC or index_generation != generation or len(data) < INDEX_HEADER.size + used * INDEX_SLOT.size:
+            return {}
+        floors = {}
+        for slot in range(used):
+            destination_id, _, _, floor = INDEX_SLOT.unpack_from(data, INDEX_HEADER.size + slot * INDEX_SLOT.size)
+            floors[destination_id] = floor
+        return floors
+
+    @staticmethod
+    def _write_index(path, generation, slots, capacity=INITIAL_INDEX_SLOTS):
+        capacity = max(capacity, 2 * len(slots))
+        data = bytearray(INDEX_HEADER.size + capacity * INDEX_SLOT.size)
+        INDEX_HEADER.pack_into(data, 0, INDEX_MAGIC, generation, len(slots))
+        for position, slot in enumerate(slots):
+            INDEX_SLOT.pack_into(data, INDEX_HEADER.size + position * INDEX_SLOT.size, *slot)
+        with open(path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _map_index(self):
+        with open(self.index_path, 'r+b') as f:
+            self._index = mmap.mmap(f.fileno(), 0)
+        _, _, used = INDEX_HEADER.unpack_from(self._index)
+        self._capacity = (len(self._index) - INDEX_HEADER.size) // INDEX_SLOT.size
+        self._slots = {}
+        self._pending_destinations = 0
+        for slot in range(used):
+            destination_id, count, _, _ = INDEX_SLOT.unpack_from(self._index, self._slot_offset(slot))
+            self._slots[destination_id] = slot
+            self._pending_destinations += count > 0
+
+    @staticmethod
+    def _slot_offset(slot):
+        return INDEX_HEADER.size + slot * INDEX_SLOT.size
+
+    def _slot(self, destination_id):
+        slot = self._slots.get(destination_id)
+        if slot is not None:
+            return slot
+        slot = len(self._slots)
+        if slot == self._capacity:
+            self._grow_index()
+        self._slots[destination_id] = slot
+        INDEX_SLOT.pack_into(self._index, self._slot_offset(slot), destination_id, 0, 0, 0)
+        INDEX_HEADER.pack_into(self._index, 0, INDEX_MAGIC, self._generation, slot + 1)
+        return slot
+
+    def _grow_index(self):
+        self._index.flush()
+        self._index.close()
+        os.truncate(self.index_path, INDEX_HEADER.size + 2 * self._capacity * INDEX_SLOT.size)
+        self._map_index()
+
+    def append(self, destination_id, record):
+        '''
+        Guarda um registro v2 para um destinatário offline.
+
+        Returns:
+            bool: False se o destinatário já tem max_per_client mensagens pendentes,
+            ou se o log atingiu max_destinations destinatários ou max_live_bytes bytes pendentes.
+        '''
+        with self._lock:
+            slot = self._slots.get(destination_id)
+            count = 0 if slot is None else INDEX_SLOT.unpack_from(self._index, self._slot_offset(slot))[1]
+            entry_size = LOG_ENTRY.size + len(record)
+            if (count >= self.max_per_client or self.live_bytes + entry_size > self.max_live_bytes
+                    or (count == 0 and self._pending_destinations >= self.max_destinations)):
+                self.stats["rejected"] += 1
+                return False
+            # O slot só é criado para mensagens aceitas, para que IDs recusados não cresçam o índice.
+            slot_offset = self._slot_offset(self._slot(destination_id) if slot is None else slot)
+            _, count, tail, floor = INDEX_SLOT.unpack_from(self._index, slot_offset)
+            if count == 0:
+                self._pending_destinations += 1
+            offset = self._size
+            entry = LOG_ENTRY.pack(tail, destination_id, len(record)) + record
+            self._file.write(entry)
+            self._size += len(entry)
+            self.live_bytes += len(entry)
+            self._dirty = True
+            INDEX_SLOT.pack_into(self._index, slot_offset, destination_id, count + 1, offset + 1, floor)
+            self.stats["stored"] += 1
+            return True
+
+    def pending(self, destination_id):
+        '''
+        Número de mensagens pendentes para um destinatário.
+        '''
+        with self._lock:
+            slot = self._slots.get(destination_id)
+            if slot is None:
+                return 0
+            return INDEX_SLOT.unpack_from(self._index, self._slot_offset(slot))[1]
+
+    def destinations(self):
+        '''
+        Retorna os destinatários com mensagens pendentes.
+        '''
+        with self._lock:
+            return [destination_id for destination_id, slot in self._slots.items()
+                    if INDEX_SLOT.unpack_from(self._index, self._slot_offset(slot))[1]]
+
+    def _pending_entries(self, destination_id):
+        '''
+        Lê as entradas pendentes de um destinatário, da mais recente para a mais antiga.
+
+        Returns:
+            tuple: A posição do slot no índice e a lista de pares (posição, registro).
+        '''
+        slot = self._slots.get(destination_id)
+        if slot is None:
+            return None, []
+        slot_offset = self._slot_offset(slot)
+        _, count, tail, _ = INDEX_SLOT.unpack_from(self._index, slot_offset)
+        if count == 0:
+            return slot_offset, []
+        self._flush()
+        entries = []
+        fd = self._file.fileno()
+        pointer = tail
+        for _ in range(count):
+            offset = pointer - 1
+            pointer, _, length = LOG_ENTRY.unpack(os.pread(fd, LOG_ENTRY.size, offset))
+            entries.append((offset, os.pread(fd, length, offset + LOG_ENTRY.size)))
+        return slot_offset, entries
+
+    def take(self, destination_id):
+        '''
+        Retira todas as mensagens pendentes de um destinatário.
+
+        Returns:
+            list: Os registros v2, na ordem em que foram guardados.
+        '''
+        with self._lock:
+            slot_offset, entries = self._pending_entries(destination_id)
+            if not entries:
+                return []
+            self._release(destination_id, slot_offset, entries, len(entries))
+            return [record for _, record in reversed(entries)]
+
+    def peek(self, destination_id):
+        '''
+        Lê as mensagens pendentes de um destinatário sem retirá-las.
+
+        Returns:
+            list: Os registros v2, na ordem em que foram guardados.
+        '''
+        with self._lock:
+            return [record for _, record in reversed(self._pending_entries(destination_id)[1])]
+
+    def drop(self, destination_id, count):
+        '''
+        Retira as count mensagens pendentes mais antigas de um destinatário,
+        por exemplo depois que outro nó confirmou tê-las recebido.
+
+        Returns:
+            int: O número de mensagens retiradas.
+        '''
+        with self._lock:
+            slot_offset, entries = self._pending_entries(destination_id)
+            count = min(count, len(entries))
+            if count:
+                self._release(destination_id, slot_offset, entries, count)
+            return count
+
+    def _release(self, destination_id, slot_offset, entries, count):
+        kept = len(entries) - count
+        for _, record in entries[kept:]:
+            self.live_bytes -= LOG_ENTRY.size + len(record)
+        if kept:
+            # As entradas mantidas continuam encadeadas a partir da mais recente; o piso passa à mais antiga delas.
+            _, _, tail, _ = INDEX_SLOT.unpack_from(self._index, slot_offset)
+            INDEX_SLOT.pack_into(self._index, slot_offset, destination_id, kept, tail, entries[kept - 1][0])
+        else:
+            INDEX_SLOT.pack_into(self._index, slot_offset, destination_id, 0, 0, self._size)
+            self._pending_destinations -= 1
+        self.stats["delivered"] += count
+
+    def flush(self):
+        '''
+        Envia ao sistema operacional as entradas ainda no buffer do arquivo de log.
+        '''
+        if self._dirty:
+            with self._lock:
+                self._flush()
+
+    def _flush(self):
+        self._file.flush()
+        self._dirty = False
+
+    def should_compact(self):
+        '''
+        Se o log tem tamanho e proporção de entradas já entregues suficientes para compensar uma compactação.
+        '''
+        return self._size >= COMPACTION_MIN_SIZE and self.live_bytes < self._size * (1 - COMPACTION_GARBAGE_RATIO)
+
+    def compact(self):
+        '''
+        Reescreve o log apenas com as mensagens pendentes, e o índice correspondente, em uma nova geração.
+        '''
+        with self._lock:
+            self._flush()
+            generation = self._generation + 1
+            log_tmp = self.log_path + ".tmp"
+            index_tmp = self.index_path + ".tmp"
+            fd = self._file.fileno()
+
+            slots = []
+            with open(log_tmp, 'wb') as out:
+                out.write(LOG_HEADER.pack(LOG_MAGIC, generation))
+                position = LOG_HEADER.size
+                for destination_id, slot in self._slots.items():
+                    _, count, tail, _ = INDEX_SLOT.unpack_from(self._index, self._slot_offset(slot))
+                    if count == 0:
+                        continue
+                    records = []
+                    pointer = tail
+                    for _ in range(count):
+                        offset = pointer - 1
+                        pointer, _, length = LOG_ENTRY.unpack(os.pread(fd, LOG_ENTRY.size, offset))
+                        records.append(os.pread(fd, length, offset + LOG_ENTRY.size))
+                    previous = 0
+                    for record in reversed(records):
+                        out.write(LOG_ENTRY.pack(previous, destination_id, len(record)))
+                        out.write(record)
+                        previous = position + 1
+                        position += LOG_ENTRY.size + len(record)
+                    slots.append((destination_id, count, previous, 0))
+                out.flush()
+                os.fsync(out.fileno())
+            self._write_index(index_tmp, generation, slots)
+
+            # O log é trocado primeiro: se o processo cair entre as duas trocas,
+            # o índice antigo tem outra geração e é ignorado ao abrir.
+            self._file.close()
+            self._index.close()
+            os.replace(log_tmp, self.log_path)
+            os.replace(index_tmp, self.index_path)
+            self._generation = generation
+            self._file = open(self.log_path, 'a+b')
+            self._size = position
+            self.live_bytes = position - LOG_HEADER.size
+            self._map_index()
+            self.stats["compactions"] += 1
+
+    def maybe_compact(self):
+        '''
+        Compacta o log se should_compact indicar que vale a pena.
+        '''
+        if self.should_compact():
+            logger.info("Compactando o log de mensagens offline (%d bytes)", self._size)
+            self.compact()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._index.flush()
+            self._index.close()
+            self._file.close()
@@ -0,0 +1,108 @@
+import threading
+import time
+
+from twotter.utils import logger
+from twotter.utils.message_v2 import pack_records, MAX_DATAGRAM_SIZE
+from twotter.entitites.reliability import DATA_HEADER
+
+
+class CoalescingOutbox:
+    '''
+    Acumula os registros v2 destinados a clientes que negociaram o protocolo
+    v2 e os envia agrupados, com várias mensagens por datagrama, quando flush
+    é chamado (ao final de cada lote de datagramas recebidos).
+
+    Mensagens para um único cliente são agrupadas por endereço. Broadcasts
+    têm o mesmo conteúdo para todos os destinatários, então são agrupados uma
+    única vez e enviados pelo BroadcastFanout. Os clientes com entrega
+    confiável ficam de fora desse envio compartilhado, pois cada datagrama
+    leva a sua própria sequência: os broadcasts para eles devem ser
+    enfileirados com add, na ordem das demais mensagens.
+
+    Args:
+        sock (socket): O socket usado para os envios unicast.
+        fanout (BroadcastFanout): Usado para enviar os datagramas de broadcast.
+        max_datagram_size (int): Tamanho máximo de cada datagrama.
+        reliability (ReliabilityManager): Os canais confiáveis, se houver.
+
+    Attributes:
+        stats (dict): Número de registros e de datagramas enviados.
+    '''
+    def __init__(self, sock, fanout, max_datagram_size=MAX_DATAGRAM_SIZE, reliability=None):
+        self.sock = sock
+        self.fanout = fanout
+        self.max_datagram_size = max_datagram_size
+        self.reliability = reliability
+        self._pending = {}
+        self._broadcast = []
+        self._lock = threading.Lock()
+        self.stats = {"records": 0, "datagrams": 0, "send_errors": 0}
+
+    def add(self, address, record):
+        '''
+        Enfileira um registro para um endereço.
+        '''
+        with self._lock:
+            records = self._pending.get(address)
+            if records is None:
+                self._pending[address] = [record]
+            else:
+                records.append(record)
+
+    def broadcast(self, record):
+        '''
+        Enfileira um registro para todos os clientes v2.
+        '''
+        with self._lock:
+            self._broadcast.append(record)
+
+    def flush(self, broadcast_addresses):
+        '''
+        Envia todos os registros pendentes.
+
+        Args:
+            broadcast_addresses (callable): Retorna os endereços dos clientes v2, chamada apenas se houver broadcasts pendentes.
+        '''
+        reliability = self.reliability
+        with self._lock:
+            if not self._pending and not self._broadcast and not (reliability and reliability.active):
+                return
+            pending, self._pending = self._pending, {}
+            broadcast, self._broadcast = self._broadcast, []
+
+        addresses = ()
+        if broadcast:
+            addresses = tuple(broadcast_addresses())
+            if reliability and reliability.peers:
+                addresses = tuple(address for address in addresses if address not in reliability)
+
+        now = time.monotonic()
+        for address, records in pending.items():
+            self.stats["records"] += len(records)
+            if reliability and address in reliability:
+                for payload in pack_records(records, self.max_datagram_size - DATA_HEADER.size):
+                    datagram = reliability.send(address, payload, now)
+                    if datagram is not None:
+                        self._send(datagram, address)
+            else:
+                for datagram in pack_records(records, self.max_datagram_size):
+                    self._send(datagram, address)
+
+        if reliability:
+            for address, datagram in reliability.poll(now):
+                self._send(datagram, address)
+
+        if broadcast:
+            if addresses:
+                self.stats["records"] += len(broadcast) * len(addresses)
+                for datagram in pack_records(broadcast, self.max_datagram_size):
+                    if self.fanout.submit(datagram, addresses):
+                        self.stats["datagrams"] += len(addresses)
+
+    def _send(self, datagram, address):
+        try:
+            self.sock.sendto(datagram, address)
+            self.stats["datagrams"] += 1
+        except OSError as e:
+            self.stats["send_errors"] += 1
+            logger.error("Erro ao enviar mensagem para %s: %s", address, e)
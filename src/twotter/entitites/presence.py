@@ -0,0 +1,176 @@
+import threading
+
+from twotter.entitites import TwotterMessage, MessageType
+
+# Tamanho máximo do campo de texto de uma TwotterMessage.
+MAX_TEXT_LENGTH = 140
+# Texto do ERROR com que um servidor sem lista de presença (modo worker) recusa PRESENCE_SUBSCRIBE.
+PRESENCE_UNAVAILABLE_TEXT = "Lista de presença indisponível neste servidor."
+
+
+def format_delta(version, client_id, joined):
+    return f"{version} {'+' if joined else '-'}{client_id}"
+
+
+def parse_delta(text):
+    '''
+    Interpreta o texto de uma PRESENCE_DELTA.
+
+    Returns:
+        tuple: A versão, o ID do cliente e se o cliente entrou (True) ou saiu (False).
+    '''
+    version, change = text.split(" ", 1)
+    return int(version), int(change[1:]), change[0] == "+"
+
+
+def format_snapshot(version, client_ids):
+    '''
+    Divide a lista de clientes online em textos de PRESENCE_SNAPSHOT que cabem
+    no campo de texto de uma mensagem, no formato "<versão> <parte>/<total> id,id,...".
+    '''
+    ids = [str(client_id) for client_id in sorted(client_ids)]
+    budget = MAX_TEXT_LENGTH - len(f"{version} 99999/99999 ")
+    chunks = []
+    current = []
+    size = 0
+    for client_id in ids:
+        added = len(client_id) + (1 if current else 0)
+        if current and size + added > budget:
+            chunks.append(current)
+            current, size = [], 0
+            added = len(client_id)
+        current.append(client_id)
+        size += added
+    chunks.append(current)
+    total = len(chunks)
+    return [f"{version} {part}/{total} {','.join(chunk)}" for part, chunk in enumerate(chunks, 1)]
+
+
+def parse_snapshot(text):
+    '''
+    Interpreta o texto de uma PRESENCE_SNAPSHOT.
+
+    Returns:
+        tuple: A versão, o número da parte, o total de partes e a lista de IDs da parte.
+    '''
+    version, parts, ids = (text.split(" ", 2) + [""])[:3]
+    part, total = parts.split("/")
+    return int(version), int(part), int(total), [int(client_id) for client_id in ids.split(",") if client_id]
+
+
+class PresenceTracker:
+    '''
+    Lado servidor da assinatura de presença. Mantém a versão da lista de
+    clientes online, incrementada a cada entrada ou saída, e o conjunto de
+    clientes inscritos, que recebem as variações (deltas) em vez de consultar
+    a lista inteira com GET_ONLINE_CLIENTS.
+
+    Args:
+        server_name (str): O nome de usuário usado nas mensagens do servidor.
+
+    Attributes:
+        version (int): A versão atual da lista de clientes online.
+        subscribers (set): IDs dos clientes inscritos.
+    '''
+    def __init__(self, server_name):
+        self.server_name = server_name
+        self.version = 0
+        self.subscribers = set()
+
+    def changed(self, client_id, joined):
+        '''
+        Registra a entrada ou saída de um cliente.
+
+        Returns:
+            TwotterMessage: A PRESENCE_DELTA a ser enviada aos inscritos.
+        '''
+        self.version += 1
+        if not joined:
+            self.subscribers.discard(client_id)
+        return TwotterMessage(MessageType.PRESENCE_DELTA, client_id, 0, self.server_name,
+                              format_delta(self.version, client_id, joined))
+
+    def snapshot_messages(self, client_ids, destination_id):
+        '''
+        Monta as mensagens PRESENCE_SNAPSHOT com a lista completa de clientes online.
+        '''
+        return [TwotterMessage(MessageType.PRESENCE_SNAPSHOT, 0, destination_id, self.server_name, text)
+                for text in format_snapshot(self.version, client_ids)]
+
+
+class Roster:
+    '''
+    Lado cliente da assinatura de presença: a lista de clientes online em
+    cache, atualizada pelos deltas do servidor. Um delta fora de sequência
+    indica que algo foi perdido, e a lista precisa ser ressincronizada.
+
+    Attributes:
+        version (int): A versão da lista em cache.
+        synced (bool): Se a lista em cache está completa e atualizada.
+    '''
+    def __init__(self):
+        self.version = 0
+        self.synced = False
+        self._members = set()
+        self._parts = {}
+        self._pending_deltas = []
+        self._lock = threading.Lock()
+
+    def reset(self):
+        '''
+        Descarta o estado sincronizado, à espera de um novo snapshot.
+        '''
+        with self._lock:
+            self.synced = False
+            self._parts = {}
+            self._pending_deltas = []
+
+    def apply_delta(self, version, client_id, joined):
+        '''
+        Aplica um delta de presença.
+
+        Returns:
+            bool: False se houve perda de deltas e a lista precisa ser ressincronizada.
+        '''
+        with self._lock:
+            if not self.synced:
+                self._pending_deltas.append((version, client_id, joined))
+                return True
+            if version <= self.version:
+                return True
+            if version != self.version + 1:
+                self.synced = False
+                self._parts = {}
+                return False
+            self._apply(version, client_id, joined)
+            return True
+
+    def apply_snapshot(self, version, part, total, client_ids):
+        '''
+        Aplica uma parte de um snapshot. Quando todas as partes de uma versão
+        chegam, a lista é substituída e os deltas recebidos enquanto isso são aplicados.
+        '''
+        with self._lock:
+            parts = self._parts.setdefault(version, {})
+            parts[part] = client_ids
+            if len(parts) < total:
+                return
+            self._members = {client_id for ids in parts.values() for client_id in ids}
+            self.version = version
+            self.synced = True
+            self._parts = {}
+            pending, self._pending_deltas = sorted(self._pending_deltas), []
+            for delta in pending:
+                if delta[0] == self.version + 1:
+                    self._apply(*delta)
+
+    def _apply(self, version, client_id, joined):
+        if joined:
+            self._members.add(client_id)
+        else:
+            self._members.discard(client_id)
+        self.version = version
+
+    def members(self):
+        with self._lock:
+            return sorted(self._members)
@@ -0,0 +1,181 @@
+import array
+import threading
+from collections import namedtuple
+
+# Capacidade anunciada no HELLO por um gateway que registra vários client_ids no mesmo endereço.
+MUX_FEATURE = "mux"
+# Número máximo de client_ids que um mesmo endereço pode registrar com "mux".
+MAX_SESSIONS_PER_ADDRESS = 1024
+
+ClientSnapshot = namedtuple("ClientSnapshot", ["ids", "addresses", "endpoints"])
+ClientSnapshot.__doc__ = '''
+Cópia imutável dos clientes conectados em um instante: IDs e endereços, na
+mesma ordem, e os endereços distintos (um gateway recebe um só broadcast por endereço).
+'''
+
+_EMPTY_SNAPSHOT = ClientSnapshot((), (), ())
+
+
+def build_snapshot(ids, addresses):
+    addresses = tuple(addresses)
+    return ClientSnapshot(tuple(ids), addresses, tuple(dict.fromkeys(addresses)))
+
+
+class ClientRegistry:
+    '''
+    Registro dos clientes conectados ao servidor. Substitui os dicionários
+    paralelos de endereços e de instantes do último contato por uma única
+    estrutura:
+
+    - os clientes ocupam slots em colunas compactas (IDs e instantes em
+      arrays, endereços em uma lista), reaproveitados quando um cliente sai;
+    - um índice reverso endereço -> client_ids, em O(1), identifica as
+      sessões de um endereço (um gateway registra vários client_ids no mesmo
+      endereço), e verify confere o remetente de cada pacote com o endereço
+      registrado, rejeitando origin_id forjados;
+    - snapshot() retorna uma cópia imutável (copy-on-write) dos IDs e
+      endereços, refeita apenas depois de uma entrada ou saída, para que o
+      broadcast e a lista de clientes online não copiem o registro a cada
+      mensagem nem bloqueiem as escritas.
+
+    As escritas são serializadas por um lock; as leituras não usam lock.
+
+    Attributes:
+        version (int): Incrementado a cada entrada ou saída de cliente.
+    '''
+    def __init__(self):
+        self.version = 0
+        self._slots = {}
+        self._by_address = {}
+        self._free = []
+        self._ids = array.array('I')
+        self._times = array.array('d')
+        self._addresses = []
+        self._snapshot = _EMPTY_SNAPSHOT
+        self._lock = threading.Lock()
+
+    def add(self, client_id, address, now):
+        '''
+        Registra um cliente.
+
+        Returns:
+            bool: False se o client_id já está registrado.
+        '''
+        with self._lock:
+            if client_id in self._slots:
+                return False
+            if self._free:
+                slot = self._free.pop()
+                self._ids[slot] = client_id
+                self._times[slot] = now
+                self._addresses[slot] = address
+            else:
+                slot = len(self._addresses)
+                self._ids.append(client_id)
+                self._times.append(now)
+                self._addresses.append(address)
+            self._slots[client_id] = slot
+            self._by_address.setdefault(address, set()).add(client_id)
+            self._changed()
+            return True
+
+    def remove(self, client_id):
+        '''
+        Remove um cliente.
+
+        Returns:
+            tuple: O endereço do cliente, ou None se ele não estava registrado.
+        '''
+        with self._lock:
+            slot = self._slots.pop(client_id, None)
+            if slot is None:
+                return None
+            address = self._addresses[slot]
+            self._addresses[slot] = None
+            ids = self._by_address[address]
+            ids.discard(client_id)
+            if not ids:
+                del self._by_address[address]
+            self._free.append(slot)
+            self._changed()
+            return address
+
+    def _changed(self):
+        self.version += 1
+        self._snapshot = None
+
+    def touch(self, client_id, now):
+        '''
+        Registra o último contato de um cliente. Ignora clientes não registrados.
+        '''
+        slot = self._slots.get(client_id)
+        if slot is not None:
+            self._times[slot] = now
+
+    def last_seen(self, client_id):
+        '''
+        Instante do último contato de um cliente, ou None se ele não está registrado.
+        '''
+        slot = self._slots.get(client_id)
+        return self._times[slot] if slot is not None else None
+
+    def get(self, client_id, default=None):
+        slot = self._slots.get(client_id)
+        return self._addresses[slot] if slot is not None else default
+
+    def client_ids_at(self, address):
+        '''
+        IDs dos clientes registrados em um endereço.
+        '''
+        return tuple(self._by_address.get(address, ()))
+
+    def has_sessions(self, address):
+        '''
+        Indica se há clientes registrados em um endereço.
+        '''
+        return address in self._by_address
+
+    def has_local_sessions(self, address):
+        '''
+        Indica se há clientes registrados em um endereço por este processo.
+        Com um único processo, equivale a has_sessions.
+        '''
+        return address in self._by_address
+
+    def verify(self, client_id, address):
+        '''
+        Verifica se client_id está registrado e se o pacote veio do seu endereço.
+        '''
+        slot = self._slots.get(client_id)
+        return slot is not None and self._addresses[slot] == address
+
+    def snapshot(self):
+        '''
+        Retorna a cópia imutável atual dos clientes conectados.
+
+        Returns:
+            ClientSnapshot: Os IDs e endereços dos clientes.
+        '''
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None:
+                    ids = tuple(self._slots)
+                    slots = self._slots
+                    addresses = self._addresses
+                    snapshot = build_snapshot(ids, (addresses[slots[client_id]] for client_id in ids))
+                    self._snapshot = snapshot
+        return snapshot
+
+    def __getitem__(self, client_id):
+        return self._addresses[self._slots[client_id]]
+
+    def __contains__(self, client_id):
+        return client_id in self._slots
+
+    def __iter__(self):
+        return iter(self.snapshot().ids)
+
+    def __len__(self):
+        return len(self._slots)
@@ -0,0 +1,409 @@
+import threading
+import struct
+from collections import namedtuple
+
+# Capacidade anunciada no texto do HELLO, junto com "v2", para ativar a entrega confiável.
+REL_FEATURE = "rel"
+# Texto do ERROR com que o servidor avisa que encerrou o canal confiável: o cliente refaz o HELLO com um novo canal.
+CHANNEL_RESET_TEXT = "Canal confiável reiniciado, envie HELLO novamente."
+# Marcadores do primeiro byte dos datagramas confiáveis (os datagramas v2 começam com 0xF2).
+REL_DATA = 0xF3
+REL_ACK = 0xF4
+# Datagrama de dados: marcador, sequência, ACK cumulativo e bitmap de ACKs seletivos.
+DATA_HEADER = struct.Struct('!BIII')
+# ACK puro: marcador, ACK cumulativo e bitmap de ACKs seletivos.
+ACK_HEADER = struct.Struct('!BII')
+SACK_BITS = 32
+
+INITIAL_RTO_IN_SECONDS = 1.0
+MIN_RTO_IN_SECONDS = 0.2
+MAX_RTO_IN_SECONDS = 10.0
+# Intervalo com que os temporizadores de retransmissão são verificados enquanto há dados em trânsito.
+RETRANSMIT_TICK_IN_SECONDS = 0.05
+# Atraso máximo de um ACK puro: os datagramas recebidos nesse intervalo são confirmados juntos,
+# ou de carona em um datagrama de dados. Bem abaixo de MIN_RTO_IN_SECONDS, para não causar retransmissões.
+ACK_DELAY_IN_SECONDS = 0.05
+# Datagramas recebidos sem confirmação a partir dos quais o ACK puro não espera o atraso.
+ACK_EVERY = 16
+# Número de datagramas posteriores confirmados que dispara a retransmissão rápida de um buraco.
+FAST_RETRANSMIT_THRESHOLD = 3
+MAX_RETRANSMISSIONS = 8
+DEFAULT_WINDOW = 64
+RECEIVE_WINDOW = 256
+
+PeerState = namedtuple("PeerState", ["next_seq", "expected", "unacked", "backlog", "out_of_order"])
+PeerState.__doc__ = '''
+Estado de um ReliablePeer necessário para continuar o canal em outro
+processo: as sequências, os payloads não confirmados (por sequência), a fila
+de envio e os payloads recebidos fora de ordem (por sequência).
+'''
+
+
+class ReliablePeer:
+    '''
+    Estado da entrega confiável e ordenada com um único par. Cada datagrama
+    recebe um número de sequência; o receptor confirma com um ACK cumulativo
+    (todas as sequências menores foram recebidas) e um bitmap de ACKs
+    seletivos para as 32 sequências seguintes, e entrega os datagramas na ordem.
+
+    No envio, no máximo window datagramas ficam sem confirmação; o restante
+    espera em uma fila. Os ACKs vão de carona nos datagramas de dados; um ACK
+    puro só é enviado em poll, quando não houve dados para o par durante
+    ACK_DELAY_IN_SECONDS (ou ACK_EVERY datagramas), então sem perdas uma
+    rajada de mensagens custa um único ACK. Duplicados e datagramas fora de
+    ordem são confirmados no próximo poll, para apressar a retransmissão. O
+    tempo de retransmissão segue a RFC 6298 (SRTT, RTTVAR, backoff exponencial
+    e algoritmo de Karn), e um buraco confirmado seletivamente por 3 datagramas
+    posteriores é retransmitido imediatamente.
+
+    Args:
+        window (int): Número máximo de datagramas enviados e ainda não confirmados.
+        expected (int): Sequência do próximo datagrama esperado do par.
+
+    Attributes:
+        rto (float): O tempo atual de retransmissão, em segundos.
+        srtt (float): A estimativa suavizada do RTT, em segundos.
+        failed (bool): Se o par deixou de responder após MAX_RETRANSMISSIONS tentativas. O canal
+            então para de enviar, e os payloads não confirmados ficam em pending, para um novo canal.
+        stats (dict): Contadores de datagramas enviados, retransmitidos, duplicados e fora de ordem.
+    '''
+    def __init__(self, window=DEFAULT_WINDOW, expected=0):
+        self.window = window
+        self.next_seq = 0
+        self.expected = expected
+        self.rto = INITIAL_RTO_IN_SECONDS
+        self.srtt = None
+        self.rttvar = 0.0
+        self.failed = False
+        self.ack_pending = False
+        self._ack_due = 0.0
+        self._received = 0
+        self._unacked = {}  # sequência -> [payload, enviado em, retransmitido, prazo, tentativas]
+        self._backlog = []
+        self._out_of_order = {}
+        self._lock = threading.Lock()
+        self.stats = {"sent": 0, "retransmitted": 0, "fast_retransmitted": 0, "duplicates": 0,
+                      "out_of_order": 0, "acks_sent": 0}
+
+    @property
+    def busy(self):
+        '''
+        Se há dados em trânsito, na fila ou um ACK a enviar.
+        '''
+        return not self.failed and bool(self._unacked or self._backlog or self.ack_pending)
+
+    def _ack_fields(self):
+        sack = 0
+        if self._out_of_order:
+            base = self.expected + 1
+            for seq in self._out_of_order:
+                bit = seq - base
+                if 0 <= bit < SACK_BITS:
+                    sack |= 1 << bit
+        return self.expected, sack
+
+    def _data_datagram(self, seq, payload):
+        ack, sack = self._ack_fields()
+        self.ack_pending = False
+        self._received = 0
+        return DATA_HEADER.pack(REL_DATA, seq, ack, sack) + payload
+
+    def send(self, payload, now):
+        '''
+        Numera um payload para envio.
+
+        Returns:
+            bytes | None: O datagrama a ser enviado, ou None se a janela estiver cheia
+            e o payload ficou na fila (ele será enviado por poll).
+        '''
+        with self._lock:
+            if self.failed or self._backlog or len(self._unacked) >= self.window:
+                self._backlog.append(payload)
+                return None
+            return self._send(payload, now)
+
+    def _send(self, payload, now):
+        seq = self.next_seq
+        self.next_seq += 1
+        self._unacked[seq] = [payload, now, False, now + self.rto, 0]
+        self.stats["sent"] += 1
+        return self._data_datagram(seq, payload)
+
+    def receive(self, datagram, now):
+        '''
+        Processa um datagrama confiável recebido do par.
+
+        Returns:
+            list: Os payloads que podem ser entregues, na ordem.
+        '''
+        with self._lock:
+            if datagram[0] == REL_ACK:
+                _, ack, sack = ACK_HEADER.unpack_from(datagram)
+                self._process_ack(ack, sack, now)
+                return []
+
+            _, seq, ack, sack = DATA_HEADER.unpack_from(datagram)
+            self._process_ack(ack, sack, now)
+            if not self.ack_pending:
+                self.ack_pending = True
+                self._ack_due = now + ACK_DELAY_IN_SECONDS
+            self._received += 1
+            if seq < self.expected or seq in self._out_of_order:
+                # O par retransmitiu: o ACK anterior se perdeu.
+                self._ack_due = now
+                self.stats["duplicates"] += 1
+                return []
+            if seq >= self.expected + RECEIVE_WINDOW:
+                return []
+
+            payload = datagram[DATA_HEADER.size:]
+            if seq != self.expected:
+                self._ack_due = now
+                self.stats["out_of_order"] += 1
+                self._out_of_order[seq] = payload
+                return []
+
+            delivered = [payload]
+            self.expected += 1
+            while self.expected in self._out_of_order:
+                delivered.append(self._out_of_order.pop(self.expected))
+                self.expected += 1
+            return delivered
+
+    def _process_ack(self, ack, sack, now):
+        unacked = self._unacked
+        if not unacked:
+            return
+        acked = [seq for seq in unacked if seq < ack]
+        sacked = 0
+        for bit in range(SACK_BITS):
+            if sack >> bit & 1:
+                sacked += 1
+                if ack + 1 + bit in unacked:
+                    acked.append(ack + 1 + bit)
+
+        for seq in acked:
+            _, sent_at, retransmitted, _, _ = unacked.pop(seq)
+            if not retransmitted:
+                self._sample_rtt(now - sent_at)
+
+        hole = unacked.get(ack)
+        if hole is not None and sacked >= FAST_RETRANSMIT_THRESHOLD and not hole[2]:
+            # Marca o buraco para ser retransmitido no próximo poll.
+            hole[3] = now
+            hole[2] = True
+            self.stats["fast_retransmitted"] += 1
+
+    def _sample_rtt(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(MAX_RTO_IN_SECONDS, max(MIN_RTO_IN_SECONDS, self.srtt + 4 * self.rttvar))
+
+    def poll(self, now):
+        '''
+        Retorna os datagramas que precisam ser enviados agora: retransmissões
+        vencidas, payloads que cabem na janela e, se nenhum dado foi enviado e
+        o atraso do ACK venceu, um ACK puro.
+
+        Returns:
+            list: Os datagramas a enviar.
+        '''
+        with self._lock:
+            datagrams = []
+            if self.failed:
+                return datagrams
+            for seq, entry in self._unacked.items():
+                if entry[3] > now:
+                    continue
+                entry[4] += 1
+                if entry[4] > MAX_RETRANSMISSIONS:
+                    self._give_up()
+                    return datagrams
+                if entry[1] + self.rto <= now:
+                    # Retransmissão por tempo: backoff exponencial.
+                    self.rto = min(MAX_RTO_IN_SECONDS, self.rto * 2)
+                entry[1] = now
+                entry[2] = True
+                entry[3] = now + self.rto
+                self.stats["retransmitted"] += 1
+                datagrams.append(self._data_datagram(seq, entry[0]))
+
+            while self._backlog and len(self._unacked) < self.window:
+                datagrams.append(self._send(self._backlog.pop(0), now))
+
+            if self.ack_pending and (now >= self._ack_due or self._received >= ACK_EVERY):
+                ack, sack = self._ack_fields()
+                self.ack_pending = False
+                self._received = 0
+                self.stats["acks_sent"] += 1
+                datagrams.append(ACK_HEADER.pack(REL_ACK, ack, sack))
+            return datagrams
+
+    def _give_up(self):
+        self.failed = True
+        self._backlog[:0] = [entry[0] for _, entry in sorted(self._unacked.items())]
+        self._unacked.clear()
+
+    def pending(self):
+        '''
+        Retorna os payloads ainda não confirmados pelo par, na ordem de envio.
+        '''
+        with self._lock:
+            return [entry[0] for _, entry in sorted(self._unacked.items())] + self._backlog
+
+    def export_state(self):
+        '''
+        Retorna o estado do canal, para que ele continue em outro processo (veja restore_state).
+
+        Returns:
+            PeerState: As sequências e os payloads pendentes.
+        '''
+        with self._lock:
+            return PeerState(self.next_seq, self.expected, {seq: entry[0] for seq, entry in self._unacked.items()},
+                             list(self._backlog), dict(self._out_of_order))
+
+    def restore_state(self, state, now):
+        '''
+        Continua um canal exportado por export_state. Os payloads não
+        confirmados são retransmitidos no próximo poll, sem amostrar o RTT.
+        '''
+        with self._lock:
+            self.next_seq = state.next_seq
+            self.expected = state.expected
+            self._unacked = {seq: [payload, now, True, now, 0] for seq, payload in sorted(state.unacked.items())}
+            self._backlog = list(state.backlog)
+            self._out_of_order = dict(state.out_of_order)
+
+
+class ReliabilityManager:
+    '''
+    Mantém um ReliablePeer por endereço, para os clientes que negociaram a
+    entrega confiável, e acompanha quais deles têm algo pendente e quais
+    falharam (veja take_failed).
+
+    Attributes:
+        peers (dict): O ReliablePeer de cada endereço.
+    '''
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self.peers = {}
+        self._active = set()
+        self._failed = []
+        self._failures = 0
+
+    def __contains__(self, address):
+        return address in self.peers
+
+    @property
+    def active(self):
+        '''
+        Se algum par tem dados em trânsito, na fila ou um ACK a enviar.
+        '''
+        return bool(self._active)
+
+    def open(self, address):
+        '''
+        Inicia um novo canal confiável com um endereço, descartando o anterior.
+        '''
+        self.peers[address] = ReliablePeer(self.window)
+        self._active.discard(address)
+
+    def reopen(self, address):
+        '''
+        Inicia um novo canal com um endereço, como open, quando o par também
+        recomeça o seu lado. Os payloads ainda não confirmados no canal
+        anterior são reenviados pelo novo, na ordem.
+        '''
+        previous = self.peers.get(address)
+        self.open(address)
+        pending = previous.pending() if previous is not None else None
+        if pending:
+            self.restore(address, PeerState(0, 0, {}, pending, {}), 0.0)
+
+    def close(self, address):
+        self.peers.pop(address, None)
+        self._active.discard(address)
+
+    def restore(self, address, state, now):
+        '''
+        Recria o canal de um endereço a partir de um PeerState.
+        '''
+        peer = self.peers[address] = ReliablePeer(self.window)
+        peer.restore_state(state, now)
+        if peer.busy:
+            self._active.add(address)
+
+    def send(self, address, payload, now):
+        '''
+        Numera um payload para um endereço.
+
+        Returns:
+            bytes | None: O datagrama a ser enviado, ou None se ele ficou na fila.
+        '''
+        peer = self.peers[address]
+        self._active.add(address)
+        return peer.send(payload, now)
+
+    def receive(self, address, datagram, now, accept=False):
+        '''
+        Processa um datagrama confiável. Os canais dos clientes são abertos
+        apenas por open (no HELLO) ou restore; datagramas de um endereço sem
+        canal são descartados, para que uma origem forjada não crie canais. Com
+        accept (um nó conhecido da federação, por exemplo depois de um reinício
+        deste servidor), o canal é aberto na sequência recebida.
+
+        Returns:
+            list: Os payloads que podem ser entregues, na ordem.
+        '''
+        peer = self.peers.get(address)
+        if peer is None:
+            if not accept or datagram[0] != REL_DATA:
+                return []
+            peer = self.peers[address] = ReliablePeer(self.window, expected=DATA_HEADER.unpack_from(datagram)[1])
+        self._active.add(address)
+        return peer.receive(datagram, now)
+
+    def poll(self, now):
+        '''
+        Coleta os datagramas pendentes de todos os pares ativos.
+
+        Returns:
+            list: Pares (endereço, datagrama) a enviar.
+        '''
+        datagrams = []
+        for address in list(self._active):
+            peer = self.peers.get(address)
+            if peer is None:
+                self._active.discard(address)
+                continue
+            failed = peer.failed
+            for datagram in peer.poll(now):
+                datagrams.append((address, datagram))
+            if peer.failed and not failed:
+                self._failed.append(address)
+                self._failures += 1
+            if not peer.busy:
+                self._active.discard(address)
+        return datagrams
+
+    def take_failed(self):
+        '''
+        Retorna os endereços cujos canais falharam desde a última chamada. O
+        canal falho continua registrado até ser fechado ou reaberto.
+        '''
+        failed, self._failed = self._failed, []
+        return failed
+
+    def stats(self):
+        '''
+        Soma os contadores de todos os pares.
+        '''
+        totals = {"peers": len(self.peers), "failed": self._failures}
+        for peer in list(self.peers.values()):
+            for key, value in peer.stats.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
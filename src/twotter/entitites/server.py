@@ -1,118 +1,708 @@
-import threading
 import socket
 import select
 import time
 
 from twotter.entitites import TwotterMessage, MessageType
-from twotter.utils import encode_message, decode_message, logger
+from twotter.entitites.fanout import BroadcastFanout
+from twotter.entitites.presence import PresenceTracker, PRESENCE_UNAVAILABLE_TEXT
+from twotter.entitites.channels import ChannelIndex, channel_id
+from twotter.entitites.registry import ClientRegistry, MUX_FEATURE, MAX_SESSIONS_PER_ADDRESS
+from twotter.entitites.outbox import CoalescingOutbox
+from twotter.entitites.offline_log import OfflineMessageLog
+from twotter.entitites.admission import AdmissionController, REJECTION_TEXTS
+from twotter.entitites.federation import Federation, FED_MAGIC, FED_PREFIX
+from twotter.entitites.warm_restart import (SnapshotWriter, HandoverListener, SNAPSHOT_INTERVAL_IN_SECONDS,
+                                            restore_snapshot, hand_over)
+from twotter.entitites.reliability import (ReliabilityManager, REL_FEATURE, REL_DATA, REL_ACK, DATA_HEADER,
+                                           RETRANSMIT_TICK_IN_SECONDS, CHANNEL_RESET_TEXT)
+from twotter.utils import encode_message_into, decode_message_lazy, logger, message_log, configure_logging, MESSAGE_SIZE
+from twotter.utils.message_v2 import (V2_PREFIX, V2_FEATURE, MAX_DATAGRAM_SIZE, encode_record, decode_records,
+                                      parse_features, pack_records, to_v1_frame, to_v2_record)
+from twotter.utils.timing_wheel import TimingWheel
+from twotter.utils.metrics import ServerMetrics, MetricsDumper, socket_receive_backlog
+from twotter.utils.trace import TraceWriter
+from twotter.utils.scheduler import Scheduler
 from twotter.config import SERVER_ADDRESS
 
 SERVER_NAME = "assistant"
 CLIENT_TIMEOUT_IN_SECONDS = 300
+STATUS_INTERVAL_IN_SECONDS = 60
+RECEIVE_BUFFER_SIZE = 2048
+MAX_DATAGRAMS_PER_BATCH = 256
+# Com MSG_DONTWAIT o loop com threads também consegue drenar vários datagramas por iteração.
+_RECV_FLAGS = getattr(socket, "MSG_DONTWAIT", 0)
 
 class TwotterServer:
     '''
     Classe que representa um servidor UDP que gerencia a comunicação entre clientes.
 
     Args:
-        host (str): O endereço do servidor.
-        port (int): A porta do servidor.
+        address (tuple): O endereço (host, porta) em que o servidor escuta.
+        reuse_port (bool): Habilita SO_REUSEPORT, permitindo que vários processos escutem na mesma porta.
+        max_batch (int): Número máximo de datagramas drenados por iteração do loop de recepção.
+        sock (socket): Um socket UDP já associado, recebido de outro processo em um handover. Se omitido, um novo socket é criado.
 
     Attributes:
-        host (str): O endereço do servidor.
-        port (int): A porta do servidor.
+        address (tuple): O endereço (host, porta) em que o servidor escuta.
         sock (socket): O socket utilizado para comunicação.
-        clients (dict): Dicionário que mapeia IDs de clientes para seus endereços.
+        clients (ClientRegistry): Os clientes conectados, com seus endereços e o instante do último contato.
+        expiry (TimingWheel): Roda de temporização usada para expirar clientes inativos.
+        fanout (BroadcastFanout): Envia os broadcasts em lotes, fora da thread de recepção.
+        v2_addresses (set): Endereços dos clientes que negociaram o protocolo v2.
+        outbox (CoalescingOutbox): Agrupa as mensagens para clientes v2 em datagramas com várias mensagens.
+        reliability (ReliabilityManager): Os canais de entrega confiável dos clientes que a negociaram.
+        metrics (ServerMetrics): Contadores, histogramas e gauges do servidor.
+        presence (PresenceTracker): Versão da lista de clientes online e clientes inscritos para receber seus deltas.
+        presence_enabled (bool): Se o servidor aceita inscrições de presença. Desativado nos workers, em que o
+            PresenceTracker de cada processo só vê as entradas e saídas tratadas por ele.
+        channels (ChannelIndex): Os canais e os endereços dos seus membros.
+        channels_enabled (bool): Se o servidor aceita inscrições em canais. Desativado nos workers, em que o
+            ChannelIndex de cada processo só conhece os membros que se inscreveram por ele.
+        periodic_tasks (bool): Se o servidor envia a mensagem de status periódica.
+        scheduler (Scheduler): Executa as tarefas periódicas no loop de recepção, com jitter e envios cadenciados.
+        admission (AdmissionController): Limita a taxa de cada cliente e descarta mensagens de baixa prioridade sob sobrecarga.
+        max_sessions_per_address (int): Número máximo de client_ids registrados por um mesmo endereço com "mux".
+        receive_backlog (int): Datagramas processados seguidos sem esvaziar a fila do socket.
+        federation (Federation): A federação com outros nós, se habilitada por enable_federation.
+        offline_log (OfflineMessageLog): Guarda as mensagens para clientes offline, se habilitado por enable_offline_log.
+        snapshots (SnapshotWriter): Grava periodicamente o estado dos clientes, se habilitado por enable_snapshots.
+        handover (HandoverListener): Atende aos pedidos de handover, se habilitado por enable_handover.
+        handed_over (bool): Se o socket já foi entregue a um novo processo.
+        trace (TraceWriter): Grava os datagramas recebidos, se habilitado por enable_trace.
     '''
-    def __init__(self):
-        self.clients = {}
-        self.clients_times = {}
+    def __init__(self, address=SERVER_ADDRESS, reuse_port=False, max_batch=MAX_DATAGRAMS_PER_BATCH, sock=None):
+        self.address = address
+        self.reuse_port = reuse_port
+        self.max_batch = max_batch
+        self.last_batch_size = 0
+        self.clients = ClientRegistry()
+        self.expiry = TimingWheel(CLIENT_TIMEOUT_IN_SECONDS, now=time.time())
+        self.presence = PresenceTracker(SERVER_NAME)
+        self.presence_enabled = True
+        self.channels = ChannelIndex(SERVER_NAME)
+        self.channels_enabled = True
+        self._online_clients_text = (None, '')
+        self.periodic_tasks = True
+        self.scheduler = Scheduler()
+        self._jobs_scheduled = False
+        self.offline_log = None
+        self._offline_deliveries = {}
+        self.federation = None
+        self.snapshots = None
+        self.trace = None
+        self.handover = None
+        self.handed_over = False
+        self._handover_request = None
+        self.admission = AdmissionController()
+        self.max_sessions_per_address = MAX_SESSIONS_PER_ADDRESS
+        self.receive_backlog = 0
 
         self.start_time = time.time()
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.bind(SERVER_ADDRESS)
-        logger.info("Servidor iniciado, aguardando mensagens...")
+        self.sock = sock if sock is not None else self.create_socket()
+        self.fanout = BroadcastFanout(self.sock)
+        self.v2_addresses = set()
+        self.reliability = ReliabilityManager()
+        self.outbox = CoalescingOutbox(self.sock, self.fanout, reliability=self.reliability)
+        self._reply_buffer = bytearray(MESSAGE_SIZE)
+        self.metrics = ServerMetrics()
+        self.register_gauges()
+
+    def create_socket(self):
+        '''
+        Cria o socket UDP do servidor e o associa ao endereço configurado.
+
+        Returns:
+            socket: O socket associado ao endereço do servidor.
+        '''
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(self.address)
+        return sock
+
+    def register_gauges(self):
+        '''
+        Registra os gauges do servidor nas métricas. São avaliados apenas na exportação.
+        '''
+        self.metrics.add_gauge("clients", lambda: len(self.clients))
+        self.metrics.add_gauge("presence_subscribers", lambda: len(self.presence.subscribers))
+        self.metrics.add_gauge("channels", lambda: len(self.channels))
+        self.metrics.add_gauge("receive_backlog_bytes", lambda: socket_receive_backlog(self.sock))
+        self.metrics.add_gauge("broadcast_pending_packets", lambda: self.fanout.pending_packets)
+        self.metrics.add_gauge("broadcast", lambda: dict(self.fanout.stats))
+        self.metrics.add_gauge("suppressed_log_lines", lambda: message_log.suppressed)
+        self.metrics.add_gauge("last_drain_batch", lambda: self.last_batch_size)
+        self.metrics.add_gauge("v2_clients", lambda: len(self.v2_addresses))
+        self.metrics.add_gauge("v2_outbox", lambda: dict(self.outbox.stats))
+        self.metrics.add_gauge("reliability", self.reliability.stats)
+        self.metrics.add_gauge("admission", lambda: dict(self.admission.stats))
+        self.metrics.add_gauge("receive_backlog_datagrams", lambda: self.receive_backlog)
+        self.metrics.add_gauge("scheduler", lambda: dict(self.scheduler.stats))
+
+    def export_metrics(self, path, interval):
+        '''
+        Passa a gravar periodicamente um snapshot das métricas em um arquivo JSON.
+
+        Args:
+            path (str): O caminho do arquivo JSON.
+            interval (float): Intervalo entre gravações, em segundos.
+
+        Returns:
+            MetricsDumper: A thread responsável pela gravação.
+        '''
+        dumper = MetricsDumper(self.metrics, path, interval)
+        dumper.start()
+        return dumper
+
+    def enable_offline_log(self, directory):
+        '''
+        Passa a guardar em disco as mensagens enviadas a clientes offline,
+        entregando-as quando o destinatário se conectar.
+
+        Args:
+            directory (str): Diretório do log de mensagens offline.
+
+        Returns:
+            OfflineMessageLog: O log de mensagens offline.
+        '''
+        self.offline_log = OfflineMessageLog(directory)
+        self.metrics.add_gauge("offline_log", lambda: dict(self.offline_log.stats))
+        return self.offline_log
+
+    def enable_federation(self, peers, advertise=None, **options):
+        '''
+        Passa a operar como um nó de uma federação de servidores.
+
+        Args:
+            peers (iterable): Endereços de nós já em execução.
+            advertise (tuple): Endereço deste nó como visto pelos outros nós.
+            **options: Repassados para Federation (heartbeat_interval, peer_timeout, secret).
+
+        Returns:
+            Federation: A federação.
+        '''
+        self.federation = Federation(self, peers, advertise, **options)
+        self.metrics.add_gauge("federation", lambda: dict(self.federation.stats, nodes=len(self.federation.ring)))
+        return self.federation
+
+    def enable_trace(self, path, max_bytes=None):
+        '''
+        Passa a gravar os datagramas recebidos, com o instante e o endereço de
+        origem, em um arquivo de trace que pode ser reproduzido com
+        benchmarks/replay.py.
+
+        Args:
+            path (str): O caminho do arquivo de trace.
+            max_bytes (int): Tamanho máximo do trace. None para sem limite.
+
+        Returns:
+            TraceWriter: O responsável pela gravação.
+        '''
+        self.trace = TraceWriter(path, max_bytes)
+        logger.info("Gravando os datagramas recebidos em %s", path)
+        return self.trace
+
+    def enable_snapshots(self, path, interval=SNAPSHOT_INTERVAL_IN_SECONDS, load=True):
+        '''
+        Passa a gravar periodicamente o estado dos clientes em um arquivo,
+        para que um reinício não obrigue todos os clientes a repetir o HELLO.
+
+        Args:
+            path (str): O caminho do arquivo.
+            interval (float): Intervalo entre gravações, em segundos.
+            load (bool): Se o snapshot existente é restaurado agora.
+
+        Returns:
+            SnapshotWriter: O responsável pelas gravações.
+        '''
+        self.snapshots = SnapshotWriter(self, path, interval)
+        if load:
+            self.snapshots.load()
+        return self.snapshots
+
+    def restore_snapshot(self, data):
+        '''
+        Restaura o estado dos clientes recebido em um handover ou lido de um snapshot.
+
+        Returns:
+            int: O número de clientes restaurados.
+        '''
+        restored = restore_snapshot(self, data)
+        logger.info("%d clientes restaurados", restored)
+        return restored
+
+    def enable_handover(self, path):
+        '''
+        Passa a atender em um socket Unix os pedidos de handover: um novo
+        processo iniciado com take_over(path) recebe o socket UDP e o estado
+        dos clientes, e este processo para de receber mensagens.
+
+        Args:
+            path (str): O caminho do socket Unix.
+        '''
+        self.handover = HandoverListener(self, path)
+        return self.handover
+
+    def request_handover(self, conn):
+        '''
+        Agenda o handover para o loop de recepção. Chamado pela thread do HandoverListener.
+        '''
+        self._handover_request = conn
+
+    def complete_handover(self):
+        '''
+        Entrega o socket e o estado dos clientes ao novo processo que pediu o
+        handover. Deve ser chamado pelo loop de recepção, que não lê mais o
+        socket se o handover for confirmado.
+
+        Returns:
+            bool: Se o novo processo confirmou o handover.
+        '''
+        conn, self._handover_request = self._handover_request, None
+        self.flush()
+        self.fanout.stop()
+        if not hand_over(self, conn):
+            logger.error("Handover não confirmado, o servidor continua atendendo")
+            return False
+        self.handed_over = True
+        if self.handover is not None:
+            self.handover.close()
+        if self.offline_log is not None:
+            self.offline_log.close()
+            self.offline_log = None
+        logger.info("Socket entregue ao novo processo")
+        return True
+
+    def online_client_ids(self):
+        '''
+        Retorna os IDs dos clientes online, incluindo os conectados a outros nós da federação.
+        '''
+        ids = list(self.clients.snapshot().ids)
+        if self.federation is not None:
+            ids.extend(self.federation.online_ids())
+        return ids
 
     def send_message_to_all(self, message):
         '''
-        Envia uma mensagem para todos os clientes conectados.
+        Envia uma mensagem para todos os clientes conectados. Para os clientes
+        v1 o envio é feito em lotes pelo BroadcastFanout, fora da thread de
+        recepção; para os clientes v2 a mensagem é agrupada no outbox.
 
         Args:
-            message (bytes): A mensagem codificada a ser enviada.
+            message (TwotterMessage | bytes): A mensagem, ou um quadro v1 já codificado.
+
+        Returns:
+            bool: False se o broadcast foi descartado por falta de espaço na fila de envio.
         '''
-        for client_addr in self.clients.values():
-            self.sock.sendto(message, client_addr)
+        if isinstance(message, (bytes, bytearray)):
+            message = decode_message_lazy(message)
+        v2_addresses = self.v2_addresses
+        # Um endereço com vários client_ids (gateway) recebe uma única cópia.
+        addresses = self.clients.snapshot().endpoints
+        if not v2_addresses:
+            return self.fanout.submit(to_v1_frame(message), addresses)
+
+        record = to_v2_record(message)
+        reliability = self.reliability
+        if reliability.peers:
+            # Os clientes confiáveis recebem o broadcast na ordem das suas demais mensagens.
+            for address in tuple(v2_addresses):
+                if address in reliability:
+                    self.outbox.add(address, record)
+        self.outbox.broadcast(record)
+        v1_addresses = tuple(address for address in addresses if address not in v2_addresses)
+        return self.fanout.submit(to_v1_frame(message), v1_addresses)
 
     def send_message_to_client(self, message, client_id):
         '''
         Envia uma mensagem específica para um cliente identificado por client_id.
 
         Args:
-            message (bytes): A mensagem codificada a ser enviada.
+            message (TwotterMessage | bytes): A mensagem, ou um quadro v1 já codificado.
             client_id (int): O ID do cliente destinatário.
         '''
-        self.sock.sendto(message, self.clients[client_id])
+        self.send_to_address(message, self.clients[client_id])
 
-    def periodic_status_message(self):
+    def send_to_address(self, message, address):
         '''
-        Envia mensagens de status periodicamente para todos os clientes conectados.
+        Envia uma mensagem para um endereço na versão de protocolo negociada por ele.
+        Os bytes recebidos são reaproveitados quando remetente e destinatário usam a mesma versão.
+
+        Args:
+            message (TwotterMessage | bytes): A mensagem, ou um quadro v1 já codificado.
+            address (tuple): O endereço do destinatário.
         '''
-        while True:
-            time.sleep(60)
-            num_clients = len(self.clients)
-            status_msg = f"Servidor online, {num_clients} clientes conectados"
-            message = encode_message(TwotterMessage(MessageType.MESSAGE, 0, 0, SERVER_NAME, status_msg))
-            self.send_message_to_all(message)
-            logger.info("Mensagem de status enviada: %s", status_msg)    
-            self.remove_inactive_clients()
-    
-    def remove_inactive_clients(self):
-        '''
-        Remove clientes inativos por mais de 5 minutos.
-        '''
-        for client_id, last_time in self.clients_times.items():
-            if time.time() - last_time > 300:
-                del self.clients[client_id]
-                del self.clients_times[client_id]
+        if isinstance(message, (bytes, bytearray)):
+            message = decode_message_lazy(message)
+        if address in self.v2_addresses:
+            self.outbox.add(address, to_v2_record(message))
+        else:
+            self.sock.sendto(to_v1_frame(message), address)
+
+    def send_to_many(self, message, addresses):
+        '''
+        Envia uma mensagem para um grupo de endereços, pelo BroadcastFanout
+        (clientes v1) e pelo outbox (clientes v2).
+
+        Args:
+            message (TwotterMessage): A mensagem a ser enviada.
+            addresses (iterable): Os endereços dos destinatários.
+
+        Returns:
+            bool: False se o envio para os clientes v1 foi descartado por falta de espaço na fila.
+        '''
+        v2_addresses = self.v2_addresses
+        v1_addresses = []
+        record = None
+        for address in addresses:
+            if address in v2_addresses:
+                if record is None:
+                    record = to_v2_record(message)
+                self.outbox.add(address, record)
+            else:
+                v1_addresses.append(address)
+        if not v1_addresses:
+            return True
+        return self.fanout.submit(to_v1_frame(message), tuple(v1_addresses))
+
+    def send_reply(self, message, client_address):
+        '''
+        Envia uma resposta do servidor. Para clientes v1 a resposta é codificada
+        em um buffer reutilizável e enviada imediatamente, sem alocar um novo
+        objeto bytes; para clientes v2 é agrupada no outbox.
+
+        Args:
+            message (TwotterMessage): A mensagem a ser enviada.
+            client_address (tuple): O endereço do destinatário.
+        '''
+        if client_address in self.v2_addresses:
+            self.outbox.add(client_address, encode_record(message))
+            return
+        encode_message_into(message, self._reply_buffer)
+        self.sock.sendto(self._reply_buffer, client_address)
+
+    def flush(self):
+        '''
+        Envia as mensagens acumuladas no outbox para os clientes v2, trata os
+        canais confiáveis que falharam e grava as mensagens offline pendentes.
+        '''
+        if self.federation is not None:
+            self.federation.flush(time.monotonic())
+        self.outbox.flush(lambda: self.v2_addresses)
+        if self._offline_deliveries:
+            self.confirm_offline_deliveries()
+        for address in self.reliability.take_failed():
+            self.drop_failed_channel(address)
+        if self.offline_log is not None:
+            self.offline_log.flush()
+
+    def drop_failed_channel(self, address):
+        '''
+        Trata um canal confiável que falhou (o par não confirmou os dados após
+        MAX_RETRANSMISSIONS retransmissões). Os clientes do endereço são
+        removidos e recebem um ERROR, para que refaçam o HELLO com um novo
+        canal se ainda estiverem ativos. Os canais com nós da federação não são afetados.
+
+        Args:
+            address (tuple): O endereço do par.
+        '''
+        if self.federation is not None and address in self.federation.peers:
+            return
+        logger.warning("Canal confiável com %s falhou; clientes do endereço removidos", address)
+        for client_id in self.clients.client_ids_at(address):
+            self.remove_client(client_id)
+        self.reliability.close(address)
+        self.v2_addresses.discard(address)
+        self.request_channel_reset(address)
+
+    def request_channel_reset(self, address):
+        '''
+        Envia a um endereço o ERROR com CHANNEL_RESET_TEXT, com o qual o cliente
+        descarta o seu canal confiável e refaz o HELLO para abrir um novo.
+
+        Args:
+            address (tuple): O endereço do cliente.
+        '''
+        self.send_reply(TwotterMessage(MessageType.ERROR, 0, 0, SERVER_NAME, CHANNEL_RESET_TEXT), address)
+
+    def schedule_jobs(self):
+        '''
+        Agenda as tarefas periódicas no scheduler: a expiração dos clientes
+        inativos a cada tick da roda de temporização e, se periodic_tasks, a
+        mensagem de status e a compactação do log offline. A mensagem de
+        status é distribuída ao longo do intervalo, um endereço de cada vez,
+        em vez de uma rajada para todos os clientes no mesmo instante.
+        '''
+        if self._jobs_scheduled:
+            return
+        self._jobs_scheduled = True
+        now = time.monotonic()
+        self.scheduler.call_every(self.expiry.tick, self.remove_inactive_clients, now, jitter=0)
+        if self.periodic_tasks:
+            self.scheduler.spread_every(STATUS_INTERVAL_IN_SECONDS, self.status_round, self.send_status_message,
+                                        now, name="status")
+            self.scheduler.call_every(STATUS_INTERVAL_IN_SECONDS, self.compact_offline_log, now)
+
+    def status_round(self):
+        '''
+        Inicia uma rodada da mensagem de status.
+
+        Returns:
+            tuple: Os endereços dos clientes conectados (um por gateway).
+        '''
+        endpoints = self.clients.snapshot().endpoints
+        logger.info("Mensagem de status: %d clientes conectados em %d endereços", len(self.clients), len(endpoints))
+        return endpoints
+
+    def send_status_message(self, address):
+        '''
+        Envia a um endereço uma mensagem de status com o número de clientes conectados.
+        Ignora endereços que não têm mais clientes conectados.
+
+        Args:
+            address (tuple): O endereço do destinatário.
+        '''
+        if not self.clients.has_sessions(address):
+            return
+        status_msg = f"Servidor online, {len(self.clients)} clientes conectados"
+        self.send_to_address(TwotterMessage(MessageType.MESSAGE, 0, 0, SERVER_NAME, status_msg), address)
+
+    def compact_offline_log(self):
+        if self.offline_log is not None:
+            self.offline_log.maybe_compact()
+
+    def remove_inactive_clients(self, now=None):
+        '''
+        Remove clientes inativos por mais de CLIENT_TIMEOUT_IN_SECONDS. Apenas os
+        clientes cujo prazo venceu na roda de temporização são examinados, então
+        a chamada é barata e pode ser feita a cada iteração do loop de recepção.
+
+        Args:
+            now (float): O instante atual. Se omitido, usa time.time().
+        '''
+        if now is None:
+            now = time.time()
+        for client_id in self.expiry.advance(now):
+            last_time = self.clients.last_seen(client_id)
+            if last_time is not None and now - last_time <= CLIENT_TIMEOUT_IN_SECONDS:
+                # O contato foi registrado por outro worker (registro compartilhado).
+                self.expiry.touch(client_id, last_time)
+                continue
+            if client_id in self.clients:
+                self.remove_client(client_id)
                 logger.warning("Cliente %d removido por inatividade", client_id)
 
+    def remove_client(self, client_id):
+        '''
+        Remove todo o estado associado a um cliente.
+
+        Args:
+            client_id (int): O ID do cliente.
+        '''
+        address = self.clients.remove(client_id)
+        self.expiry.remove(client_id)
+        # Mensagens offline ainda não confirmadas continuam no log, para a próxima conexão.
+        self._offline_deliveries.pop(client_id, None)
+        self.admission.forget(client_id)
+        self.channels.remove_client(client_id)
+        if address is not None:
+            if not self.clients.has_local_sessions(address):
+                # O estado por endereço só é descartado quando a última sessão do endereço sai.
+                self.v2_addresses.discard(address)
+                self.reliability.close(address)
+            self.publish_presence(client_id, joined=False)
+            if self.federation is not None:
+                self.federation.client_down(client_id)
+
+    def publish_presence(self, client_id, joined):
+        '''
+        Envia aos clientes inscritos a variação da lista de clientes online.
+
+        Args:
+            client_id (int): O ID do cliente que entrou ou saiu.
+            joined (bool): True se o cliente entrou, False se saiu.
+        '''
+        delta = self.presence.changed(client_id, joined)
+        clients = self.clients
+        addresses = {clients[subscriber]: None for subscriber in self.presence.subscribers if subscriber in clients}
+        self.send_to_many(delta, addresses)
+
+    def start_logging(self):
+        '''
+        Instala os handlers do log, se ainda não configurados, e registra o
+        início do servidor. Chamado por run e serve, e não no construtor, para
+        que criar um servidor (em testes e ferramentas) não crie o server.log.
+        '''
+        configure_logging()
+        logger.info("Servidor iniciado, aguardando mensagens...")
+
     def run(self):
         '''
         Inicia o servidor, entrando em um loop para processar mensagens recebidas.
         '''
-        threading.Thread(target=self.periodic_status_message, daemon=True).start()
-    
+        self.start_logging()
+        self.schedule_jobs()
         while True:
+            if self._handover_request is not None and self.complete_handover():
+                return
             try:
-                readable, _, _ = select.select([self.sock], [], [], 1)
+                # Com dados confiáveis em trânsito, acorda a tempo de retransmitir.
+                timeout = RETRANSMIT_TICK_IN_SECONDS if self.reliability.active else 1
+                if self.federation is not None:
+                    timeout = min(timeout, self.federation.heartbeat_interval)
+                timeout = min(timeout, self.scheduler.next_deadline(time.monotonic()))
+                readable, _, _ = select.select([self.sock], [], [], timeout)
                 
                 if readable:
-                    data, client_address = self.sock.recvfrom(1024)
-                    message = decode_message(data)
-                    self.handle_message(message, client_address, data)
-                    
+                    self.drain_socket()
+
+                self.scheduler.run_due(time.monotonic())
+                if self.federation is not None:
+                    self.federation.tick(time.monotonic())
+                self.flush()
+                if self.snapshots is not None:
+                    self.snapshots.maybe_write(time.monotonic())
+            except Exception as e:
+                logger.error("Erro ao processar mensagem: %s", e)
+
+    def drain_socket(self):
+        '''
+        Lê e processa os datagramas já disponíveis no socket, sem bloquear,
+        até esvaziar a fila ou atingir max_batch.
+        '''
+        recvfrom = self.sock.recvfrom
+        # Sem MSG_DONTWAIT, um socket bloqueante só pode ser lido uma vez por iteração.
+        limit = self.max_batch if _RECV_FLAGS or not self.sock.getblocking() else 1
+        count = 0
+        while count < limit:
+            try:
+                data, client_address = recvfrom(RECEIVE_BUFFER_SIZE, _RECV_FLAGS)
+            except (BlockingIOError, InterruptedError):
+                self.receive_backlog = 0
+                break
+            except OSError as e:
+                logger.error("Erro ao receber mensagem: %s", e)
+                break
+            self.receive_backlog += 1
+            self.process_datagram(data, client_address)
+            count += 1
+        if limit == 1:
+            # Sem leitura não bloqueante não há como saber se a fila ficou vazia.
+            self.receive_backlog = 0
+        self.last_batch_size = count
+
+    def process_datagram(self, data, client_address):
+        '''
+        Decodifica um datagrama recebido, v1 ou v2 (com uma ou mais mensagens),
+        e despacha cada mensagem para handle_message.
+
+        Args:
+            data (bytes): O datagrama recebido.
+            client_address (tuple): O endereço do cliente que enviou o datagrama.
+        '''
+        start = time.perf_counter_ns()
+        if self.trace is not None:
+            self.trace.record(data, client_address)
+        reliable = False
+        try:
+            marker = data[0] if data else None
+            if marker == REL_DATA or marker == REL_ACK:
+                reliable = True
+                messages = []
+                known_node = self.federation is not None and client_address in self.federation.peers
+                if (marker == REL_DATA and not known_node and client_address not in self.reliability
+                        and client_address in self.v2_addresses):
+                    # Cliente conectado sem canal (restaurado de um snapshot periódico, ou o aviso anterior se perdeu).
+                    self.request_channel_reset(client_address)
+                for payload in self.reliability.receive(client_address, data, time.monotonic(), known_node):
+                    if payload[:1] == FED_PREFIX:
+                        if self.federation is not None:
+                            self.federation.handle_batch(client_address, payload)
+                    else:
+                        messages.extend(decode_records(payload))
+            elif marker == FED_MAGIC:
+                if self.federation is not None:
+                    self.federation.handle_control(client_address, data, time.monotonic())
+                return
+            elif data[:1] == V2_PREFIX:
+                messages = decode_records(data)
+            else:
+                messages = (decode_message_lazy(data),)
+        except Exception as e:
+            self.metrics.count_errored(None)
+            self.metrics.observe(None, time.perf_counter_ns() - start)
+            logger.error("Erro ao processar mensagem: %s", e)
+            return
+
+        admit = self.admission.admit
+        clients = self.clients
+        for message in messages:
+            try:
+                if message.message_type == MessageType.CHANNEL_MESSAGE.value:
+                    recipients = len(self.channels.addresses(message.destination_id))
+                else:
+                    recipients = len(clients)
+                if not admit(message, start / 1e9, clients.verify(message.origin_id, client_address), recipients,
+                             self.receive_backlog, client_address):
+                    self.metrics.count_shed(message.message_type)
+                    if ((reliable or self.admission.last_rejection == "client_rate")
+                            and clients.verify(message.origin_id, client_address)):
+                        # O remetente é avisado do descarte: acima do seu limite, para que reduza a
+                        # taxa, ou por um payload que o canal confiável já havia confirmado.
+                        self.reject_message(message, client_address)
+                else:
+                    self.handle_message(message, client_address, message.data)
             except Exception as e:
+                self.metrics.count_errored(message.message_type)
                 logger.error("Erro ao processar mensagem: %s", e)
+            now = time.perf_counter_ns()
+            self.metrics.observe(message.message_type, now - start)
+            start = now
+
+    def reject_message(self, message, client_address):
+        '''
+        Avisa o remetente, com um ERROR, que a sua mensagem foi descartada pelo controle de admissão.
+
+        Args:
+            message (TwotterMessage | LazyTwotterMessage | LazyV2Message): A mensagem descartada.
+            client_address (tuple): O endereço do remetente.
+        '''
+        text = REJECTION_TEXTS[self.admission.last_rejection]
+        self.send_reply(TwotterMessage(MessageType.ERROR, 0, message.origin_id, SERVER_NAME, text), client_address)
 
     def handle_message(self, message, client_address, data):
         '''
         Despacha a mensagem recebida para o manipulador apropriado com base no tipo de mensagem.
 
         Args:
-            message (TwotterMessage): A mensagem recebida.
-            data (bytes): A mensagem codificada recebida.
+            message (TwotterMessage | LazyTwotterMessage | LazyV2Message): A mensagem recebida.
+            data (bytes): A mensagem codificada recebida (quadro v1 ou registro v2).
             client_address (tuple): O endereço do cliente que enviou a mensagem.
         '''
+        # Qualquer pacote de um cliente conectado conta como atividade.
+        if self.clients.verify(message.origin_id, client_address):
+            self.update_client_timer(message.origin_id)
+
         if message.message_type == 0:  # OI
             self.handle_oi_message(message, client_address)
         elif message.message_type == 1:  # TCHAU
-            self.handle_tchau_message(message)
+            self.handle_tchau_message(message, client_address)
         elif message.message_type == 2:  # MSG
             self.handle_msg_message(message, data, client_address)
         elif message.message_type == 3:  # ERRO
             self.handle_error_message(message)
         elif message.message_type == 4: # GET_ONLINE_CLIENTS
             self.handle_get_online_clients_message(message, client_address)
+        elif message.message_type == 5: # PRESENCE_SUBSCRIBE
+            self.handle_presence_subscribe_message(message, client_address)
+        elif message.message_type == 8 or message.message_type == 9: # CHANNEL_SUBSCRIBE / CHANNEL_UNSUBSCRIBE
+            self.handle_channel_subscription_message(message, client_address)
+        elif message.message_type == 10: # CHANNEL_MESSAGE
+            self.handle_channel_message(message, client_address)
+        elif message.message_type == 11: # CHANNEL_LIST
+            self.handle_channel_list_message(message, client_address)
+        elif message.message_type == 12: # KEEPALIVE
+            self.handle_keepalive_message(message, client_address)
 
     def handle_oi_message(self, message, client_address):
         '''
@@ -122,27 +712,154 @@ class TwotterServer:
             message (TwotterMessage): A mensagem de saudação recebida.
             client_address (tuple): O endereço do cliente que enviou a mensagem.
         '''
-        if message.origin_id not in self.clients:
-            self.clients[message.origin_id] = client_address
-            self.clients_times[message.origin_id] = time.time()
+        if self.federation is not None and message.origin_id in self.federation.locations:
+            logger.info("Cliente %d já está conectado a outro nó", message.origin_id)
+            self.send_reply(TwotterMessage(MessageType.ERROR, 0, message.origin_id, SERVER_NAME, "ID de cliente já está conectado."), client_address)
+        elif message.origin_id not in self.clients:
+            sessions = self.clients.client_ids_at(client_address)
+            multiplexed = MUX_FEATURE in parse_features(message.text)
+            if multiplexed and len(sessions) >= self.max_sessions_per_address:
+                logger.warning("Limite de %d sessões atingido no endereço %s", self.max_sessions_per_address, client_address)
+                self.send_reply(TwotterMessage(MessageType.ERROR, 0, message.origin_id, SERVER_NAME, "Limite de sessões por endereço atingido."), client_address)
+                return
+            if sessions and not multiplexed:
+                # O mesmo socket iniciou uma nova sessão com outro ID: as anteriores são encerradas.
+                for previous in sessions:
+                    logger.info("Cliente %d substituído por %d no endereço %s", previous, message.origin_id, client_address)
+                    self.remove_client(previous)
+                sessions = ()
+            self.clients.add(message.origin_id, client_address, time.time())
+            self.update_client_timer(message.origin_id)
             logger.info("Cliente %s (ID %d) entrou do endereço %s", message.username, message.origin_id, client_address)
-            response = encode_message(TwotterMessage(MessageType.HELLO, 0, message.origin_id, message.username, ''))
-            self.sock.sendto(response, client_address)
+            if not sessions:
+                # Um canal confiável anterior com este endereço pertence a outra sessão.
+                self.reliability.close(client_address)
+            self.accept_hello(message, client_address)
+            self.publish_presence(message.origin_id, joined=True)
+            if self.federation is not None:
+                self.federation.client_up(message.origin_id)
+            self.deliver_offline_messages(message.origin_id, client_address)
+        elif self.clients.verify(message.origin_id, client_address):
+            # Retransmissão do HELLO pelo mesmo cliente: a resposta anterior se perdeu ou o canal confiável falhou.
+            logger.info("Cliente %d reenviou HELLO", message.origin_id)
+            self.accept_hello(message, client_address, reset=True)
         else:
             logger.info("Cliente %d já está conectado", message.origin_id)
-            response = encode_message(TwotterMessage(MessageType.ERROR, 0, message.origin_id, SERVER_NAME, "ID de cliente já está conectado."))
-            self.update_client_timer(message.origin_id)
-            self.sock.sendto(response, client_address)
+            self.send_reply(TwotterMessage(MessageType.ERROR, 0, message.origin_id, SERVER_NAME, "ID de cliente já está conectado."), client_address)
+
+    def accept_hello(self, message, client_address, reset=False):
+        '''
+        Responde ao HELLO com as capacidades aceitas e passa a usá-las com o cliente.
+        A resposta ainda vai em v1, pois o cliente só passa a esperar v2 depois de recebê-la.
+        O cliente só envia HELLO sem canal confiável (ao conectar ou depois de
+        uma falha do canal), então em um HELLO repetido (reset) o canal também
+        é recomeçado, e os dados ainda não confirmados seguem pelo novo canal.
+        '''
+        features = self.accepted_features(parse_features(message.text))
+        reply = TwotterMessage(MessageType.HELLO, 0, message.origin_id, message.username, ','.join(features))
+        encode_message_into(reply, self._reply_buffer)
+        self.sock.sendto(self._reply_buffer, client_address)
+        if V2_FEATURE in features:
+            self.v2_addresses.add(client_address)
+        if REL_FEATURE in features:
+            peer = self.reliability.peers.get(client_address)
+            if reset or peer is None or peer.failed:
+                self.reliability.reopen(client_address)
+
+    def deliver_offline_messages(self, client_id, client_address):
+        '''
+        Entrega de uma vez as mensagens guardadas enquanto o cliente estava offline.
+        Para clientes v2 elas são agrupadas em poucos datagramas. Pelo canal
+        confiável, elas só saem do log depois que o cliente confirma todos os
+        datagramas (veja confirm_offline_deliveries); sem ele, as mensagens que
+        não puderam ser enviadas voltam ao log.
+
+        Args:
+            client_id (int): O ID do cliente que se conectou.
+            client_address (tuple): O endereço do cliente.
+        '''
+        if self.offline_log is None:
+            return
+        reliable = client_address in self.reliability
+        records = self.offline_log.peek(client_id) if reliable else self.offline_log.take(client_id)
+        if not records:
+            return
+        logger.info("Entregando %d mensagens guardadas para %d", len(records), client_id)
+        if reliable:
+            now = time.monotonic()
+            payloads = pack_records(records, MAX_DATAGRAM_SIZE - DATA_HEADER.size)
+            for payload in payloads:
+                datagram = self.reliability.send(client_address, payload, now)
+                if datagram is not None:
+                    try:
+                        self.sock.sendto(datagram, client_address)
+                    except OSError as e:
+                        # O datagrama continua no canal e é retransmitido.
+                        logger.error("Erro ao enviar mensagem para %s: %s", client_address, e)
+            self._offline_deliveries[client_id] = (client_address, payloads, len(records))
+            return
+
+        if client_address in self.v2_addresses:
+            datagrams = pack_records(records)
+        else:
+            datagrams = [to_v1_frame(decode_records(V2_PREFIX + record)[0]) for record in records]
+        for index, datagram in enumerate(datagrams):
+            try:
+                self.sock.sendto(datagram, client_address)
+            except OSError as e:
+                logger.error("Erro ao entregar mensagens guardadas para %d: %s", client_id, e)
+                if client_address in self.v2_addresses:
+                    index = sum(len(decode_records(sent)) for sent in datagrams[:index])
+                for record in records[index:]:
+                    self.offline_log.append(client_id, record)
+                return
+
+    def confirm_offline_deliveries(self):
+        '''
+        Retira do log as mensagens offline entregues pelo canal confiável cujos
+        datagramas o cliente já confirmou. Se o canal foi fechado antes disso,
+        as mensagens continuam no log e são entregues na próxima conexão.
+        '''
+        for client_id, (address, payloads, count) in list(self._offline_deliveries.items()):
+            peer = self.reliability.peers.get(address)
+            if peer is None:
+                del self._offline_deliveries[client_id]
+                continue
+            # Um canal reaberto (veja ReliabilityManager.reopen) reenvia os mesmos payloads pendentes.
+            pending = {id(payload) for payload in peer.pending()}
+            if not any(id(payload) in pending for payload in payloads):
+                self.offline_log.drop(client_id, count)
+                del self._offline_deliveries[client_id]
+
+    def accepted_features(self, requested):
+        '''
+        Seleciona, entre as capacidades pedidas por um cliente no HELLO, as que o servidor suporta.
+        A entrega confiável transporta datagramas v2, então depende de "v2"; "mux"
+        (vários client_ids no mesmo endereço) é independente da versão.
+
+        Args:
+            requested (set): As capacidades anunciadas pelo cliente.
 
-    def handle_tchau_message(self, message):
+        Returns:
+            list: As capacidades aceitas.
+        '''
+        accepted = []
+        if V2_FEATURE in requested:
+            accepted = [feature for feature in (V2_FEATURE, REL_FEATURE) if feature in requested]
+        if MUX_FEATURE in requested:
+            accepted.append(MUX_FEATURE)
+        return accepted
+
+    def handle_tchau_message(self, message, client_address):
         '''
         Trata mensagens do tipo BYE, removendo o cliente do servidor.
 
         Args:
             message (TwotterMessage): A mensagem de despedida recebida.
+            client_address (tuple): O endereço do cliente que enviou a mensagem.
         '''
-        if message.origin_id in self.clients:
-            del self.clients[message.origin_id]
+        if self.clients.verify(message.origin_id, client_address):
+            self.remove_client(message.origin_id)
             logger.info("Cliente %s (ID %d) saiu.", message.username, message.origin_id)
 
     def handle_msg_message(self, message, data, client_address):
@@ -154,20 +871,54 @@ class TwotterServer:
             data (bytes): A mensagem codificada recebida.
             client_address (tuple): O endereço do cliente que enviou a mensagem.
         '''
-        if message.origin_id in self.clients:
+        if self.clients.verify(message.origin_id, client_address):
             if message.destination_id == 0:
-                self.send_message_to_all(data)
-                logger.info("Mensagem de %s enviada para todos os clientes", message.username)
+                if self.send_message_to_all(message):
+                    self.metrics.count_forwarded(message.message_type)
+                else:
+                    self.metrics.count_dropped(message.message_type)
+                if self.federation is not None:
+                    self.federation.broadcast(message)
+                if message_log.should_log():
+                    logger.info("Mensagem de %s enviada para todos os clientes", message.username)
             else:
                 if message.destination_id in self.clients:
-                    self.send_message_to_client(data, message.destination_id)
-                    logger.info("Mensagem de %s enviada para %d", message.username, message.destination_id)
+                    self.send_message_to_client(message, message.destination_id)
+                    self.metrics.count_forwarded(message.message_type)
+                    if message_log.should_log():
+                        logger.info("Mensagem de %s enviada para %d", message.username, message.destination_id)
+                elif self.federation is not None and self.federation.route(message):
+                    self.metrics.count_forwarded(message.message_type)
+                elif self.offline_log is not None and self.offline_log.append(message.destination_id, to_v2_record(message)):
+                    if message_log.should_log():
+                        logger.info("Mensagem de %s guardada para %d, que está offline", message.username, message.destination_id)
                 else:
-                    error_msg = encode_message(TwotterMessage(MessageType.ERROR, 0, message.origin_id, SERVER_NAME, "Destinatário não encontrado."))
-                    self.sock.sendto(error_msg, client_address)
+                    self.metrics.count_dropped(message.message_type)
+                    self.send_reply(TwotterMessage(MessageType.ERROR, 0, message.origin_id, SERVER_NAME, "Destinatário não encontrado."), client_address)
         else:
+            self.metrics.count_dropped(message.message_type)
             logger.warning("Mensagem de origem inválida de %s", client_address)
 
+    def deliver_forwarded(self, message, hops):
+        '''
+        Entrega uma mensagem encaminhada por outro nó da federação: ao cliente
+        local, a outro nó ou, se este nó é o dono do destinatário e ele está offline, ao log offline.
+
+        Args:
+            message (LazyV2Message): A mensagem encaminhada.
+            hops (int): Quantas vezes a mensagem já foi encaminhada entre nós.
+        '''
+        destination_id = message.destination_id
+        if destination_id in self.clients:
+            self.send_message_to_client(message, destination_id)
+            self.metrics.count_forwarded(message.message_type)
+        elif self.federation.route(message, hops):
+            pass
+        elif self.offline_log is not None and self.offline_log.append(destination_id, to_v2_record(message)):
+            pass
+        else:
+            self.metrics.count_dropped(message.message_type)
+
     def handle_error_message(self, message):
         '''
         Trata mensagens do tipo ERROR, registrando o erro.
@@ -185,13 +936,144 @@ class TwotterServer:
             message (TwotterMessage): A mensagem recebida.
             client_address (tuple): O endereço do cliente que enviou a mensagem.
         '''
-        online_clients = list(self.clients.keys())
-        online_clients = [str(client) for client in online_clients]
-        online_clients = ', '.join(online_clients)
+        # A lista só é remontada quando há entrada ou saída de clientes.
+        key = (self.presence.version, self.clients.version)
+        cached_key, online_clients = self._online_clients_text
+        if cached_key != key:
+            online_clients = ', '.join(str(client) for client in self.online_client_ids())
+            self._online_clients_text = (key, online_clients)
+
+        self.send_reply(TwotterMessage(MessageType.GET_ONLINE_CLIENTS, 0, message.origin_id, SERVER_NAME, online_clients), client_address)
+        if message_log.should_log():
+            logger.info("Lista de clientes online enviada para %d", message.origin_id)
+
+    def handle_presence_subscribe_message(self, message, client_address):
+        '''
+        Trata mensagens do tipo PRESENCE_SUBSCRIBE, inscrevendo o cliente para
+        receber os deltas da lista de clientes online e enviando a lista
+        completa atual em uma ou mais mensagens PRESENCE_SNAPSHOT. Também é
+        usada pelo cliente para ressincronizar quando detecta um delta perdido.
+
+        Args:
+            message (TwotterMessage): A mensagem recebida.
+            client_address (tuple): O endereço do cliente que enviou a mensagem.
+        '''
+        if not self.clients.verify(message.origin_id, client_address):
+            self.metrics.count_dropped(message.message_type)
+            logger.warning("Inscrição de presença de origem inválida de %s", client_address)
+            return
+        if not self.presence_enabled:
+            # Sem inscrição, o cliente usa GET_ONLINE_CLIENTS, que lê o registro compartilhado.
+            self.metrics.count_dropped(message.message_type)
+            self.send_reply(TwotterMessage(MessageType.ERROR, 0, message.origin_id, SERVER_NAME, PRESENCE_UNAVAILABLE_TEXT), client_address)
+            return
+
+        self.presence.subscribers.add(message.origin_id)
+        for snapshot in self.presence.snapshot_messages(self.online_client_ids(), message.origin_id):
+            self.send_reply(snapshot, client_address)
+
+    def handle_channel_subscription_message(self, message, client_address):
+        '''
+        Trata mensagens do tipo CHANNEL_SUBSCRIBE e CHANNEL_UNSUBSCRIBE, com o
+        nome do canal no texto. A confirmação repete a mensagem, com o
+        identificador do canal em destination_id.
+
+        Args:
+            message (TwotterMessage): A mensagem recebida.
+            client_address (tuple): O endereço do cliente que enviou a mensagem.
+        '''
+        client_id = message.origin_id
+        if not self.clients.verify(client_id, client_address):
+            self.metrics.count_dropped(message.message_type)
+            logger.warning("Inscrição em canal de origem inválida de %s", client_address)
+            return
+
+        name = message.text
+        if not self.channels_enabled:
+            self.metrics.count_dropped(message.message_type)
+            self.send_reply(TwotterMessage(MessageType.ERROR, 0, client_id, SERVER_NAME, "Canais indisponíveis neste servidor."), client_address)
+            return
+        if message.message_type == MessageType.CHANNEL_SUBSCRIBE.value:
+            try:
+                channel = self.channels.subscribe(client_id, self.clients[client_id], name)
+            except ValueError as e:
+                self.send_reply(TwotterMessage(MessageType.ERROR, 0, client_id, SERVER_NAME, str(e)), client_address)
+                return
+            logger.info("Cliente %d entrou no canal %s", client_id, name)
+        else:
+            channel = channel_id(name)
+            if not self.channels.unsubscribe(client_id, channel):
+                self.send_reply(TwotterMessage(MessageType.ERROR, 0, client_id, SERVER_NAME, "Inscrição no canal não encontrada."), client_address)
+                return
+            logger.info("Cliente %d saiu do canal %s", client_id, name)
+        self.send_reply(TwotterMessage(message.message_type, 0, channel, SERVER_NAME, name), client_address)
+
+    def handle_channel_message(self, message, client_address):
+        '''
+        Trata mensagens do tipo CHANNEL_MESSAGE, com o identificador do canal em
+        destination_id, enviando-as apenas aos membros do canal. Só membros podem publicar.
+
+        Args:
+            message (TwotterMessage): A mensagem recebida.
+            client_address (tuple): O endereço do cliente que enviou a mensagem.
+        '''
+        if not self.clients.verify(message.origin_id, client_address):
+            self.metrics.count_dropped(message.message_type)
+            logger.warning("Mensagem de canal de origem inválida de %s", client_address)
+            return
+        if not self.channels.is_member(message.origin_id, message.destination_id):
+            self.metrics.count_dropped(message.message_type)
+            self.send_reply(TwotterMessage(MessageType.ERROR, 0, message.origin_id, SERVER_NAME, "Inscrição no canal não encontrada."), client_address)
+            return
+
+        self.deliver_channel_message(message)
+        if self.federation is not None:
+            self.federation.publish(message)
+        if message_log.should_log():
+            logger.info("Mensagem de %s enviada para o canal %s", message.username, self.channels.names[message.destination_id])
+
+    def deliver_channel_message(self, message):
+        '''
+        Entrega uma mensagem de canal aos membros conectados a este servidor.
+
+        Args:
+            message (TwotterMessage | LazyTwotterMessage | LazyV2Message): A mensagem de canal.
+        '''
+        addresses = self.channels.addresses(message.destination_id)
+        if not addresses:
+            return
+        # Membros atrás do mesmo gateway recebem uma única cópia.
+        addresses = dict.fromkeys(addresses)
+        if self.send_to_many(message, addresses):
+            self.metrics.count_forwarded(message.message_type)
+        else:
+            self.metrics.count_dropped(message.message_type)
+
+    def handle_channel_list_message(self, message, client_address):
+        '''
+        Trata mensagens do tipo CHANNEL_LIST, enviando a lista de canais em uma ou mais mensagens.
+
+        Args:
+            message (TwotterMessage): A mensagem recebida.
+            client_address (tuple): O endereço do cliente que enviou a mensagem.
+        '''
+        if not self.clients.verify(message.origin_id, client_address):
+            self.metrics.count_dropped(message.message_type)
+            return
+        for reply in self.channels.list_messages(message.origin_id):
+            self.send_reply(reply, client_address)
+
+    def handle_keepalive_message(self, message, client_address):
+        '''
+        Trata mensagens do tipo KEEPALIVE. O contato já foi registrado por
+        handle_message; um gateway envia os KEEPALIVE das suas sessões agrupados em datagramas v2.
 
-        response = encode_message(TwotterMessage(MessageType.GET_ONLINE_CLIENTS, 0, message.origin_id, SERVER_NAME, online_clients))
-        self.sock.sendto(response, client_address)
-        logger.info("Lista de clientes online enviada para %d", message.origin_id)
+        Args:
+            message (TwotterMessage): A mensagem recebida.
+            client_address (tuple): O endereço do cliente que enviou a mensagem.
+        '''
+        if not self.clients.verify(message.origin_id, client_address):
+            self.metrics.count_dropped(message.message_type)
 
     def update_client_timer(self, client_id):
         '''
@@ -200,5 +1082,7 @@ class TwotterServer:
         Args:
             client_id (int): O ID do cliente.
         '''
-        self.clients_times[client_id] = time.time()
+        now = time.time()
+        self.clients.touch(client_id, now)
+        self.expiry.touch(client_id, now)
                     
@@ -0,0 +1,410 @@
+import ctypes
+import multiprocessing
+import socket
+import struct
+from collections.abc import MutableMapping
+
+from twotter.entitites.registry import build_snapshot
+
+DEFAULT_CAPACITY = 4096
+# Fração dos slots marcados como removidos a partir da qual a tabela é reorganizada.
+MAX_DELETED_FRACTION = 0.25
+
+_EMPTY = 0
+_USED = 1
+_DELETED = 2
+
+
+class _Slot(ctypes.Structure):
+    _fields_ = [
+        ("version", ctypes.c_uint32),
+        ("state", ctypes.c_uint8),
+        ("client_id", ctypes.c_uint32),
+        ("ip", ctypes.c_uint32),
+        ("port", ctypes.c_uint16),
+        ("last_seen", ctypes.c_double),
+    ]
+
+
+def _pack_ip(host):
+    return struct.unpack('!I', socket.inet_aton(host))[0]
+
+
+def _unpack_ip(ip):
+    return socket.inet_ntoa(struct.pack('!I', ip))
+
+
+class SharedClientTable:
+    '''
+    Tabela de clientes em memória compartilhada, usada pelos processos worker
+    do servidor para que todos enxerguem o mesmo registro de clientes.
+
+    É uma tabela hash de endereçamento aberto (sondagem linear) sobre um
+    RawArray. As escritas são serializadas por um multiprocessing.Lock e as
+    leituras não usam lock: cada slot tem um contador de versão (seqlock) que
+    é ímpar durante uma escrita, e o leitor repete a leitura se a versão mudar.
+
+    Uma remoção marca o slot como removido, para não interromper a sondagem
+    de outros IDs; as marcas seguidas de um slot vazio voltam a ser vazias na
+    hora. Quando as marcas restantes passam de MAX_DELETED_FRACTION dos slots,
+    a tabela é reorganizada (as entradas são reinseridas), para que as buscas
+    sem sucesso não percorram a tabela inteira. Durante a reorganização um
+    contador da tabela inteira fica ímpar, e os leitores esperam e repetem.
+
+    Deve ser criada antes do fork dos workers.
+
+    Args:
+        capacity (int): Número de slots da tabela (arredondado para uma potência de 2).
+
+    Attributes:
+        addresses (MutableMapping): Visão client_id -> endereço.
+        times (MutableMapping): Visão client_id -> último contato.
+    '''
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        size = 1
+        while size < capacity * 2:
+            size *= 2
+        self._mask = size - 1
+        self._slots = multiprocessing.RawArray(_Slot, size)
+        self._count = multiprocessing.RawValue(ctypes.c_int, 0)
+        # Incrementado a cada inserção ou remoção, para invalidar os snapshots dos workers.
+        self._generation = multiprocessing.RawValue(ctypes.c_uint64, 0)
+        # Slots marcados como removidos, e o seqlock da reorganização da tabela.
+        self._deleted = multiprocessing.RawValue(ctypes.c_int, 0)
+        self._layout = multiprocessing.RawValue(ctypes.c_uint64, 0)
+        self._lock = multiprocessing.Lock()
+        self.capacity = capacity
+        self.addresses = _AddressView(self)
+        self.times = _TimeView(self)
+
+    def _probe(self, client_id):
+        # Percorre a sequência de sondagem de client_id, começando pelo slot do hash.
+        index = (client_id * 2654435761) & self._mask
+        for _ in range(self._mask + 1):
+            yield self._slots[index]
+            index = (index + 1) & self._mask
+
+    def _read(self, client_id):
+        '''
+        Lê o slot de client_id sem lock. Retorna (ip, porta, last_seen) ou None.
+        '''
+        while True:
+            layout = self._layout.value
+            if layout & 1:
+                continue
+            result = self._read_slot(client_id)
+            if self._layout.value == layout:
+                return result
+
+    def _consistent(self, read):
+        # Repete uma leitura da tabela inteira que coincidiu com uma reorganização.
+        while True:
+            layout = self._layout.value
+            if layout & 1:
+                continue
+            result = read()
+            if self._layout.value == layout:
+                return result
+
+    def _read_slot(self, client_id):
+        for slot in self._probe(client_id):
+            while True:
+                version = slot.version
+                if version & 1:
+                    continue
+                state = slot.state
+                found = slot.client_id == client_id
+                result = (slot.ip, slot.port, slot.last_seen)
+                if slot.version == version:
+                    break
+            if state == _EMPTY:
+                return None
+            if state == _USED and found:
+                return result
+        return None
+
+    def _write(self, slot, **fields):
+        slot.version += 1
+        for name, value in fields.items():
+            setattr(slot, name, value)
+        slot.version += 1
+
+    def set(self, client_id, address, last_seen=0.0, replace=True):
+        '''
+        Insere ou atualiza o endereço de client_id.
+
+        Args:
+            replace (bool): Se False, um client_id já presente não é alterado.
+
+        Returns:
+            bool: False se client_id já estava na tabela.
+
+        Raises:
+            MemoryError: Se a tabela estiver cheia.
+        '''
+        ip, port = _pack_ip(address[0]), address[1]
+        with self._lock:
+            free = None
+            for slot in self._probe(client_id):
+                if slot.state == _USED and slot.client_id == client_id:
+                    if replace:
+                        self._write(slot, ip=ip, port=port)
+                    return False
+                if slot.state != _USED and free is None:
+                    free = slot
+                if slot.state == _EMPTY:
+                    break
+            if free is None or self._count.value >= self.capacity:
+                raise MemoryError("Tabela de clientes compartilhada cheia")
+            if free.state == _DELETED:
+                self._deleted.value -= 1
+            self._write(free, client_id=client_id, ip=ip, port=port, last_seen=last_seen, state=_USED)
+            self._count.value += 1
+            self._generation.value += 1
+            return True
+
+    def touch(self, client_id, last_seen):
+        '''
+        Atualiza o último contato de client_id.
+
+        Raises:
+            KeyError: Se o cliente não estiver na tabela.
+        '''
+        with self._lock:
+            for slot in self._probe(client_id):
+                if slot.state == _EMPTY:
+                    break
+                if slot.state == _USED and slot.client_id == client_id:
+                    self._write(slot, last_seen=last_seen)
+                    return
+        raise KeyError(client_id)
+
+    def remove(self, client_id):
+        '''
+        Remove client_id da tabela.
+
+        Raises:
+            KeyError: Se o cliente não estiver na tabela.
+        '''
+        with self._lock:
+            index = (client_id * 2654435761) & self._mask
+            for _ in range(self._mask + 1):
+                slot = self._slots[index]
+                if slot.state == _EMPTY:
+                    break
+                if slot.state == _USED and slot.client_id == client_id:
+                    self._write(slot, state=_DELETED)
+                    self._count.value -= 1
+                    self._deleted.value += 1
+                    self._generation.value += 1
+                    self._clear_deleted(index)
+                    if self._deleted.value > MAX_DELETED_FRACTION * (self._mask + 1):
+                        self._rehash()
+                    return
+                index = (index + 1) & self._mask
+        raise KeyError(client_id)
+
+    def _clear_deleted(self, index):
+        # Uma marca seguida de um slot vazio não interrompe nenhuma sondagem: ela e
+        # as marcas imediatamente anteriores voltam a ser vazias.
+        if self._slots[(index + 1) & self._mask].state != _EMPTY:
+            return
+        while self._slots[index].state == _DELETED:
+            self._write(self._slots[index], state=_EMPTY)
+            self._deleted.value -= 1
+            index = (index - 1) & self._mask
+
+    def _rehash(self):
+        # Reinsere as entradas em uma tabela sem marcas. Chamado com o lock.
+        entries = [(slot.client_id, slot.ip, slot.port, slot.last_seen) for slot in self._slots if slot.state == _USED]
+        self._layout.value += 1
+        try:
+            for slot in self._slots:
+                slot.state = _EMPTY
+            for client_id, ip, port, last_seen in entries:
+                for slot in self._probe(client_id):
+                    if slot.state == _EMPTY:
+                        self._write(slot, client_id=client_id, ip=ip, port=port, last_seen=last_seen, state=_USED)
+                        break
+            self._deleted.value = 0
+        finally:
+            self._layout.value += 1
+
+    def get_address(self, client_id):
+        entry = self._read(client_id)
+        if entry is None:
+            raise KeyError(client_id)
+        return (_unpack_ip(entry[0]), entry[1])
+
+    def get_last_seen(self, client_id):
+        entry = self._read(client_id)
+        if entry is None:
+            raise KeyError(client_id)
+        return entry[2]
+
+    def ids(self):
+        '''
+        Retorna uma lista com os IDs presentes na tabela no momento da chamada.
+        '''
+        return self._consistent(lambda: [slot.client_id for slot in self._slots if slot.state == _USED])
+
+    def entries(self):
+        '''
+        Retorna uma lista de pares (client_id, endereço) presentes na tabela no momento da chamada.
+        '''
+        return self._consistent(lambda: [(slot.client_id, (_unpack_ip(slot.ip), slot.port))
+                                         for slot in self._slots if slot.state == _USED])
+
+    @property
+    def generation(self):
+        return self._generation.value
+
+    def __len__(self):
+        return self._count.value
+
+
+class _AddressView(MutableMapping):
+    def __init__(self, table):
+        self._table = table
+
+    def __getitem__(self, client_id):
+        return self._table.get_address(client_id)
+
+    def __setitem__(self, client_id, address):
+        self._table.set(client_id, address)
+
+    def __delitem__(self, client_id):
+        self._table.remove(client_id)
+
+    def __contains__(self, client_id):
+        return self._table._read(client_id) is not None
+
+    def __iter__(self):
+        return iter(self._table.ids())
+
+    def __len__(self):
+        return len(self._table)
+
+
+class _TimeView(MutableMapping):
+    def __init__(self, table):
+        self._table = table
+
+    def __getitem__(self, client_id):
+        return self._table.get_last_seen(client_id)
+
+    def __setitem__(self, client_id, last_seen):
+        self._table.touch(client_id, last_seen)
+
+    def __delitem__(self, client_id):
+        # O tempo faz parte do slot do cliente, que é removido pela visão de endereços.
+        if client_id not in self._table.addresses:
+            raise KeyError(client_id)
+
+    def __contains__(self, client_id):
+        return self._table._read(client_id) is not None
+
+    def __iter__(self):
+        return iter(self._table.ids())
+
+    def __len__(self):
+        return len(self._table)
+
+
+class SharedClientRegistry:
+    '''
+    Adaptador que expõe uma SharedClientTable com a mesma interface do
+    ClientRegistry, para os servidores dos processos worker.
+
+    A tabela compartilhada não tem índice reverso (os endereços registrados
+    por outros workers não passam por este processo), então client_ids_at
+    percorre a tabela. Os snapshots, e o conjunto de endereços usado por
+    has_sessions, são refeitos quando a geração da tabela muda. Os clientes
+    registrados por este processo têm um índice reverso local, usado por
+    has_local_sessions na remoção de um cliente, já que o estado por endereço
+    (protocolo v2, canal confiável) também é local ao processo.
+
+    Args:
+        table (SharedClientTable): A tabela compartilhada pelos workers.
+    '''
+    def __init__(self, table):
+        self.table = table
+        self._snapshot = (None, None, frozenset())
+        self._local = {}
+        self._local_addresses = {}
+
+    @property
+    def version(self):
+        return self.table.generation
+
+    def add(self, client_id, address, now):
+        if not self.table.set(client_id, address, now, replace=False):
+            return False
+        self._local_addresses[client_id] = address
+        self._local.setdefault(address, set()).add(client_id)
+        return True
+
+    def remove(self, client_id):
+        local_address = self._local_addresses.pop(client_id, None)
+        if local_address is not None:
+            sessions = self._local[local_address]
+            sessions.discard(client_id)
+            if not sessions:
+                del self._local[local_address]
+        try:
+            address = self.table.get_address(client_id)
+            self.table.remove(client_id)
+        except KeyError:
+            return None
+        return address
+
+    def touch(self, client_id, now):
+        try:
+            self.table.touch(client_id, now)
+        except KeyError:
+            pass
+
+    def last_seen(self, client_id):
+        entry = self.table._read(client_id)
+        return entry[2] if entry is not None else None
+
+    def get(self, client_id, default=None):
+        entry = self.table._read(client_id)
+        return (_unpack_ip(entry[0]), entry[1]) if entry is not None else default
+
+    def client_ids_at(self, address):
+        # Sem índice reverso compartilhado: percorre a tabela. Usado no HELLO, não nas rodadas de status nem nas remoções.
+        return tuple(client_id for client_id, entry_address in self.table.entries() if entry_address == address)
+
+    def has_sessions(self, address):
+        return address in self._refresh()[2]
+
+    def has_local_sessions(self, address):
+        return address in self._local
+
+    def verify(self, client_id, address):
+        return self.get(client_id) == address
+
+    def _refresh(self):
+        generation = self.table.generation
+        cached = self._snapshot
+        if cached[0] != generation:
+            entries = self.table.entries()
+            snapshot = build_snapshot((client_id for client_id, _ in entries), (address for _, address in entries))
+            cached = self._snapshot = (generation, snapshot, frozenset(snapshot.endpoints))
+        return cached
+
+    def snapshot(self):
+        return self._refresh()[1]
+
+    def __getitem__(self, client_id):
+        return self.table.get_address(client_id)
+
+    def __contains__(self, client_id):
+        return self.table._read(client_id) is not None
+
+    def __iter__(self):
+        return iter(self.snapshot().ids)
+
+    def __len__(self):
+        return len(self.table)
@@ -0,0 +1,402 @@
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+
+from twotter.entitites.reliability import PeerState
+from twotter.utils import logger
+
+# Cabeçalho do snapshot: marcador, versão do formato, instante da gravação,
+# versão da lista de presença e número de clientes, canais e canais confiáveis.
+SNAPSHOT_HEADER = struct.Struct('!4sHdIIII')
+SNAPSHOT_MAGIC = b"TWRS"
+SNAPSHOT_VERSION = 1
+# Cada cliente: ID, endereço IPv4, porta, instante do último contato e flags.
+SNAPSHOT_CLIENT = struct.Struct('!I4sHdB')
+FLAG_V2 = 1
+FLAG_RELIABLE = 2
+FLAG_PRESENCE = 4
+# Cada canal: tamanho do nome e número de membros, seguidos do nome e dos IDs.
+SNAPSHOT_CHANNEL = struct.Struct('!BI')
+# Cada canal confiável: endereço, porta, sequências e número de payloads não
+# confirmados, na fila e fora de ordem, seguidos dos payloads.
+SNAPSHOT_PEER = struct.Struct('!4sHIIIII')
+SNAPSHOT_PAYLOAD = struct.Struct('!IH')
+SNAPSHOT_CHECKSUM = struct.Struct('!I')
+
+SNAPSHOT_INTERVAL_IN_SECONDS = 30
+
+# Handover: tamanho do snapshot enviado junto com o descritor do socket, e a confirmação do novo processo.
+HANDOVER_LENGTH = struct.Struct('!I')
+HANDOVER_ACK = b"\x01"
+HANDOVER_TIMEOUT_IN_SECONDS = 10
+
+
+def _pack_address(address):
+    return socket.inet_aton(address[0]), address[1]
+
+
+def _unpack_address(host, port):
+    return socket.inet_ntoa(host), port
+
+
+def _pack_payloads(parts, items):
+    for seq, payload in items:
+        parts.append(SNAPSHOT_PAYLOAD.pack(seq, len(payload)))
+        parts.append(payload)
+
+
+def encode_snapshot(server, reliability=False, now=None):
+    '''
+    Codifica o estado dos clientes de um servidor: o registro (IDs,
+    endereços e último contato), quem negociou v2, entrega confiável e
+    assinatura de presença, e os membros de cada canal.
+
+    Os canais confiáveis só entram com reliability=True, usado no handover,
+    em que o processo antigo já parou de ler o socket. Em um snapshot
+    periódico as sequências ficariam desatualizadas assim que o servidor
+    enviasse a mensagem seguinte, e retomá-las faria o cliente descartar as
+    mensagens novas como duplicadas; apenas a flag de entrega confiável é
+    gravada, e restore_snapshot pede a esses clientes um novo canal.
+
+    Args:
+        server (TwotterServer): O servidor.
+        reliability (bool): Se os canais confiáveis são incluídos.
+        now (float): O instante da gravação. Se omitido, usa time.time().
+
+    Returns:
+        bytes: O snapshot.
+    '''
+    if now is None:
+        now = time.time()
+    clients = server.clients
+    subscribers = server.presence.subscribers
+    snapshot = clients.snapshot()
+    parts = [b'']
+    for client_id, address in zip(snapshot.ids, snapshot.addresses):
+        last_seen = clients.last_seen(client_id)
+        if last_seen is None:
+            continue
+        flags = ((FLAG_V2 if address in server.v2_addresses else 0)
+                 | (FLAG_RELIABLE if address in server.reliability else 0)
+                 | (FLAG_PRESENCE if client_id in subscribers else 0))
+        parts.append(SNAPSHOT_CLIENT.pack(client_id, *_pack_address(address), last_seen, flags))
+    client_count = len(parts) - 1
+
+    channels = server.channels
+    for channel, name in list(channels.names.items()):
+        members = channels.members(channel)
+        encoded = name.encode()
+        parts.append(SNAPSHOT_CHANNEL.pack(len(encoded), len(members)))
+        parts.append(encoded)
+        parts.append(struct.pack(f'!{len(members)}I', *members))
+
+    peer_count = 0
+    if reliability:
+        for address, peer in list(server.reliability.peers.items()):
+            if peer.failed or not clients.client_ids_at(address):
+                continue
+            state = peer.export_state()
+            parts.append(SNAPSHOT_PEER.pack(*_pack_address(address), state.next_seq, state.expected,
+                                            len(state.unacked), len(state.backlog), len(state.out_of_order)))
+            _pack_payloads(parts, sorted(state.unacked.items()))
+            _pack_payloads(parts, ((0, payload) for payload in state.backlog))
+            _pack_payloads(parts, sorted(state.out_of_order.items()))
+            peer_count += 1
+
+    parts[0] = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, now, server.presence.version,
+                                    client_count, len(channels.names), peer_count)
+    data = b''.join(parts)
+    return data + SNAPSHOT_CHECKSUM.pack(zlib.crc32(data))
+
+
+def _read_payloads(data, offset, count):
+    items = []
+    for _ in range(count):
+        seq, size = SNAPSHOT_PAYLOAD.unpack_from(data, offset)
+        offset += SNAPSHOT_PAYLOAD.size
+        items.append((seq, bytes(data[offset:offset + size])))
+        offset += size
+    return items, offset
+
+
+def restore_snapshot(server, data, now=None, timeout=None):
+    '''
+    Restaura em um servidor recém-criado o estado gravado por encode_snapshot.
+    Clientes inativos há mais de timeout segundos não são restaurados. Os
+    clientes com entrega confiável cujo canal não está no snapshot (um
+    snapshot periódico) são restaurados sem canal, e o servidor pede a eles
+    um novo canal (veja TwotterServer.request_channel_reset).
+
+    Args:
+        server (TwotterServer): O servidor.
+        data (bytes): O snapshot.
+        now (float): O instante atual. Se omitido, usa time.time().
+        timeout (float): O prazo de inatividade. Se omitido, usa o de server.
+
+    Returns:
+        int: O número de clientes restaurados.
+
+    Raises:
+        ValueError: Se o snapshot estiver corrompido ou em um formato desconhecido.
+    '''
+    if now is None:
+        now = time.time()
+    if timeout is None:
+        timeout = server.expiry.timeout
+    data = memoryview(data)
+    if len(data) < SNAPSHOT_HEADER.size + SNAPSHOT_CHECKSUM.size:
+        raise ValueError("Snapshot incompleto.")
+    body = data[:-SNAPSHOT_CHECKSUM.size]
+    if SNAPSHOT_CHECKSUM.unpack_from(data, len(body))[0] != zlib.crc32(body):
+        raise ValueError("Snapshot corrompido.")
+    magic, version, _, presence_version, client_count, channel_count, peer_count = SNAPSHOT_HEADER.unpack_from(body)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError("Formato de snapshot desconhecido.")
+
+    offset = SNAPSHOT_HEADER.size
+    entries = []
+    for _ in range(client_count):
+        client_id, host, port, last_seen, flags = SNAPSHOT_CLIENT.unpack_from(body, offset)
+        offset += SNAPSHOT_CLIENT.size
+        entries.append((client_id, _unpack_address(host, port), last_seen, flags))
+
+    channels = []
+    for _ in range(channel_count):
+        size, count = SNAPSHOT_CHANNEL.unpack_from(body, offset)
+        offset += SNAPSHOT_CHANNEL.size
+        name = bytes(body[offset:offset + size]).decode()
+        offset += size
+        channels.append((name, struct.unpack_from(f'!{count}I', body, offset)))
+        offset += 4 * count
+
+    peers = {}
+    for _ in range(peer_count):
+        host, port, next_seq, expected, unacked, backlog, out_of_order = SNAPSHOT_PEER.unpack_from(body, offset)
+        offset += SNAPSHOT_PEER.size
+        unacked, offset = _read_payloads(body, offset, unacked)
+        backlog, offset = _read_payloads(body, offset, backlog)
+        out_of_order, offset = _read_payloads(body, offset, out_of_order)
+        peers[_unpack_address(host, port)] = PeerState(next_seq, expected, dict(unacked),
+                                                       [payload for _, payload in backlog], dict(out_of_order))
+
+    server.presence.version = max(server.presence.version, presence_version)
+    restored = 0
+    resync = set()
+    for client_id, address, last_seen, flags in entries:
+        if now - last_seen > timeout:
+            continue
+        if not server.clients.add(client_id, address, last_seen):
+            continue
+        server.expiry.touch(client_id, last_seen)
+        if flags & FLAG_V2:
+            server.v2_addresses.add(address)
+        if flags & FLAG_PRESENCE:
+            server.presence.subscribers.add(client_id)
+        if flags & FLAG_RELIABLE and address not in peers:
+            resync.add(address)
+        restored += 1
+    for address, state in peers.items():
+        if server.clients.client_ids_at(address):
+            server.reliability.restore(address, state, time.monotonic())
+    for address in resync:
+        server.request_channel_reset(address)
+    for name, members in channels:
+        for client_id in members:
+            address = server.clients.get(client_id)
+            if address is not None:
+                server.channels.subscribe(client_id, address, name)
+    return restored
+
+
+class SnapshotWriter:
+    '''
+    Grava periodicamente o snapshot dos clientes de um servidor em um
+    arquivo. write deve ser chamado na thread (ou loop) que processa as
+    mensagens, para que o registro não mude durante a codificação; a
+    gravação é atômica (arquivo temporário e os.replace), então uma queda
+    durante a escrita preserva o snapshot anterior.
+
+    Args:
+        server (TwotterServer): O servidor.
+        path (str): O caminho do arquivo.
+        interval (float): Intervalo entre gravações, em segundos.
+    '''
+    def __init__(self, server, path, interval=SNAPSHOT_INTERVAL_IN_SECONDS):
+        self.server = server
+        self.path = path
+        self.interval = interval
+        self._next_write = time.monotonic() + interval
+
+    def load(self):
+        '''
+        Restaura o snapshot gravado, se existir.
+
+        Returns:
+            int: O número de clientes restaurados.
+        '''
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return 0
+        try:
+            restored = restore_snapshot(self.server, data)
+        except (ValueError, struct.error) as e:
+            logger.error("Snapshot %s ignorado: %s", self.path, e)
+            return 0
+        logger.info("%d clientes restaurados do snapshot %s", restored, self.path)
+        return restored
+
+    def write(self):
+        data = encode_snapshot(self.server)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+
+    def maybe_write(self, now):
+        '''
+        Grava o snapshot se o intervalo já passou.
+
+        Args:
+            now (float): O instante atual, de time.monotonic().
+        '''
+        if now < self._next_write:
+            return
+        self._next_write = now + self.interval
+        try:
+            self.write()
+        except OSError as e:
+            logger.error("Erro ao gravar o snapshot %s: %s", self.path, e)
+
+
+class HandoverListener:
+    '''
+    Escuta em um socket Unix os pedidos de handover de um novo processo do
+    servidor. Cada pedido é repassado a server.request_handover, e o loop do
+    servidor entrega o socket UDP e o snapshot ao novo processo (veja
+    hand_over).
+
+    Args:
+        server (TwotterServer): O servidor.
+        path (str): O caminho do socket Unix.
+    '''
+    def __init__(self, server, path):
+        self.server = server
+        self.path = path
+        if os.path.exists(path):
+            # O caminho pertence ao processo anterior, que já entregou o socket.
+            os.unlink(path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen(1)
+        self._thread = threading.Thread(target=self._run, name="twotter-handover", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            logger.info("Pedido de handover recebido")
+            self.server.request_handover(conn)
+
+    def close(self):
+        self.sock.close()
+
+
+def hand_over(server, conn):
+    '''
+    Entrega o socket UDP do servidor e o snapshot completo do seu estado,
+    com os canais confiáveis, a um novo processo. Deve ser chamada depois que
+    o servidor parou de ler o socket: os datagramas que chegarem a partir
+    daí ficam na fila do socket, que é o mesmo nos dois processos, e são
+    lidos pelo novo processo.
+
+    Args:
+        server (TwotterServer): O servidor.
+        conn (socket): A conexão com o novo processo.
+
+    Returns:
+        bool: Se o novo processo confirmou o recebimento.
+    '''
+    try:
+        conn.settimeout(HANDOVER_TIMEOUT_IN_SECONDS)
+        data = encode_snapshot(server, reliability=True)
+        socket.send_fds(conn, [HANDOVER_LENGTH.pack(len(data))], [server.sock.fileno()])
+        conn.sendall(data)
+        confirmed = conn.recv(1) == HANDOVER_ACK
+    except OSError as e:
+        logger.error("Erro no handover: %s", e)
+        confirmed = False
+    finally:
+        conn.close()
+    return confirmed
+
+
+class Handover:
+    '''
+    Lado do novo processo em um handover: o socket UDP recebido e o
+    snapshot do processo anterior. Depois de restaurar o snapshot, confirm
+    libera o processo anterior para terminar.
+
+    Attributes:
+        sock (socket): O socket UDP do servidor.
+        snapshot (bytes): O snapshot do estado do processo anterior.
+    '''
+    def __init__(self, conn, sock, snapshot):
+        self.conn = conn
+        self.sock = sock
+        self.snapshot = snapshot
+
+    def confirm(self):
+        try:
+            self.conn.sendall(HANDOVER_ACK)
+        finally:
+            self.conn.close()
+
+
+def _receive_exactly(conn, size):
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = conn.recv(size - len(buffer))
+        if not chunk:
+            raise ConnectionError("Handover interrompido.")
+        buffer += chunk
+    return bytes(buffer)
+
+
+def take_over(path, timeout=HANDOVER_TIMEOUT_IN_SECONDS):
+    '''
+    Pede o socket UDP ao processo do servidor que escuta em path.
+
+    Returns:
+        Handover: O socket e o snapshot, ou None se não há um servidor escutando em path.
+
+    Raises:
+        ConnectionError: Se o processo anterior encerrou a conexão no meio do handover.
+    '''
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(timeout)
+    try:
+        conn.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        conn.close()
+        return None
+    try:
+        header, fds, _, _ = socket.recv_fds(conn, HANDOVER_LENGTH.size, 1)
+        if len(fds) != 1:
+            raise ConnectionError("Handover sem o socket do servidor.")
+        if len(header) < HANDOVER_LENGTH.size:
+            header += _receive_exactly(conn, HANDOVER_LENGTH.size - len(header))
+        snapshot = _receive_exactly(conn, HANDOVER_LENGTH.unpack(header)[0])
+    except BaseException:
+        conn.close()
+        raise
+    return Handover(conn, socket.socket(fileno=fds[0]), snapshot)
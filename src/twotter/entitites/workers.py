@@ -0,0 +1,73 @@
+import multiprocessing
+import os
+import socket
+
+from twotter.entitites.server import TwotterServer
+from twotter.entitites.shared_registry import SharedClientTable, SharedClientRegistry, DEFAULT_CAPACITY
+from twotter.utils import logger
+from twotter.config import SERVER_ADDRESS
+
+
+def _worker_main(index, server_class, address, table, worker_setup, server_setup):
+    if worker_setup is not None:
+        worker_setup()
+    server = server_class(address, reuse_port=True)
+    server.clients = SharedClientRegistry(table)
+    # Apenas o primeiro worker envia o status, para que os clientes não
+    # recebam uma mensagem de status por worker.
+    server.periodic_tasks = index == 0
+    # Os deltas de presença de cada worker cobririam apenas os clientes tratados
+    # por ele: os clientes usam GET_ONLINE_CLIENTS, que lê o registro compartilhado.
+    server.presence_enabled = False
+    # Pelo mesmo motivo, canais: uma mensagem de canal só alcançaria os membros inscritos pelo mesmo worker.
+    server.channels_enabled = False
+    if server_setup is not None:
+        server_setup(server, index)
+    logger.info("Worker %d iniciado (PID %d)", index, os.getpid())
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+
+
+def run_workers(num_workers, server_class=TwotterServer, address=SERVER_ADDRESS, capacity=DEFAULT_CAPACITY,
+                worker_setup=None, server_setup=None):
+    '''
+    Inicia num_workers processos de servidor escutando no mesmo endereço com
+    SO_REUSEPORT. Os workers compartilham o registro de clientes por meio de
+    uma SharedClientTable (com um SharedClientRegistry em cada servidor), de modo que uma MESSAGE
+    recebida por um worker é encaminhada a um destinatário registrado em outro.
+
+    Args:
+        num_workers (int): Número de processos worker.
+        server_class (type): A classe de servidor executada em cada worker.
+        address (tuple): O endereço (host, porta) em que os workers escutam.
+        capacity (int): Número máximo de clientes no registro compartilhado.
+        worker_setup (callable): Função chamada em cada worker, após o fork, antes de criar o servidor.
+        server_setup (callable): Função chamada em cada worker com o servidor criado e o índice do worker.
+
+    Raises:
+        RuntimeError: Se a plataforma não suportar SO_REUSEPORT ou fork.
+    '''
+    if not hasattr(socket, "SO_REUSEPORT") or "fork" not in multiprocessing.get_all_start_methods():
+        raise RuntimeError("O modo com múltiplos workers requer SO_REUSEPORT e fork")
+
+    context = multiprocessing.get_context("fork")
+    table = SharedClientTable(capacity)
+    processes = [
+        context.Process(target=_worker_main, args=(index, server_class, address, table, worker_setup, server_setup), name=f"twotter-worker-{index}")
+        for index in range(num_workers)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        logger.info("Encerrando workers...")
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
@@ -1,10 +1,9 @@
 # -*- coding: utf-8 -*-
-import time
-
 import streamlit as st
 
 from twotter import TwotterClient
 from twotter.utils import remove_control_characters
+from twotter.config import MESSAGE_HISTORY_SIZE, MESSAGE_PAGE_SIZE, UI_REFRESH_INTERVAL_IN_SECONDS
 
 
 class TwotterClientUI:
@@ -19,13 +18,24 @@ class TwotterClientUI:
     '''
     def __init__(self, client: TwotterClient):
         self.client = client
+        self.page = 0
 
     def write_received_message(self):
         '''
-        Escreve as mensagens recebidas na interface do usuário.
+        Escreve as mensagens recebidas na interface do usuário. Apenas uma página
+        do histórico é exibida, então o custo de cada atualização não cresce com
+        a duração da sessão.
         '''
-        with self.messages:
-            for msg in self.client.received_messages:
+        history = self.client.received_messages
+        offset = self.page * MESSAGE_PAGE_SIZE
+        window = history.window(MESSAGE_PAGE_SIZE, offset)
+
+        messages = st.container()
+        with messages:
+            if self.page:
+                st.caption(f"Exibindo mensagens anteriores (página {self.page}). "
+                           f"Volte à página 0 para acompanhar as novas mensagens.")
+            for msg in window:
                 msg_text = msg.text
                 msg_username = msg.username
                 destiny_id = msg.destination_id
@@ -44,9 +54,12 @@ class TwotterClientUI:
             st.write(f"Seu ID no servidor: {self.client.client_id}")
             
             self.destination_id = st.number_input("ID do destinatário (0 para todos)", min_value=0, value=0)
-            
+
+            last_page = max(0, (MESSAGE_HISTORY_SIZE - 1) // MESSAGE_PAGE_SIZE)
+            self.page = st.number_input("Página do histórico (0 = mais recentes)", min_value=0, max_value=last_page, value=0)
+
             self.setup_space()
-            self.setup_show_online_clients()
+            st.fragment(self.setup_show_online_clients, run_every=UI_REFRESH_INTERVAL_IN_SECONDS)()
             
             self.setup_space()
             self.setup_exit_button()
@@ -59,7 +72,10 @@ class TwotterClientUI:
                 self.client.send_message(prompt, int(self.client.client_id))
     
     def setup_show_online_clients(self):
-        self.client.send_get_online_clients()
+        # A lista é mantida pelos deltas enviados pelo servidor; a consulta
+        # GET_ONLINE_CLIENTS só é usada com servidores sem suporte a presença.
+        if not self.client.ensure_presence():
+            self.client.send_get_online_clients()
         st.write(f"Clientes Online: {self.client.online_users}")
     
     def setup_exit_button(self):
@@ -79,9 +95,7 @@ class TwotterClientUI:
     def run_chat_ui(self):
         st.title("Twotter Chat")
         self.setup_sidebar()
-        self.messages = st.container()
-        self.write_received_message()
-        self.setup_chat_input()
-        
-        time.sleep(0.4)
-        st.rerun()
\ No newline at end of file
+        # Apenas as mensagens e a lista de clientes online são atualizadas
+        # periodicamente, sem reexecutar a página inteira.
+        st.fragment(self.write_received_message, run_every=UI_REFRESH_INTERVAL_IN_SECONDS)()
+        self.setup_chat_input()
\ No newline at end of file
@@ -1,2 +1,3 @@
-from .message_utils import encode_message, decode_message, remove_control_characters
-from .logger import logger
\ No newline at end of file
+from .message_utils import (encode_message, encode_message_into, decode_message, decode_message_lazy,
+                            peek_header, remove_control_characters, LazyTwotterMessage, MESSAGE_SIZE)
+from .logger import logger, message_log, configure_logging, enable_async_logging
\ No newline at end of file
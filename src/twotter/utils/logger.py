@@ -1,16 +1,207 @@
+import atexit
 import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+LOG_BATCH_SIZE = 256
+
+LOG_FILE = 'server.log'
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 
 logger = logging.getLogger('twotter')
 logger.setLevel(logging.INFO)
 
-file_handler = logging.FileHandler('server.log')
-file_handler.setLevel(logging.INFO)
 
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
+def configure_logging(filename=LOG_FILE, console=True, level=logging.INFO):
+    '''
+    Instala os handlers do logger do Twotter: o arquivo de log e o console.
+    Importar o pacote não cria handlers nem arquivos; o servidor chama esta
+    função ao iniciar, e clientes e ferramentas só a chamam se quiserem o
+    log. Chamadas seguintes não têm efeito.
+
+    Args:
+        filename (str): O arquivo de log, ou None para não escrever em arquivo.
+        console (bool): Se o log também é exibido no console.
+        level (int): O nível mínimo dos registros escritos.
+
+    Returns:
+        bool: Se os handlers foram instalados nesta chamada.
+    '''
+    global _configured
+    if _configured:
+        return False
+    _configured = True
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+    if filename is not None:
+        handlers.append(logging.FileHandler(filename))
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setLevel(level)
+        handler.setFormatter(formatter)
+        if _writer is not None:
+            _writer.handlers.append(handler)
+        else:
+            logger.addHandler(handler)
+    return True
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    '''
+    QueueHandler que enfileira o registro sem formatá-lo. Como o consumidor
+    está no mesmo processo, a formatação fica a cargo da thread de escrita.
+    '''
+    def prepare(self, record):
+        return record
+
+
+class BatchingLogWriter:
+    '''
+    Thread que consome os registros de log de uma fila e os escreve nos
+    handlers em lotes, fazendo um único flush por handler a cada lote.
+
+    Args:
+        handlers (list): Os handlers que efetivamente escrevem os registros.
+        batch_size (int): Número máximo de registros por lote.
+
+    Attributes:
+        queue (queue.SimpleQueue): A fila de onde os registros são consumidos.
+    '''
+    def __init__(self, handlers, batch_size=LOG_BATCH_SIZE):
+        self.handlers = list(handlers)
+        self.batch_size = batch_size
+        self.queue = queue.SimpleQueue()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="twotter-log-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        '''
+        Escreve os registros pendentes e encerra a thread de escrita.
+        '''
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            records = [record for record in batch if record is not None]
+            for handler in self.handlers:
+                self._write(handler, records)
+            if stop:
+                return
+
+    def _write(self, handler, records):
+        if not isinstance(handler, logging.StreamHandler):
+            for record in records:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+            return
+
+        with handler.lock:
+            try:
+                if handler.stream is None:
+                    # FileHandler com delay=True ainda não abriu o arquivo.
+                    handler.stream = handler._open()
+                for record in records:
+                    if record.levelno >= handler.level and handler.filter(record):
+                        handler.stream.write(handler.format(record) + handler.terminator)
+                handler.flush()
+            except Exception:
+                for record in records:
+                    handler.handleError(record)
+
+
+_writer = None
+_configured = False
+
+
+def enable_async_logging(batch_size=LOG_BATCH_SIZE):
+    '''
+    Substitui os handlers do logger do Twotter por uma fila consumida por uma
+    BatchingLogWriter, tirando a escrita em disco e no console da thread que
+    processa as mensagens. Os registros pendentes são escritos ao final do
+    processo. Handlers instalados depois por configure_logging também passam
+    pela fila.
+
+    Returns:
+        BatchingLogWriter: A thread de escrita criada (ou a já existente).
+    '''
+    global _writer
+    if _writer is not None:
+        return _writer
+    _writer = BatchingLogWriter(logger.handlers, batch_size)
+    for handler in _writer.handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(_DeferredQueueHandler(_writer.queue))
+    _writer.start()
+    atexit.register(_writer.stop)
+    return _writer
+
+
+class MessageLogSampler:
+    '''
+    Decide quais das mensagens de log por mensagem encaminhada devem ser
+    emitidas, com amostragem (uma a cada sample_every) e limite por segundo.
+    O teste deve ser feito antes de montar os argumentos do log, para que as
+    mensagens descartadas não custem nada além de should_log.
+
+    Args:
+        enabled (bool): Se as mensagens de log por mensagem são emitidas.
+        sample_every (int): Emite uma a cada sample_every mensagens.
+        max_per_second (int): Número máximo de mensagens emitidas por segundo (0 para ilimitado).
+
+    Attributes:
+        suppressed (int): Número de mensagens de log descartadas.
+    '''
+    def __init__(self, enabled=True, sample_every=1, max_per_second=0):
+        self.suppressed = 0
+        self._count = 0
+        self._second = 0
+        self._emitted_this_second = 0
+        self.configure(enabled, sample_every, max_per_second)
+
+    def configure(self, enabled=True, sample_every=1, max_per_second=0):
+        self.enabled = enabled
+        self.sample_every = max(1, sample_every)
+        self.max_per_second = max_per_second
+
+    def should_log(self):
+        if not self.enabled or not logger.isEnabledFor(logging.INFO):
+            self.suppressed += 1
+            return False
+
+        if self.sample_every > 1:
+            self._count += 1
+            if self._count % self.sample_every:
+                self.suppressed += 1
+                return False
+
+        if self.max_per_second:
+            second = int(time.monotonic())
+            if second != self._second:
+                self._second = second
+                self._emitted_this_second = 0
+            if self._emitted_this_second >= self.max_per_second:
+                self.suppressed += 1
+                return False
+            self._emitted_this_second += 1
+        return True
 
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
 
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
\ No newline at end of file
+message_log = MessageLogSampler()
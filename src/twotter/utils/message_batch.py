@@ -0,0 +1,197 @@
+'''
+Codificação e decodificação em lote de quadros v1, com NumPy.
+
+O quadro fixo '!IIII20s141s' corresponde exatamente a um dtype estruturado
+do NumPy, então milhares de quadros contíguos (um trace, um arquivo, a
+concatenação de datagramas) são lidos sem cópia e sem criar um objeto por
+mensagem: os tipos, origens e destinos viram vetores, e os nomes de usuário
+e textos só são decodificados quando a coluna (ou uma mensagem) é acessada.
+
+O NumPy é uma dependência opcional (pip install numpy), usada apenas pelas
+ferramentas offline; sem ele, importar este módulo levanta ImportError.
+'''
+import numpy as np
+
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.utils.message_utils import MESSAGE_SIZE
+
+FRAME_DTYPE = np.dtype([
+    ("message_type", ">u4"),
+    ("origin_id", ">u4"),
+    ("destination_id", ">u4"),
+    ("text_size", ">u4"),
+    ("username", "S20"),
+    ("text", "S141"),
+])
+assert FRAME_DTYPE.itemsize == MESSAGE_SIZE
+
+
+class MessageBatch:
+    '''
+    Um lote de quadros v1 em colunas. message_type, origin_id e
+    destination_id são vetores uint32 (na ordem de bytes nativa); usernames
+    e texts são decodificados por inteiro no primeiro acesso, e username(i)
+    e text(i) decodificam apenas uma mensagem.
+
+    Args:
+        frames (numpy.ndarray): Os quadros, com dtype FRAME_DTYPE.
+        errors (str): Tratamento de UTF-8 inválido na decodificação dos textos ("strict", "replace"...).
+
+    Attributes:
+        frames (numpy.ndarray): Os quadros, como recebidos.
+        message_type (numpy.ndarray): O tipo de cada mensagem.
+        origin_id (numpy.ndarray): A origem de cada mensagem.
+        destination_id (numpy.ndarray): O destino de cada mensagem.
+    '''
+    def __init__(self, frames, errors="strict"):
+        self.frames = frames
+        self.errors = errors
+        self.message_type = frames["message_type"].astype(np.uint32)
+        self.origin_id = frames["origin_id"].astype(np.uint32)
+        self.destination_id = frames["destination_id"].astype(np.uint32)
+        self._usernames = None
+        self._texts = None
+
+    def __len__(self):
+        return len(self.frames)
+
+    def _decode(self, value):
+        # O dtype "S" já descarta os NUL do final; os do início são removidos como em decode_message.
+        return value.decode("utf-8", self.errors).strip("\0")
+
+    def username(self, index):
+        if self._usernames is not None:
+            return self._usernames[index]
+        return self._decode(self.frames["username"][index])
+
+    def text(self, index):
+        if self._texts is not None:
+            return self._texts[index]
+        return self._decode(self.frames["text"][index])
+
+    @property
+    def usernames(self):
+        '''
+        Os nomes de usuário de todas as mensagens, decodificados no primeiro acesso.
+        '''
+        if self._usernames is None:
+            self._usernames = [self._decode(value) for value in self.frames["username"].tolist()]
+        return self._usernames
+
+    @property
+    def texts(self):
+        '''
+        Os textos de todas as mensagens, decodificados no primeiro acesso.
+        '''
+        if self._texts is None:
+            self._texts = [self._decode(value) for value in self.frames["text"].tolist()]
+        return self._texts
+
+    def __getitem__(self, index):
+        '''
+        Retorna a mensagem index como TwotterMessage, ou, com uma fatia ou uma
+        máscara booleana, um novo MessageBatch com as mensagens selecionadas.
+        '''
+        if isinstance(index, (int, np.integer)):
+            return TwotterMessage(int(self.message_type[index]), int(self.origin_id[index]),
+                                  int(self.destination_id[index]), self.username(index), self.text(index))
+        return MessageBatch(self.frames[index], self.errors)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def of_type(self, message_type):
+        '''
+        Seleciona as mensagens de um tipo.
+
+        Returns:
+            MessageBatch: As mensagens selecionadas.
+        '''
+        if isinstance(message_type, MessageType):
+            message_type = message_type.value
+        return self[self.message_type == message_type]
+
+    def tobytes(self):
+        '''
+        Os quadros codificados, concatenados.
+        '''
+        return self.frames.tobytes()
+
+
+def decode_batch(data, errors="strict"):
+    '''
+    Decodifica quadros v1 contíguos, sem copiar os dados.
+
+    Args:
+        data (bytes | bytearray | memoryview | mmap): Os quadros concatenados.
+        errors (str): Tratamento de UTF-8 inválido na decodificação dos textos.
+
+    Returns:
+        MessageBatch: As mensagens em colunas.
+
+    Raises:
+        ValueError: Se o tamanho dos dados não é múltiplo de MESSAGE_SIZE.
+    '''
+    if len(data) % MESSAGE_SIZE:
+        raise ValueError(f"{len(data)} bytes não formam um número inteiro de quadros de {MESSAGE_SIZE} bytes")
+    return MessageBatch(np.frombuffer(data, dtype=FRAME_DTYPE), errors)
+
+
+def decode_frames(frames, errors="strict"):
+    '''
+    Decodifica uma sequência de quadros v1 separados (por exemplo, datagramas).
+
+    Returns:
+        MessageBatch: As mensagens em colunas.
+    '''
+    return decode_batch(b''.join(frames), errors)
+
+
+def encode_batch(message_type, origin_id, destination_id, usernames, texts):
+    '''
+    Codifica mensagens dadas em colunas em quadros v1 concatenados. Os
+    números são atribuídos de uma vez; os textos são truncados como em
+    encode_message. Colunas escalares valem para todas as mensagens.
+
+    Args:
+        message_type (int | array): O tipo de cada mensagem.
+        origin_id (int | array): A origem de cada mensagem.
+        destination_id (int | array): O destino de cada mensagem.
+        usernames (list): O nome de usuário de cada mensagem.
+        texts (list): O texto de cada mensagem.
+
+    Returns:
+        bytes: Os quadros, equivalentes a encode_message aplicado a cada mensagem.
+    '''
+    if isinstance(message_type, MessageType):
+        message_type = message_type.value
+    texts = [text[:140] for text in texts]
+    encoded = [text.encode("utf-8") for text in texts]
+    frames = np.zeros(len(texts), dtype=FRAME_DTYPE)
+    frames["message_type"] = message_type
+    frames["origin_id"] = origin_id
+    frames["destination_id"] = destination_id
+    # Como em encode_message, os campos maiores que o quadro são truncados.
+    frames["username"] = np.array([username[:20].encode("utf-8") for username in usernames], dtype="S20")
+    frames["text"] = np.array(encoded, dtype="S141")
+    # O tamanho é o do texto completado com NUL até 141 caracteres e então codificado.
+    frames["text_size"] = (np.fromiter(map(len, encoded), np.int64, len(encoded)) + 141
+                           - np.fromiter(map(len, texts), np.int64, len(texts)))
+    return frames.tobytes()
+
+
+def encode_messages(messages):
+    '''
+    Codifica uma sequência de TwotterMessage em quadros v1 concatenados.
+
+    Returns:
+        bytes: Os quadros, equivalentes a encode_message aplicado a cada mensagem.
+    '''
+    messages = list(messages)
+    return encode_batch(np.fromiter((getattr(message.message_type, "value", message.message_type) for message in messages),
+                                    np.uint32, len(messages)),
+                        np.fromiter((message.origin_id for message in messages), np.uint32, len(messages)),
+                        np.fromiter((message.destination_id for message in messages), np.uint32, len(messages)),
+                        [message.username for message in messages],
+                        [message.text for message in messages])
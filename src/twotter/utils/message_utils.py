@@ -1,42 +1,116 @@
 from twotter.entitites import TwotterMessage, MessageType
 import struct
 
+# Formato fixo de uma mensagem: tipo, origem, destino, tamanho do texto, usuário e texto.
+MESSAGE_STRUCT = struct.Struct('!IIII20s141s')
+MESSAGE_SIZE = MESSAGE_STRUCT.size
+
+# Apenas os três primeiros campos, suficientes para rotear uma mensagem.
+HEADER_STRUCT = struct.Struct('!III')
+
+_USERNAME_OFFSET = struct.calcsize('!IIII')
+_TEXT_OFFSET = _USERNAME_OFFSET + 20
+_TEXT_END = _TEXT_OFFSET + 141
+
+
+def _message_fields(message: TwotterMessage) -> tuple:
+    username = message.username[:20].ljust(20, '\0')
+    text = message.text[:140].ljust(141, '\0')
+    encoded_text = text.encode('utf-8')
+
+    message_type = message.message_type
+    if type(message_type) == MessageType:
+        message_type = message_type.value
+
+    return (message_type, message.origin_id, message.destination_id, len(encoded_text), username.encode('utf-8'), encoded_text)
+
 
 def encode_message(message: TwotterMessage) -> bytes:
     """
     Codifica um objeto TwotterMessage em um objeto bytes.
     """
-    username = message.username[:20].ljust(20, '\0')  
-    text = message.text[:140].ljust(141, '\0')  
-
-    text_size = len(text.encode('utf-8'))
+    return MESSAGE_STRUCT.pack(*_message_fields(message))
 
-    if type(message.message_type) == MessageType:
-        message.message_type = message.message_type.value
 
-    message = struct.pack('!IIII20s141s', message.message_type, message.origin_id, message.destination_id, text_size, username.encode('utf-8'), text.encode('utf-8'))
-
-    return message
+def encode_message_into(message: TwotterMessage, buffer, offset: int = 0) -> int:
+    """
+    Codifica um objeto TwotterMessage diretamente em um buffer gravável
+    (bytearray, memoryview...) a partir de offset, sem alocar um novo objeto bytes.
+    Retorna o número de bytes escritos.
+    """
+    MESSAGE_STRUCT.pack_into(buffer, offset, *_message_fields(message))
+    return MESSAGE_SIZE
 
 
 def decode_message(message: bytes) -> TwotterMessage:
     """
     Decodifica um objeto bytes em um objeto TwotterMessage.
     """
-    msg_type, origin_id, destination_id, text_size, username, text = struct.unpack('!IIII20s141s', message)
-    
+    msg_type, origin_id, destination_id, text_size, username, text = MESSAGE_STRUCT.unpack(message)
+
     username = username.decode('utf-8').strip('\0')
     text = text.decode('utf-8').strip('\0')
-    
-    return TwotterMessage(msg_type, 
-                          origin_id, 
-                          destination_id, 
-                          username, 
+
+    return TwotterMessage(msg_type,
+                          origin_id,
+                          destination_id,
+                          username,
                           text)
 
 
+def peek_header(message, offset: int = 0) -> tuple:
+    """
+    Lê apenas o tipo, a origem e o destino de uma mensagem codificada, sem
+    copiar nem decodificar o restante. Aceita bytes, bytearray ou memoryview.
+    """
+    return HEADER_STRUCT.unpack_from(message, offset)
+
+
+class LazyTwotterMessage:
+    """
+    Visão de uma mensagem codificada que decodifica o cabeçalho imediatamente
+    e o nome de usuário e o texto apenas quando acessados. Pode ser usada no
+    lugar de TwotterMessage onde só os campos são lidos.
+    """
+    __slots__ = ('data', 'message_type', 'origin_id', 'destination_id', '_username', '_text')
+
+    def __init__(self, data):
+        if len(data) != MESSAGE_SIZE:
+            raise struct.error(f"mensagem com {len(data)} bytes, esperado {MESSAGE_SIZE}")
+        self.data = data
+        self.message_type, self.origin_id, self.destination_id = HEADER_STRUCT.unpack_from(data)
+        self._username = None
+        self._text = None
+
+    @property
+    def username(self) -> str:
+        if self._username is None:
+            self._username = bytes(self.data[_USERNAME_OFFSET:_TEXT_OFFSET]).decode('utf-8').strip('\0')
+        return self._username
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = bytes(self.data[_TEXT_OFFSET:_TEXT_END]).decode('utf-8').strip('\0')
+        return self._text
+
+    def to_message(self) -> TwotterMessage:
+        return TwotterMessage(self.message_type, self.origin_id, self.destination_id, self.username, self.text)
+
+    def __str__(self) -> str:
+        return f"TwotterMessage({self.message_type}, {self.origin_id}, {self.destination_id}, {self.username}, {self.text})"
+
+
+def decode_message_lazy(message) -> LazyTwotterMessage:
+    """
+    Decodifica apenas o cabeçalho de uma mensagem, adiando a decodificação do
+    nome de usuário e do texto até que sejam acessados.
+    """
+    return LazyTwotterMessage(message)
+
+
 def remove_control_characters(text):
     '''
     Remove caracteres que não são imprimíveis (ASCII ou Unicode)
     '''
-    return ''.join(ch for ch in text if ch.isprintable())
\ No newline at end of file
+    return ''.join(ch for ch in text if ch.isprintable())
@@ -0,0 +1,141 @@
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.utils.message_utils import LazyTwotterMessage, decode_message, encode_message
+import struct
+
+# Um datagrama v2 começa com este byte. Os quadros v1 começam com o byte mais
+# significativo do tipo da mensagem (sempre zero), então as versões não se confundem.
+V2_MAGIC = 0xF2
+V2_PREFIX = bytes([V2_MAGIC])
+# Capacidade anunciada no texto do HELLO para negociar o protocolo v2.
+V2_FEATURE = "v2"
+# Tamanho máximo de um datagrama v2 com várias mensagens (MTU Ethernet menos cabeçalhos IP e UDP).
+MAX_DATAGRAM_SIZE = 1472
+
+# Cabeçalho de cada registro: tipo, origem, destino, tamanho do usuário e tamanho do texto.
+RECORD_HEADER = struct.Struct('!BIIBH')
+
+
+def parse_features(text):
+    '''
+    Retorna o conjunto de capacidades anunciadas no texto de um HELLO ("v2,rel", por exemplo).
+    '''
+    return {feature.strip() for feature in text.split(",") if feature.strip()}
+
+
+def encode_record(message) -> bytes:
+    """
+    Codifica uma mensagem como um registro v2, sem preenchimento: apenas os
+    bytes do usuário e do texto são enviados.
+    """
+    username = message.username[:20].rstrip('\0').encode('utf-8')
+    text = message.text[:140].encode('utf-8')
+
+    message_type = message.message_type
+    if type(message_type) == MessageType:
+        message_type = message_type.value
+
+    return RECORD_HEADER.pack(message_type, message.origin_id, message.destination_id, len(username), len(text)) + username + text
+
+
+class LazyV2Message:
+    """
+    Visão de um registro v2 de um datagrama. O cabeçalho é decodificado
+    imediatamente e o usuário e o texto apenas quando acessados.
+    O atributo data contém os bytes do registro, prontos para serem reenviados.
+    """
+    __slots__ = ('data', 'message_type', 'origin_id', 'destination_id', '_username_len', '_username', '_text')
+
+    def __init__(self, data, message_type, origin_id, destination_id, username_len):
+        self.data = data
+        self.message_type = message_type
+        self.origin_id = origin_id
+        self.destination_id = destination_id
+        self._username_len = username_len
+        self._username = None
+        self._text = None
+
+    @property
+    def username(self) -> str:
+        if self._username is None:
+            start = RECORD_HEADER.size
+            self._username = bytes(self.data[start:start + self._username_len]).decode('utf-8')
+        return self._username
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = bytes(self.data[RECORD_HEADER.size + self._username_len:]).decode('utf-8')
+        return self._text
+
+    def to_message(self) -> TwotterMessage:
+        return TwotterMessage(self.message_type, self.origin_id, self.destination_id, self.username, self.text)
+
+    def __str__(self) -> str:
+        return f"TwotterMessage({self.message_type}, {self.origin_id}, {self.destination_id}, {self.username}, {self.text})"
+
+
+def decode_records(datagram) -> list:
+    """
+    Decodifica os registros de um datagrama v2 em objetos LazyV2Message.
+
+    Raises:
+        ValueError: Se o datagrama não for v2 ou estiver truncado.
+    """
+    if not datagram or datagram[0] != V2_MAGIC:
+        raise ValueError("datagrama não é do protocolo v2")
+
+    messages = []
+    offset = 1
+    end = len(datagram)
+    while offset < end:
+        message_type, origin_id, destination_id, username_len, text_len = RECORD_HEADER.unpack_from(datagram, offset)
+        record_end = offset + RECORD_HEADER.size + username_len + text_len
+        if record_end > end:
+            raise ValueError("registro v2 truncado")
+        messages.append(LazyV2Message(datagram[offset:record_end], message_type, origin_id, destination_id, username_len))
+        offset = record_end
+    return messages
+
+
+def pack_records(records, max_size=MAX_DATAGRAM_SIZE) -> list:
+    """
+    Agrupa registros v2 no menor número de datagramas de até max_size bytes,
+    mantendo a ordem. Um registro maior que max_size vai sozinho em um datagrama.
+    """
+    datagrams = []
+    current = bytearray(V2_PREFIX)
+    for record in records:
+        if len(current) > 1 and len(current) + len(record) > max_size:
+            datagrams.append(bytes(current))
+            current = bytearray(V2_PREFIX)
+        current += record
+    if len(current) > 1:
+        datagrams.append(bytes(current))
+    return datagrams
+
+
+def to_v1_frame(message) -> bytes:
+    """
+    Retorna a mensagem no formato v1, reaproveitando os bytes recebidos quando possível.
+    """
+    if isinstance(message, LazyTwotterMessage):
+        return bytes(message.data)
+    return encode_message(message)
+
+
+def to_v2_record(message) -> bytes:
+    """
+    Retorna a mensagem como um registro v2, reaproveitando os bytes recebidos quando possível.
+    """
+    if isinstance(message, LazyV2Message):
+        return bytes(message.data)
+    return encode_record(message)
+
+
+def decode_datagram(datagram) -> list:
+    """
+    Decodifica um datagrama de qualquer versão do protocolo em uma lista de TwotterMessage.
+    """
+    if datagram[:1] == V2_PREFIX:
+        return [message.to_message() for message in decode_records(datagram)]
+    return [decode_message(datagram)]
@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import time
+
+from twotter.entitites import MessageType
+from twotter.utils.logger import logger
+
+# Tipos de mensagem acima deste valor são contabilizados no último índice.
+MAX_MESSAGE_TYPES = 32
+# Buckets de potência de 2 em nanossegundos: o bucket b contém tempos em [2^(b-1), 2^b).
+HISTOGRAM_BUCKETS = 64
+DEFAULT_DUMP_INTERVAL_IN_SECONDS = 10
+
+
+def _type_name(index):
+    try:
+        return MessageType(index).name
+    except ValueError:
+        return str(index) if index < MAX_MESSAGE_TYPES - 1 else "OTHER"
+
+
+def socket_receive_backlog(sock):
+    '''
+    Retorna o número de bytes aguardando leitura na fila de recepção de um
+    socket UDP, lido de /proc/net/udp (Linux). Retorna None se não disponível.
+    '''
+    try:
+        inode = os.fstat(sock.fileno()).st_ino
+        with open("/proc/net/udp") as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if int(fields[9]) == inode:
+                    return int(fields[4].split(":")[1], 16)
+    except (OSError, ValueError, IndexError, StopIteration):
+        return None
+    return None
+
+
+class ServerMetrics:
+    '''
+    Contadores por tipo de mensagem (recebidas, encaminhadas, com erro,
+    descartadas e rejeitadas pelo controle de admissão), histogramas do tempo de serviço de handle_message e gauges
+    avaliados sob demanda. As operações do caminho quente são apenas
+    incrementos em listas indexadas pelo tipo da mensagem.
+
+    Attributes:
+        received (list): Mensagens recebidas, por tipo.
+        forwarded (list): Mensagens encaminhadas, por tipo.
+        errored (list): Mensagens cujo processamento gerou exceção, por tipo.
+        dropped (list): Mensagens descartadas, por tipo.
+        shed (list): Mensagens rejeitadas pelo controle de admissão, por tipo.
+        service_time (list): Histograma do tempo de serviço, por tipo.
+    '''
+    def __init__(self):
+        self.start_time = time.time()
+        self.received = [0] * MAX_MESSAGE_TYPES
+        self.forwarded = [0] * MAX_MESSAGE_TYPES
+        self.errored = [0] * MAX_MESSAGE_TYPES
+        self.dropped = [0] * MAX_MESSAGE_TYPES
+        self.shed = [0] * MAX_MESSAGE_TYPES
+        self.service_time = [[0] * HISTOGRAM_BUCKETS for _ in range(MAX_MESSAGE_TYPES)]
+        self.gauges = {}
+
+    @staticmethod
+    def index(message_type):
+        if message_type is None or message_type >= MAX_MESSAGE_TYPES:
+            return MAX_MESSAGE_TYPES - 1
+        return message_type
+
+    def observe(self, message_type, elapsed_ns):
+        '''
+        Registra o recebimento de uma mensagem e o tempo gasto para processá-la.
+        '''
+        index = self.index(message_type)
+        self.received[index] += 1
+        self.service_time[index][min(elapsed_ns.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def count_forwarded(self, message_type, count=1):
+        self.forwarded[self.index(message_type)] += count
+
+    def count_errored(self, message_type, count=1):
+        self.errored[self.index(message_type)] += count
+
+    def count_dropped(self, message_type, count=1):
+        self.dropped[self.index(message_type)] += count
+
+    def count_shed(self, message_type, count=1):
+        self.shed[self.index(message_type)] += count
+
+    def add_gauge(self, name, function):
+        '''
+        Registra um gauge, avaliado apenas quando um snapshot é gerado.
+
+        Args:
+            name (str): O nome do gauge.
+            function (callable): Função sem argumentos que retorna o valor atual.
+        '''
+        self.gauges[name] = function
+
+    @staticmethod
+    def _summarize(histogram):
+        total = sum(histogram)
+        if not total:
+            return None
+        summary = {"count": total}
+        targets = {"p50_us": 0.5, "p90_us": 0.9, "p99_us": 0.99, "max_us": 1.0}
+        for name, fraction in targets.items():
+            threshold = total * fraction
+            seen = 0
+            for bucket, count in enumerate(histogram):
+                seen += count
+                if count and seen >= threshold:
+                    # Limite superior do bucket, em microssegundos.
+                    summary[name] = (1 << bucket) / 1000
+                    break
+        return summary
+
+    def snapshot(self):
+        '''
+        Retorna um dicionário com o estado atual de todos os contadores, histogramas e gauges.
+        '''
+        types = {}
+        for index in range(MAX_MESSAGE_TYPES):
+            counters = {
+                "received": self.received[index],
+                "forwarded": self.forwarded[index],
+                "errored": self.errored[index],
+                "dropped": self.dropped[index],
+                "shed": self.shed[index],
+            }
+            if not any(counters.values()):
+                continue
+            service_time = self._summarize(list(self.service_time[index]))
+            if service_time:
+                counters["service_time"] = service_time
+            types[_type_name(index)] = counters
+
+        gauges = {}
+        for name, function in self.gauges.items():
+            try:
+                gauges[name] = function()
+            except Exception as e:
+                gauges[name] = None
+                logger.warning("Erro ao avaliar o gauge %s: %s", name, e)
+
+        return {
+            "timestamp": time.time(),
+            "uptime_s": time.time() - self.start_time,
+            "types": types,
+            "gauges": gauges,
+        }
+
+
+class MetricsDumper:
+    '''
+    Thread que grava periodicamente um snapshot das métricas em um arquivo JSON.
+    O arquivo é substituído de forma atômica, então leitores nunca veem um arquivo parcial.
+
+    Args:
+        metrics (ServerMetrics): As métricas a serem gravadas.
+        path (str): O caminho do arquivo JSON.
+        interval (float): Intervalo entre gravações, em segundos.
+    '''
+    def __init__(self, metrics, path, interval=DEFAULT_DUMP_INTERVAL_IN_SECONDS):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def dump(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.metrics.snapshot(), f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="twotter-metrics", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.dump()
+            except Exception as e:
+                logger.error("Erro ao gravar métricas em %s: %s", self.path, e)
@@ -0,0 +1,204 @@
+import heapq
+import itertools
+import math
+import random
+
+from twotter.utils.logger import logger
+
+# Variação relativa aplicada a cada intervalo, para que tarefas (e servidores) não fiquem sincronizados.
+DEFAULT_JITTER = 0.1
+# Pacotes por segundo permitidos às tarefas distribuídas; 0 desativa o limite.
+SCHEDULED_PACKETS_PER_SECOND = 500
+# Rajada máxima, em segundos de orçamento acumulado.
+PACING_BURST_IN_SECONDS = 0.05
+# Espera máxima retornada por next_deadline, para que o loop acompanhe novas tarefas.
+MAX_WAIT_IN_SECONDS = 1.0
+# Espera mínima por um token, para que um resto de ponto flutuante não reagende a rodada para o mesmo instante.
+MIN_WAIT_IN_SECONDS = 0.001
+
+
+class Job:
+    '''
+    Uma tarefa agendada em um Scheduler.
+
+    Attributes:
+        name (str): O nome da tarefa, usado no log.
+        interval (float): O intervalo nominal entre execuções (ou rodadas), em segundos.
+        runs (int): Número de execuções (ou rodadas completas).
+    '''
+    def __init__(self, name, interval, callback, jitter, keys=None):
+        self.name = name
+        self.interval = interval
+        self.callback = callback
+        self.jitter = jitter
+        self.keys = keys
+        self.runs = 0
+        self.cancelled = False
+        self.deadline = 0.0
+        # Estado da rodada de uma tarefa distribuída.
+        self.round = None
+        self.round_start = 0.0
+        self.round_length = 0.0
+        self.done = 0
+        self.overrun = False
+
+    @property
+    def spread(self):
+        return self.keys is not None
+
+
+class Scheduler:
+    '''
+    Agenda as tarefas periódicas do servidor para serem executadas no loop
+    de recepção, sem threads auxiliares:
+
+    - call_every executa uma função a cada intervalo, com jitter;
+    - spread_every distribui um trabalho por cliente (por exemplo, a mensagem
+      de status) ao longo do intervalo: cada rodada toma a lista de chaves e
+      processa a fração proporcional ao tempo decorrido, em vez de todas de
+      uma vez. As chaves mantêm a mesma posição (fase) de uma rodada para
+      outra, então cada cliente é atendido uma vez por intervalo;
+    - as tarefas distribuídas compartilham um orçamento de pacotes por
+      segundo (token bucket). Se o orçamento não basta para uma rodada no
+      intervalo, a rodada se estende, sem rajadas e sem descartar chaves.
+
+    O loop chama run_due a cada iteração e usa next_deadline para saber
+    quanto pode esperar por datagramas.
+
+    Args:
+        packets_per_second (float): Orçamento das tarefas distribuídas; 0 desativa o limite.
+        rng (random.Random): Gerador usado no jitter e na ordem das chaves.
+
+    Attributes:
+        stats (dict): Execuções, chaves processadas, rodadas estendidas por falta de orçamento e erros.
+    '''
+    def __init__(self, packets_per_second=SCHEDULED_PACKETS_PER_SECOND, rng=None):
+        self.packets_per_second = packets_per_second
+        self.rng = rng or random.Random()
+        self._heap = []
+        self._counter = itertools.count()
+        self._tokens = 0.0
+        self._updated = None
+        self.stats = {"runs": 0, "keys": 0, "overruns": 0, "errors": 0}
+
+    def _jittered(self, job):
+        return job.interval * self.rng.uniform(1 - job.jitter, 1 + job.jitter)
+
+    def _push(self, job):
+        heapq.heappush(self._heap, (job.deadline, next(self._counter), job))
+
+    def call_every(self, interval, callback, now, jitter=DEFAULT_JITTER, name=None):
+        '''
+        Executa callback() a cada interval segundos (com jitter), a partir de now + interval.
+
+        Returns:
+            Job: A tarefa, que pode ser cancelada com cancel.
+        '''
+        job = Job(name or getattr(callback, "__name__", "tarefa"), interval, callback, jitter)
+        job.deadline = now + self._jittered(job)
+        self._push(job)
+        return job
+
+    def spread_every(self, interval, keys, callback, now, jitter=DEFAULT_JITTER, name=None):
+        '''
+        A cada interval segundos (com jitter) inicia uma rodada sobre as chaves
+        retornadas por keys() e chama callback(chave) para cada uma,
+        distribuídas ao longo da rodada e limitadas pelo orçamento de pacotes.
+        Cada chamada de callback conta como um pacote.
+
+        Returns:
+            Job: A tarefa, que pode ser cancelada com cancel.
+        '''
+        job = Job(name or getattr(callback, "__name__", "tarefa"), interval, callback, jitter, keys)
+        job.deadline = now + self._jittered(job)
+        self._push(job)
+        return job
+
+    def cancel(self, job):
+        job.cancelled = True
+
+    def __len__(self):
+        return sum(not job.cancelled for _, _, job in self._heap)
+
+    def _refill(self, now):
+        if self._updated is None:
+            self._updated = now
+        rate = self.packets_per_second
+        burst = max(1.0, rate * PACING_BURST_IN_SECONDS)
+        self._tokens = min(burst, self._tokens + (now - self._updated) * rate)
+        self._updated = now
+
+    def next_deadline(self, now):
+        '''
+        Retorna quanto o loop pode esperar, em segundos, até a próxima tarefa.
+        '''
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return MAX_WAIT_IN_SECONDS
+        return min(MAX_WAIT_IN_SECONDS, max(0.0, self._heap[0][0] - now))
+
+    def run_due(self, now):
+        '''
+        Executa as tarefas vencidas e a parte devida das rodadas em andamento.
+        '''
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, _, job = heapq.heappop(heap)
+            if job.cancelled:
+                continue
+            try:
+                if job.spread:
+                    self._run_spread(job, now)
+                else:
+                    job.callback()
+                    job.runs += 1
+                    self.stats["runs"] += 1
+                    job.deadline = now + self._jittered(job)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error("Erro na tarefa agendada %s: %s", job.name, e)
+                if job.spread:
+                    job.round = None
+                job.deadline = now + self._jittered(job)
+            self._push(job)
+
+    def _run_spread(self, job, now):
+        if job.round is None:
+            # Ordem estável: a fase de cada chave não muda entre as rodadas.
+            job.round = sorted(job.keys(), key=hash)
+            job.round_start = now
+            job.round_length = self._jittered(job)
+            job.done = 0
+            job.overrun = False
+
+        count = len(job.round)
+        elapsed = now - job.round_start
+        due = count if elapsed >= job.round_length else math.ceil(count * elapsed / job.round_length)
+        if self.packets_per_second > 0:
+            self._refill(now)
+            due = min(due, job.done + int(self._tokens))
+            self._tokens -= due - job.done
+        for key in job.round[job.done:due]:
+            job.callback(key)
+        self.stats["keys"] += due - job.done
+        job.done = due
+
+        if job.done < count:
+            # Próxima chave: quando chegar a sua fase ou, sem orçamento, quando houver um token.
+            next_due = job.round_start + job.round_length * (job.done + 1) / count
+            if self.packets_per_second > 0 and self._tokens < 1:
+                next_due = max(next_due, now + max(MIN_WAIT_IN_SECONDS, (1 - self._tokens) / self.packets_per_second))
+                job.overrun = job.overrun or now >= job.round_start + job.round_length
+            job.deadline = next_due
+            return
+
+        job.runs += 1
+        self.stats["runs"] += 1
+        if job.overrun:
+            self.stats["overruns"] += 1
+            logger.warning("Rodada de %s com %d chaves excedeu o intervalo: orçamento de %g pacotes/s insuficiente",
+                           job.name, count, self.packets_per_second)
+        job.round = None
+        # A próxima rodada começa um intervalo depois do início desta (ou já, se esta se estendeu).
+        job.deadline = max(now, job.round_start + job.round_length)
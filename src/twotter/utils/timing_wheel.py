@@ -0,0 +1,79 @@
+import math
+
+
+class TimingWheel:
+    '''
+    Roda de temporização (hashed timing wheel) para expirar chaves inativas.
+
+    Cada chave fica em um único slot, correspondente ao tick em que expira.
+    touch e remove custam O(1), e advance visita apenas os slots dos ticks
+    decorridos desde a última chamada, de modo que o custo da expiração é
+    proporcional ao número de chaves que realmente expiram.
+
+    Args:
+        timeout (float): Tempo sem contato, em segundos, após o qual uma chave expira.
+        tick (float): Resolução da roda, em segundos. Uma chave expira com até um tick de atraso.
+        now (float): Instante inicial da roda.
+
+    Attributes:
+        timeout (float): Tempo sem contato após o qual uma chave expira.
+        tick (float): Resolução da roda, em segundos.
+    '''
+    def __init__(self, timeout, tick=1.0, now=0.0):
+        self.timeout = timeout
+        self.tick = tick
+        self._num_slots = int(math.ceil(timeout / tick)) + 2
+        self._slots = [set() for _ in range(self._num_slots)]
+        self._deadlines = {}
+        self._current_tick = int(now // tick)
+
+    def touch(self, key, now):
+        '''
+        Registra um contato de key no instante now, adiando sua expiração.
+        '''
+        deadline = int((now + self.timeout) // self.tick) + 1
+        old_deadline = self._deadlines.get(key)
+        if old_deadline == deadline:
+            return
+        if old_deadline is not None:
+            self._slots[old_deadline % self._num_slots].discard(key)
+        self._slots[deadline % self._num_slots].add(key)
+        self._deadlines[key] = deadline
+
+    def remove(self, key):
+        '''
+        Remove key da roda, se presente.
+        '''
+        deadline = self._deadlines.pop(key, None)
+        if deadline is not None:
+            self._slots[deadline % self._num_slots].discard(key)
+
+    def advance(self, now):
+        '''
+        Avança a roda até o instante now e retorna as chaves expiradas, que são removidas da roda.
+
+        Returns:
+            list: As chaves cujo prazo expirou.
+        '''
+        target = int(now // self.tick)
+        steps = min(target - self._current_tick, self._num_slots)
+        expired = []
+        for step in range(1, steps + 1):
+            slot = self._slots[(self._current_tick + step) % self._num_slots]
+            if not slot:
+                continue
+            # Um slot pode conter chaves de uma volta futura da roda, que permanecem nele.
+            due = [key for key in slot if self._deadlines[key] <= target]
+            for key in due:
+                slot.discard(key)
+                del self._deadlines[key]
+            expired.extend(due)
+        if target > self._current_tick:
+            self._current_tick = target
+        return expired
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def __len__(self):
+        return len(self._deadlines)
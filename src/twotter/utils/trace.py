@@ -0,0 +1,307 @@
+import collections
+import socket
+import struct
+import sys
+import threading
+import time
+
+from twotter.utils.logger import logger
+
+# Cabeçalho do trace: marcador, versão do formato e instante (time.time()) do início da gravação.
+TRACE_HEADER = struct.Struct('!4sHd')
+TRACE_MAGIC = b"TWTR"
+TRACE_VERSION = 1
+# Cada datagrama: instante relativo ao início, endereço IPv4 e porta de origem e tamanho, seguido dos dados.
+TRACE_RECORD = struct.Struct('!d4sHH')
+
+TRACE_FLUSH_INTERVAL_IN_SECONDS = 1.0
+SAMPLE_INTERVAL_IN_SECONDS = 0.001
+
+TraceRecord = collections.namedtuple("TraceRecord", ["timestamp", "address", "data"])
+
+
+class TraceWriter:
+    '''
+    Grava os datagramas recebidos pelo servidor em um arquivo de trace
+    binário compacto, para reproduzi-los depois com replay_trace. Cada
+    datagrama é um write bufferizado; o buffer é enviado ao arquivo no
+    máximo uma vez por segundo.
+
+    Args:
+        path (str): O caminho do arquivo de trace.
+        max_bytes (int): Tamanho máximo do trace; ao atingi-lo a gravação para. None para sem limite.
+
+    Attributes:
+        records (int): Número de datagramas gravados.
+        size (int): Tamanho atual do trace, em bytes.
+    '''
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.records = 0
+        self._file = open(path, "wb")
+        self._start = time.monotonic()
+        self._next_flush = self._start + TRACE_FLUSH_INTERVAL_IN_SECONDS
+        self._file.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, time.time()))
+        self.size = TRACE_HEADER.size
+
+    @property
+    def full(self):
+        return self.max_bytes is not None and self.size >= self.max_bytes
+
+    def record(self, data, address):
+        '''
+        Grava um datagrama recebido.
+
+        Args:
+            data (bytes): O datagrama.
+            address (tuple): O endereço de origem.
+        '''
+        if self._file is None or self.full:
+            return
+        now = time.monotonic()
+        self._file.write(TRACE_RECORD.pack(now - self._start, socket.inet_aton(address[0]), address[1], len(data)))
+        self._file.write(data)
+        self.records += 1
+        self.size += TRACE_RECORD.size + len(data)
+        if self.full:
+            logger.warning("Trace %s atingiu %d bytes, gravação encerrada", self.path, self.max_bytes)
+            self._file.flush()
+        elif now >= self._next_flush:
+            self._next_flush = now + TRACE_FLUSH_INTERVAL_IN_SECONDS
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_trace(path):
+    '''
+    Lê um arquivo de trace gravado por TraceWriter. Uma entrada final
+    incompleta (gravação interrompida) é ignorada.
+
+    Returns:
+        list: Os TraceRecord, na ordem de chegada.
+
+    Raises:
+        ValueError: Se o arquivo não é um trace.
+    '''
+    with open(path, "rb") as file:
+        data = file.read()
+    if len(data) < TRACE_HEADER.size:
+        raise ValueError("Trace incompleto.")
+    magic, version, _ = TRACE_HEADER.unpack_from(data)
+    if magic != TRACE_MAGIC or version != TRACE_VERSION:
+        raise ValueError("Formato de trace desconhecido.")
+    records = []
+    offset = TRACE_HEADER.size
+    while offset + TRACE_RECORD.size <= len(data):
+        timestamp, host, port, size = TRACE_RECORD.unpack_from(data, offset)
+        offset += TRACE_RECORD.size
+        if offset + size > len(data):
+            break
+        records.append(TraceRecord(timestamp, (socket.inet_ntoa(host), port), data[offset:offset + size]))
+        offset += size
+    return records
+
+
+class StubSocket:
+    '''
+    Socket falso para a reprodução de traces: os envios apenas são contados.
+
+    Args:
+        address (tuple): O endereço retornado por getsockname.
+
+    Attributes:
+        sent (int): Número de datagramas enviados.
+        sent_bytes (int): Total de bytes enviados.
+    '''
+    # Diferente de AF_INET, para que o BroadcastFanout use sendto em vez de sendmmsg no descritor.
+    family = socket.AF_UNSPEC
+
+    def __init__(self, address=("127.0.0.1", 0)):
+        self.address = address
+        self.sent = 0
+        self.sent_bytes = 0
+        self._lock = threading.Lock()
+
+    def sendto(self, data, address):
+        with self._lock:
+            self.sent += 1
+            self.sent_bytes += len(data)
+        return len(data)
+
+    def getsockname(self):
+        return self.address
+
+    def getblocking(self):
+        return False
+
+    def fileno(self):
+        return -1
+
+    def close(self):
+        pass
+
+
+class HandlerProfile:
+    '''
+    Mede o tempo gasto em process_datagram, handle_message, em cada handler
+    (handle_*_message) e em flush de um servidor, substituindo os métodos da
+    instância por versões cronometradas.
+
+    Args:
+        server (TwotterServer): O servidor a ser medido.
+
+    Attributes:
+        calls (Counter): Número de chamadas de cada método.
+        times (Counter): Tempo total de cada método, em nanossegundos.
+    '''
+    def __init__(self, server):
+        self.calls = collections.Counter()
+        self.times = collections.Counter()
+        names = ["process_datagram", "handle_message", "flush"]
+        names += sorted(name for name in dir(type(server))
+                        if name.startswith("handle_") and name.endswith("_message") and name != "handle_message")
+        for name in names:
+            setattr(server, name, self._timed(name, getattr(server, name)))
+
+    def _timed(self, name, method):
+        calls, times, clock = self.calls, self.times, time.perf_counter_ns
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                times[name] += clock() - start
+                calls[name] += 1
+        return timed
+
+    def report(self):
+        '''
+        Monta a tabela com o tempo de cada método, do mais caro ao mais barato.
+
+        Returns:
+            list: Tuplas (método, chamadas, tempo total em ms, tempo médio em µs, % de process_datagram).
+        '''
+        total = self.times["process_datagram"] or 1
+        return [(name, self.calls[name], self.times[name] / 1e6, self.times[name] / self.calls[name] / 1e3,
+                 100 * self.times[name] / total)
+                for name, _ in self.times.most_common()]
+
+
+class SamplingProfiler:
+    '''
+    Profiler por amostragem: uma thread lê a pilha de outra thread a cada
+    interval segundos (sys._current_frames) e conta as funções em que ela
+    estava. Interfere muito menos que o cProfile no tempo medido.
+
+    Args:
+        thread_id (int): A thread amostrada. Se omitido, a thread que chamou start.
+        interval (float): Intervalo entre amostras, em segundos.
+
+    Attributes:
+        samples (int): Número de amostras coletadas.
+    '''
+    def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL_IN_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self._own = collections.Counter()
+        self._cumulative = collections.Counter()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="twotter-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while self._running:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples += 1
+                self._own[self._location(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    location = self._location(frame)
+                    if location not in seen:
+                        seen.add(location)
+                        self._cumulative[location] += 1
+                    frame = frame.f_back
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _location(frame):
+        code = frame.f_code
+        return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+    def report(self, top=20):
+        '''
+        Retorna as funções com mais amostras próprias.
+
+        Returns:
+            list: Tuplas (função, % das amostras na própria função, % das amostras com a função na pilha).
+        '''
+        samples = self.samples or 1
+        return [(location, 100 * count / samples, 100 * self._cumulative[location] / samples)
+                for location, count in self._own.most_common(top)]
+
+
+def replay_trace(server, records, realtime=False, speed=1.0):
+    '''
+    Reproduz um trace no servidor, no mesmo processo: cada datagrama passa
+    por process_datagram (e daí por handle_message) como se tivesse chegado
+    pelo socket. O servidor deve ter sido criado com um StubSocket.
+
+    Sem realtime, os datagramas são processados o mais rápido possível, com
+    flush a cada max_batch datagramas, como no loop de recepção sob carga.
+    Com realtime, o espaçamento original entre os datagramas é mantido
+    (dividido por speed) e o flush acontece antes de cada espera.
+
+    Args:
+        server (TwotterServer): O servidor.
+        records (list): Os TraceRecord, de read_trace.
+        realtime (bool): Se o espaçamento original é mantido.
+        speed (float): Fator de aceleração do espaçamento original.
+
+    Returns:
+        dict: Datagramas e bytes reproduzidos, tempo decorrido e datagramas por segundo.
+    '''
+    process_datagram = server.process_datagram
+    batch = server.max_batch
+    pending = 0
+    start = time.perf_counter()
+    first = records[0].timestamp if records else 0.0
+    for timestamp, address, data in records:
+        if realtime:
+            delay = (timestamp - first) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                server.flush()
+                pending = 0
+                time.sleep(delay)
+        process_datagram(data, address)
+        pending += 1
+        if pending >= batch:
+            server.flush()
+            pending = 0
+    server.flush()
+    elapsed = time.perf_counter() - start
+    return {
+        "datagrams": len(records),
+        "bytes": sum(len(record.data) for record in records),
+        "elapsed_seconds": elapsed,
+        "datagrams_per_second": len(records) / elapsed if elapsed > 0 else 0.0,
+    }
@@ -1,6 +1,129 @@
-from twotter import TwotterServer
+import argparse
+import functools
+import os
 
-server = TwotterServer()
+from twotter import TwotterServer, AsyncTwotterServer
+from twotter.entitites.workers import run_workers
+from twotter.entitites.admission import AdmissionController, CLIENT_RATE_PER_SECOND, CLIENT_BURST, GLOBAL_PACKETS_PER_SECOND
+from twotter.utils import message_log, configure_logging, enable_async_logging
+from twotter.utils.metrics import DEFAULT_DUMP_INTERVAL_IN_SECONDS
+from twotter.entitites.federation import parse_node
+from twotter.utils.scheduler import SCHEDULED_PACKETS_PER_SECOND
+from twotter.entitites.warm_restart import take_over, SNAPSHOT_INTERVAL_IN_SECONDS
+from twotter.config import SERVER_ADDRESS, SERVER_PORT
 
-server.run()
 
+def setup_logging(args):
+    message_log.configure(not args.no_message_log, args.message_log_sample, args.message_log_rate)
+    if args.async_log:
+        enable_async_logging()
+
+
+def setup_server(args, server, index=None):
+    if args.stats_file:
+        path = args.stats_file if index is None else f"{args.stats_file}.{index}"
+        server.export_metrics(path, args.stats_interval)
+    if args.offline_log:
+        server.enable_offline_log(args.offline_log)
+    if args.trace:
+        path = args.trace if index is None else f"{args.trace}.{index}"
+        server.enable_trace(path, args.trace_max_mb * 1024 * 1024 if args.trace_max_mb else None)
+    server.admission = AdmissionController(args.client_rate, args.client_burst, args.global_rate, 2 * args.global_rate)
+    server.scheduler.packets_per_second = args.scheduled_rate
+    if args.peers is not None:
+        peers = [parse_node(peer) for peer in args.peers.split(",") if peer]
+        server.enable_federation(peers, parse_node(args.advertise) if args.advertise else None,
+                                 secret=args.cluster_secret or os.environ.get("TWOTTER_CLUSTER_SECRET"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inicia o servidor Twotter.")
+    parser.add_argument("--mode", choices=["thread", "asyncio"], default="thread",
+                        help="Motor de recepção do servidor (padrão: thread).")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Número de processos worker escutando na mesma porta com SO_REUSEPORT (padrão: 1).")
+    parser.add_argument("--log-file", default="server.log", metavar="ARQUIVO",
+                        help="Arquivo de log do servidor; vazio para não gravar em arquivo (padrão: server.log).")
+    parser.add_argument("--quiet", action="store_true", help="Não exibe o log no console.")
+    parser.add_argument("--async-log", action="store_true",
+                        help="Escreve o log em uma thread separada, em lotes.")
+    parser.add_argument("--message-log-sample", type=int, default=1, metavar="N",
+                        help="Registra no log apenas uma a cada N mensagens encaminhadas (padrão: 1).")
+    parser.add_argument("--message-log-rate", type=int, default=0, metavar="N",
+                        help="Registra no máximo N mensagens encaminhadas por segundo (padrão: sem limite).")
+    parser.add_argument("--no-message-log", action="store_true",
+                        help="Não registra no log as mensagens encaminhadas.")
+    parser.add_argument("--stats-file", metavar="ARQUIVO",
+                        help="Grava periodicamente as métricas do servidor neste arquivo JSON (um por worker).")
+    parser.add_argument("--stats-interval", type=float, default=DEFAULT_DUMP_INTERVAL_IN_SECONDS,
+                        help=f"Intervalo de gravação das métricas, em segundos (padrão: {DEFAULT_DUMP_INTERVAL_IN_SECONDS}).")
+    parser.add_argument("--offline-log", metavar="DIRETÓRIO",
+                        help="Guarda neste diretório as mensagens para clientes offline e as entrega quando se conectarem.")
+    parser.add_argument("--client-rate", type=float, default=CLIENT_RATE_PER_SECOND,
+                        help=f"Mensagens por segundo permitidas a cada cliente; 0 desativa (padrão: {CLIENT_RATE_PER_SECOND:g}, "
+                             "sem limite por cliente).")
+    parser.add_argument("--client-burst", type=float, default=CLIENT_BURST,
+                        help=f"Rajada máxima de mensagens de cada cliente (padrão: {CLIENT_BURST:g}).")
+    parser.add_argument("--global-rate", type=float, default=GLOBAL_PACKETS_PER_SECOND,
+                        help=f"Pacotes enviados por segundo pelo servidor; 0 desativa (padrão: {GLOBAL_PACKETS_PER_SECOND:g}).")
+    parser.add_argument("--scheduled-rate", type=float, default=SCHEDULED_PACKETS_PER_SECOND,
+                        help=f"Pacotes por segundo das tarefas periódicas, como a mensagem de status; 0 desativa "
+                             f"(padrão: {SCHEDULED_PACKETS_PER_SECOND}).")
+    parser.add_argument("--host", default=SERVER_ADDRESS[0], help=f"Endereço em que o servidor escuta (padrão: {SERVER_ADDRESS[0]}).")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help=f"Porta em que o servidor escuta (padrão: {SERVER_PORT}).")
+    parser.add_argument("--peers", metavar="HOST:PORTA,...",
+                        help="Opera como nó de uma federação, entrando por estes nós (vazio para o primeiro nó).")
+    parser.add_argument("--advertise", metavar="HOST:PORTA",
+                        help="Endereço deste nó como visto pelos outros nós da federação (padrão: o endereço de escuta).")
+    parser.add_argument("--cluster-secret", metavar="SEGREDO",
+                        help="Segredo compartilhado pelos nós da federação (ou a variável TWOTTER_CLUSTER_SECRET). "
+                             "Sem ele, só os nós de --peers são aceitos.")
+    parser.add_argument("--trace", metavar="ARQUIVO",
+                        help="Grava os datagramas recebidos neste arquivo, para reproduzi-los com benchmarks/replay.py (um por worker).")
+    parser.add_argument("--trace-max-mb", type=float, default=0,
+                        help="Tamanho máximo do trace, em MB; 0 para sem limite (padrão: 0).")
+    parser.add_argument("--state-file", metavar="ARQUIVO",
+                        help="Grava periodicamente os clientes conectados neste arquivo e os restaura ao iniciar.")
+    parser.add_argument("--state-interval", type=float, default=SNAPSHOT_INTERVAL_IN_SECONDS,
+                        help=f"Intervalo de gravação do estado dos clientes, em segundos (padrão: {SNAPSHOT_INTERVAL_IN_SECONDS}).")
+    parser.add_argument("--handover", metavar="SOCKET",
+                        help="Socket Unix de handover: se um servidor já escuta nele, assume o seu socket UDP e os seus "
+                             "clientes, sem interrupção; depois passa a escutar nele para o próximo processo.")
+    args = parser.parse_args()
+    if args.offline_log and args.workers > 1:
+        parser.error("--offline-log não pode ser usado com mais de um worker")
+    if args.peers is not None and args.workers > 1:
+        parser.error("--peers não pode ser usado com mais de um worker")
+    if (args.state_file or args.handover) and args.workers > 1:
+        parser.error("--state-file e --handover não podem ser usados com mais de um worker")
+
+    configure_logging(args.log_file or None, not args.quiet)
+    server_class = AsyncTwotterServer if args.mode == "asyncio" else TwotterServer
+    if args.workers > 1:
+        run_workers(args.workers, server_class, address=(args.host, args.port), worker_setup=functools.partial(setup_logging, args),
+                    server_setup=functools.partial(setup_server, args))
+    else:
+        setup_logging(args)
+        handover = take_over(args.handover) if args.handover else None
+        server = server_class((args.host, args.port), sock=handover.sock if handover is not None else None)
+        setup_server(args, server)
+        if args.state_file:
+            server.enable_snapshots(args.state_file, args.state_interval, load=handover is None)
+        if handover is not None:
+            server.restore_snapshot(handover.snapshot)
+            handover.confirm()
+        if args.handover:
+            server.enable_handover(args.handover)
+        try:
+            server.run()
+        finally:
+            if server.federation is not None:
+                server.federation.leave()
+            if server.snapshots is not None and not server.handed_over:
+                server.snapshots.write()
+            if server.trace is not None:
+                server.trace.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,4 @@
-"""
-    Dummy conftest.py for twotter.
+from twotter.utils import configure_logging
 
-    If you don't know what this is for, just leave it empty.
-    Read more about conftest.py under:
-    - https://docs.pytest.org/en/stable/fixture.html
-    - https://docs.pytest.org/en/stable/writing_plugins.html
-"""
-
-# import pytest
+# Sem server.log no diretório atual nem log no console durante os testes.
+configure_logging(None, console=False)
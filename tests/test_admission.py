@@ -0,0 +1,109 @@
+import socket
+
+from twotter import TwotterServer
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.entitites.admission import (AdmissionController, SHED_LOW_PRIORITY_BACKLOG, SHED_CHAT_BACKLOG,
+                                        REJECTION_TEXTS)
+from twotter.utils import encode_message, decode_message
+
+
+def message(message_type, origin_id=1, destination_id=2):
+    return TwotterMessage(message_type.value, origin_id, destination_id, "a", "")
+
+
+def test_client_bucket_refills_and_broadcasts_cost_more():
+    admission = AdmissionController(client_rate=10, client_burst=10, global_rate=0)
+    assert all(admission.admit(message(MessageType.MESSAGE), 0.0, True) for _ in range(10))
+    assert not admission.admit(message(MessageType.MESSAGE), 0.0, True)
+    # Outro cliente não é afetado.
+    assert admission.admit(message(MessageType.MESSAGE, origin_id=3), 0.0, True)
+
+    assert admission.admit(message(MessageType.MESSAGE, destination_id=0), 0.5, True)
+    assert not admission.admit(message(MessageType.MESSAGE, destination_id=0), 0.5, True)
+    assert admission.stats["client_rate"] == 2
+
+    admission.forget(1)
+    admission.forget(3)
+    assert len(admission) == 0
+    assert admission.admit(message(MessageType.MESSAGE, origin_id=4), 0.5, True)
+    assert len(admission._tokens) == 2
+
+
+def test_global_bucket_counts_broadcast_packets():
+    admission = AdmissionController(client_rate=0, global_rate=100, global_burst=100)
+    assert admission.admit(message(MessageType.MESSAGE, destination_id=0), 0.0, True, recipients=80)
+    assert not admission.admit(message(MessageType.MESSAGE, destination_id=0), 0.0, True, recipients=80)
+    assert admission.admit(message(MessageType.MESSAGE), 0.0, True)
+    assert admission.admit(message(MessageType.MESSAGE, destination_id=0), 1.0, True, recipients=80)
+
+
+def test_overload_sheds_by_priority():
+    admission = AdmissionController()
+    hello, bye = message(MessageType.HELLO), message(MessageType.BYE)
+    unicast, broadcast = message(MessageType.MESSAGE), message(MessageType.MESSAGE, destination_id=0)
+    roster = message(MessageType.GET_ONLINE_CLIENTS)
+
+    backlog = SHED_LOW_PRIORITY_BACKLOG
+    assert admission.admit(unicast, 0.0, True, backlog=backlog)
+    assert not admission.admit(broadcast, 0.0, True, backlog=backlog)
+    assert not admission.admit(roster, 0.0, True, backlog=backlog)
+
+    backlog = SHED_CHAT_BACKLOG
+    assert not admission.admit(unicast, 0.0, True, backlog=backlog)
+    assert admission.admit(hello, 0.0, False, backlog=backlog)
+    assert admission.admit(bye, 0.0, True, backlog=backlog)
+    assert admission.stats["overload"] == 3
+
+
+def test_server_counts_shed_messages():
+    server = TwotterServer(("127.0.0.1", 0))
+    server.admission = AdmissionController(client_rate=1, client_burst=1)
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 1, 0, "a", "")), ("127.0.0.1", 40001))
+    for _ in range(3):
+        server.process_datagram(encode_message(TwotterMessage(MessageType.MESSAGE, 1, 1, "a", "oi")), ("127.0.0.1", 40001))
+    assert server.metrics.shed[MessageType.MESSAGE.value] == 2
+    assert server.metrics.snapshot()["types"]["MESSAGE"]["shed"] == 2
+    server.fanout.stop()
+    server.sock.close()
+
+
+def test_channel_messages_are_charged_per_member():
+    server = TwotterServer(("127.0.0.1", 0))
+    server.admission = AdmissionController(client_rate=0, global_rate=100, global_burst=100)
+    for client_id in range(1, 61):
+        address = ("127.0.0.1", 40000 + client_id)
+        server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, client_id, 0, "a", "")), address)
+        server.channels.subscribe(client_id, address, "geral")
+    channel = server.channels.subscribe(1, ("127.0.0.1", 40001), "geral")
+
+    server.process_datagram(encode_message(TwotterMessage(MessageType.CHANNEL_MESSAGE, 1, channel, "a", "oi")),
+                            ("127.0.0.1", 40001))
+    server.process_datagram(encode_message(TwotterMessage(MessageType.CHANNEL_MESSAGE, 1, channel, "a", "oi")),
+                            ("127.0.0.1", 40001))
+    assert server.admission.stats["global_rate"] == 1
+    assert not server.admission.admit(message(MessageType.CHANNEL_MESSAGE, destination_id=channel), 0.0, True,
+                                      backlog=SHED_LOW_PRIORITY_BACKLOG)
+    server.fanout.stop()
+    server.sock.close()
+
+
+def test_client_limit_is_opt_in_and_rejections_are_reported():
+    admission = AdmissionController()
+    assert all(admission.admit(message(MessageType.MESSAGE, destination_id=i % 2), 0.0, True) for i in range(200))
+    assert admission.stats["client_rate"] == 0
+
+    server = TwotterServer(("127.0.0.1", 0))
+    server.admission = AdmissionController(client_rate=1, client_burst=1)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender.bind(("127.0.0.1", 0))
+    sender.settimeout(2)
+    address = sender.getsockname()
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 1, 0, "a", "")), address)
+    sender.recv(2048)
+    for text in ("aceita", "descartada"):
+        server.process_datagram(encode_message(TwotterMessage(MessageType.MESSAGE, 1, 1, "a", text)), address)
+    assert decode_message(sender.recv(2048)).text == "aceita"
+    error = decode_message(sender.recv(2048))
+    assert error.message_type == MessageType.ERROR.value and error.text == REJECTION_TEXTS["client_rate"]
+    sender.close()
+    server.sock.close()
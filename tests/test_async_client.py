@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from twotter import AsyncTwotterServer, AsyncTwotterClient
+
+
+async def with_server(scenario):
+    server = AsyncTwotterServer(("127.0.0.1", 0))
+    server.admission.client_rate = 0
+    serving = asyncio.create_task(server.serve())
+    try:
+        await scenario(server.sock.getsockname())
+    finally:
+        server.stop()
+        await serving
+
+
+def test_many_sessions_on_one_loop():
+    async def scenario(address):
+        clients = [AsyncTwotterClient(address, client_id, f"bot{client_id}", reliable=client_id % 2 == 0,
+                                      wire_version=1 if client_id % 5 == 0 else 2)
+                   for client_id in range(1, 201)]
+        await asyncio.gather(*(client.connect() for client in clients))
+        assert (await clients[0].online_clients())[:10] == list(range(1, 11))
+        assert await clients[1].roster_members() == list(range(1, 201))
+
+        for client in clients:
+            client.send_message(f"de {client.client_id}", client.client_id % 200 + 1)
+
+        async def first(client):
+            async for message in client:
+                return message
+
+        received = await asyncio.wait_for(asyncio.gather(*(first(client) for client in clients)), 5)
+        for client, message in zip(clients, received):
+            assert message.destination_id == client.client_id
+            assert message.text == f"de {(client.client_id - 2) % 200 + 1}"
+
+        clients[2].subscribe_channel("bots")
+        clients[3].subscribe_channel("bots")
+        assert await clients[2].channel_list() == [("bots", 2)]
+        clients[2].send_channel_message("no canal", "bots")
+        assert (await asyncio.wait_for(first(clients[3]), 5)).text == "no canal"
+
+        for client in clients:
+            client.close()
+        # Depois de close, o iterador termina.
+        assert [message async for message in clients[0]] == []
+
+    asyncio.run(with_server(scenario))
+
+
+def test_connect_times_out_and_rejects_duplicate_ids():
+    async def scenario(address):
+        silent = AsyncTwotterClient(("127.0.0.1", 9), 1, "x")
+        with pytest.raises(TimeoutError):
+            await silent.connect(timeout=0.3)
+
+        async with AsyncTwotterClient(address, 7, "a"):
+            with pytest.raises(ConnectionError):
+                await AsyncTwotterClient(address, 7, "b").connect()
+
+    asyncio.run(with_server(scenario))
@@ -0,0 +1,49 @@
+import asyncio
+import socket
+import threading
+
+import pytest
+
+from twotter import AsyncTwotterServer
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.utils import encode_message, decode_message
+
+
+@pytest.fixture
+def server():
+    server = AsyncTwotterServer(("127.0.0.1", 0))
+    # As rajadas dos testes excedem o limite por cliente padrão.
+    server.admission.client_rate = 0
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_until_complete, args=(server.serve(),), daemon=True)
+    thread.start()
+    yield server
+    loop.call_soon_threadsafe(server.stop)
+    thread.join(timeout=5)
+    loop.close()
+
+
+def make_client():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(2)
+    return sock
+
+
+def test_hello_and_drained_messages(server):
+    address = server.sock.getsockname()
+    alice, bob = make_client(), make_client()
+
+    alice.sendto(encode_message(TwotterMessage(MessageType.HELLO, 1, 0, "alice", "")), address)
+    assert decode_message(alice.recv(1024)).message_type == MessageType.HELLO.value
+    bob.sendto(encode_message(TwotterMessage(MessageType.HELLO, 2, 0, "bob", "")), address)
+    assert decode_message(bob.recv(1024)).message_type == MessageType.HELLO.value
+
+    # Uma rajada de mensagens deve ser inteiramente processada.
+    for i in range(50):
+        alice.sendto(encode_message(TwotterMessage(MessageType.MESSAGE, 1, 2, "alice", str(i))), address)
+    texts = [decode_message(bob.recv(1024)).text for _ in range(50)]
+    assert texts == [str(i) for i in range(50)]
+
+    alice.close()
+    bob.close()
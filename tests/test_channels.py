@@ -0,0 +1,103 @@
+import socket
+
+import pytest
+
+from twotter import TwotterServer
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.entitites.channels import (ChannelIndex, ChannelDirectory, channel_id, format_channel_list,
+                                        parse_channel_list)
+from twotter.entitites.presence import MAX_TEXT_LENGTH
+from twotter.utils import encode_message, decode_message
+
+
+def test_channel_list_is_split_to_fit_text_field():
+    channels = [(f"canal-{i}", i) for i in range(40)]
+    texts = format_channel_list(channels)
+    assert len(texts) > 1
+    assert all(len(text) <= MAX_TEXT_LENGTH for text in texts)
+    directory = ChannelDirectory()
+    for text in texts:
+        directory.apply_list(*parse_channel_list(text))
+    assert directory.available == sorted(channels)
+    assert parse_channel_list(format_channel_list([])[0]) == (1, 1, [])
+
+
+def test_index_tracks_members_and_drops_empty_channels():
+    index = ChannelIndex("assistant", max_channels_per_client=2)
+    geral = index.subscribe(1, ("127.0.0.1", 1), "geral")
+    assert geral == channel_id("geral") != 0
+    index.subscribe(2, ("127.0.0.1", 2), "geral")
+    index.subscribe(1, ("127.0.0.1", 1), "dev")
+    assert sorted(index.addresses(geral)) == [("127.0.0.1", 1), ("127.0.0.1", 2)]
+    with pytest.raises(ValueError):
+        index.subscribe(1, ("127.0.0.1", 1), "terceiro")
+    with pytest.raises(ValueError):
+        index.subscribe(3, ("127.0.0.1", 3), "nome com espaço")
+
+    index.remove_client(1)
+    assert list(index.addresses(geral)) == [("127.0.0.1", 2)]
+    assert len(index) == 1
+    assert not index.unsubscribe(1, geral)
+    assert index.unsubscribe(2, geral)
+    assert len(index) == 0
+
+
+def test_server_delivers_channel_messages_only_to_members():
+    server = TwotterServer(("127.0.0.1", 0))
+    sockets = {}
+    for client_id in (1, 2, 3):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        sock.settimeout(2)
+        sockets[client_id] = sock
+        server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, client_id, 0, "u", "")), sock.getsockname())
+        sock.recv(1024)
+
+    def send(client_id, message_type, destination_id, text):
+        server.process_datagram(encode_message(TwotterMessage(message_type, client_id, destination_id, "u", text)),
+                                sockets[client_id].getsockname())
+
+    for client_id in (1, 2):
+        send(client_id, MessageType.CHANNEL_SUBSCRIBE, 0, "geral")
+        ack = decode_message(sockets[client_id].recv(1024))
+        assert (ack.message_type, ack.destination_id, ack.text) == (MessageType.CHANNEL_SUBSCRIBE.value, channel_id("geral"), "geral")
+
+    # Quem não é membro não publica no canal.
+    send(3, MessageType.CHANNEL_MESSAGE, channel_id("geral"), "intruso")
+    assert decode_message(sockets[3].recv(1024)).message_type == MessageType.ERROR.value
+
+    send(1, MessageType.CHANNEL_MESSAGE, channel_id("geral"), "oi canal")
+    for client_id in (1, 2):
+        message = decode_message(sockets[client_id].recv(1024))
+        assert (message.message_type, message.origin_id, message.text) == (MessageType.CHANNEL_MESSAGE.value, 1, "oi canal")
+
+    send(3, MessageType.CHANNEL_LIST, 0, "")
+    assert parse_channel_list(decode_message(sockets[3].recv(1024)).text) == (1, 1, [("geral", 2)])
+
+    send(2, MessageType.BYE, 0, "")
+    assert list(server.channels.addresses(channel_id("geral"))) == [sockets[1].getsockname()]
+
+    sockets[3].setblocking(False)
+    with pytest.raises(BlockingIOError):
+        sockets[3].recv(1024)
+    server.fanout.stop()
+    for sock in sockets.values():
+        sock.close()
+    server.sock.close()
+
+
+def test_channels_are_refused_without_shared_state():
+    server = TwotterServer(("127.0.0.1", 0))
+    server.channels_enabled = False
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(2)
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 1, 0, "u", "")), sock.getsockname())
+    sock.recv(1024)
+
+    server.process_datagram(encode_message(TwotterMessage(MessageType.CHANNEL_SUBSCRIBE, 1, 0, "u", "geral")),
+                            sock.getsockname())
+    assert decode_message(sock.recv(1024)).message_type == MessageType.ERROR.value
+    assert len(server.channels) == 0
+    sock.close()
+    server.sock.close()
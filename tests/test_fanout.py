@@ -0,0 +1,43 @@
+import socket
+
+import pytest
+
+from twotter.entitites.fanout import BroadcastFanout
+
+
+@pytest.fixture
+def sender():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    yield sock
+    sock.close()
+
+
+@pytest.mark.parametrize("use_sendmmsg", [True, False])
+def test_broadcast_reaches_every_address(sender, use_sendmmsg):
+    receivers = []
+    for _ in range(300):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        sock.settimeout(2)
+        receivers.append(sock)
+
+    fanout = BroadcastFanout(sender, batch_size=64)
+    fanout.use_sendmmsg = fanout.use_sendmmsg and use_sendmmsg
+    assert fanout.submit(b"ola", tuple(sock.getsockname() for sock in receivers))
+    fanout.stop()
+
+    assert all(sock.recv(16) == b"ola" for sock in receivers)
+    assert fanout.stats["sent_packets"] == 300
+    assert fanout.pending_packets == 0
+    for sock in receivers:
+        sock.close()
+
+
+def test_backpressure_drops_and_counts(sender):
+    fanout = BroadcastFanout(sender, max_pending_packets=2)
+    addresses = (("127.0.0.1", 9),) * 3
+
+    assert not fanout.submit(b"x", addresses)
+    assert fanout.stats["dropped_broadcasts"] == 1
+    assert fanout.stats["dropped_packets"] == 3
+    assert fanout.stats["queued_broadcasts"] == 0
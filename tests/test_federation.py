@@ -0,0 +1,188 @@
+import multiprocessing
+import socket
+import threading
+import time
+
+import pytest
+
+from twotter import TwotterServer
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.entitites.federation import (HashRing, MEMBERS_HEADER, FED_MAGIC, FED_PREFIX, MEMBERS, ITEM_HEADER,
+                                         HANDOFF, HANDOFF_ACK, HANDOFF_BODY, LEAVE)
+from twotter.utils import encode_message, decode_message
+
+SECRET = "segredo do cluster"
+
+
+def test_ring_moves_only_the_new_nodes_share():
+    nodes = [("127.0.0.1", port) for port in (7001, 7002, 7003)]
+    ring = HashRing(nodes)
+    before = {client_id: ring.owner(client_id) for client_id in range(1, 3001)}
+    counts = [list(before.values()).count(node) for node in nodes]
+    assert min(counts) > 600
+
+    ring.add(("127.0.0.1", 7004))
+    moved = [client_id for client_id in before if ring.owner(client_id) != before[client_id]]
+    assert 400 < len(moved) < 1200
+    assert all(ring.owner(client_id) == ("127.0.0.1", 7004) for client_id in moved)
+
+    ring.remove(("127.0.0.1", 7004))
+    assert all(ring.owner(client_id) == owner for client_id, owner in before.items())
+
+
+def _node(peers, offline_dir, conn):
+    server = TwotterServer(("127.0.0.1", 0))
+    server.periodic_tasks = False
+    server.enable_offline_log(offline_dir)
+    server.enable_federation(peers, heartbeat_interval=0.1, peer_timeout=1.0, secret=SECRET)
+    conn.send(server.sock.getsockname())
+    threading.Thread(target=server.run, daemon=True).start()
+    conn.recv()
+    server.federation.leave()
+    conn.close()
+
+
+def start_node(peers, offline_dir):
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.get_context("fork").Process(target=_node, args=(peers, offline_dir, child), daemon=True)
+    process.start()
+    return process, parent, parent.recv()
+
+
+def client(client_id, node):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(2)
+    sock.sendto(encode_message(TwotterMessage(MessageType.HELLO, client_id, 0, f"c{client_id}", "")), node)
+    assert decode_message(sock.recv(1024)).message_type == MessageType.HELLO.value
+    return sock
+
+
+def online(sock, client_id, node):
+    sock.sendto(encode_message(TwotterMessage(MessageType.GET_ONLINE_CLIENTS, client_id, 0, "", "")), node)
+    while True:
+        message = decode_message(sock.recv(1024))
+        if message.message_type == MessageType.GET_ONLINE_CLIENTS.value:
+            return sorted(int(i) for i in message.text.split(", ") if i)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def receive_texts(sock, count):
+    texts = []
+    while len(texts) < count:
+        message = decode_message(sock.recv(1024))
+        if message.message_type == MessageType.MESSAGE.value and message.origin_id != 0:
+            texts.append(message.text)
+    return texts
+
+
+@pytest.mark.skipif(not hasattr(socket, "MSG_DONTWAIT"), reason="requer leitura não bloqueante")
+def test_three_nodes_route_aggregate_and_rebalance(tmp_path):
+    nodes = []
+    first = start_node([], str(tmp_path / "a"))
+    nodes.append(first)
+    for name in ("b", "c"):
+        nodes.append(start_node([first[2]], str(tmp_path / name)))
+    addresses = [node[2] for node in nodes]
+    try:
+        sockets = {client_id: client(client_id, addresses[client_id - 1]) for client_id in (1, 2, 3)}
+        # A lista agregada converge em todos os nós (a associação se propaga pelo seed).
+        for client_id in (1, 2, 3):
+            assert wait_until(lambda: online(sockets[client_id], client_id, addresses[client_id - 1]) == [1, 2, 3])
+
+        # Unicast entre nós e broadcast para todo o cluster.
+        sockets[1].sendto(encode_message(TwotterMessage(MessageType.MESSAGE, 1, 3, "c1", "de A para C")), addresses[0])
+        assert receive_texts(sockets[3], 1) == ["de A para C"]
+        sockets[2].sendto(encode_message(TwotterMessage(MessageType.MESSAGE, 2, 0, "c2", "todos")), addresses[1])
+        assert receive_texts(sockets[1], 1) == ["todos"]
+        assert receive_texts(sockets[3], 1) == ["todos"]
+
+        # Um ID conectado a outro nó não pode ser usado de novo.
+        duplicate = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        duplicate.settimeout(2)
+        duplicate.sendto(encode_message(TwotterMessage(MessageType.HELLO, 3, 0, "x", "")), addresses[0])
+        assert decode_message(duplicate.recv(1024)).message_type == MessageType.ERROR.value
+        duplicate.close()
+
+        # O nó C sai: o cliente 3 some da lista e as mensagens para ele
+        # ficam com o novo dono até que ele se conecte a outro nó.
+        nodes[2][1].send("stop")
+        nodes[2][0].join(timeout=5)
+        assert wait_until(lambda: online(sockets[1], 1, addresses[0]) == [1, 2])
+        sockets[1].sendto(encode_message(TwotterMessage(MessageType.MESSAGE, 1, 3, "c1", "guardada")), addresses[0])
+        time.sleep(0.3)
+        sockets[3].close()
+        sockets[3] = client(3, addresses[1])
+        assert receive_texts(sockets[3], 1) == ["guardada"]
+    finally:
+        for process, conn, _ in nodes:
+            if process.is_alive():
+                conn.send("stop")
+                process.join(timeout=5)
+
+
+def members_datagram(federation, members, key=True, kind=MEMBERS):
+    data = MEMBERS_HEADER.pack(FED_MAGIC, kind, 1) + ",".join(f"{host}:{port}" for host, port in members).encode()
+    return data + federation._mac(data) if key else data
+
+
+def test_control_datagrams_from_unauthorized_nodes_are_dropped():
+    server = TwotterServer(("127.0.0.1", 0))
+    seed = ("127.0.0.1", 7001)
+    federation = server.enable_federation([seed], secret=SECRET)
+    stranger, injected = ("127.0.0.1", 7666), ("127.0.0.1", 7667)
+
+    federation.handle_control(stranger, members_datagram(federation, [injected], key=False), 0.0)
+    forged = bytearray(members_datagram(federation, [injected]))
+    forged[-1] ^= 1
+    federation.handle_control(stranger, bytes(forged), 0.0)
+    assert not federation.peers and federation.seeds == {seed} and federation.stats["rejected"] == 2
+
+    # Um nó com o segredo entra; o membro que ele anuncia é esquecido se nunca responder.
+    federation.handle_control(stranger, members_datagram(federation, [injected]), 0.0)
+    assert stranger in federation.peers and injected in federation.seeds
+    federation.tick(0.0)
+    federation.tick(federation.peer_timeout + 1)
+    assert federation.seeds == {seed}
+
+    # Sem segredo, apenas os nós configurados são aceitos, e os membros anunciados são ignorados.
+    server.enable_federation([seed])
+    server.federation.handle_control(stranger, members_datagram(federation, [], key=False), 0.0)
+    server.federation.handle_control(seed, members_datagram(federation, [injected], key=False), 0.0)
+    assert list(server.federation.peers) == [seed] and server.federation.seeds == {seed}
+    server.sock.close()
+
+
+def test_offline_messages_leave_the_log_only_after_the_new_owner_confirms(tmp_path):
+    server = TwotterServer(("127.0.0.1", 0))
+    server.enable_offline_log(str(tmp_path))
+    federation = server.enable_federation([], secret=SECRET)
+    for client_id in range(1, 101):
+        server.offline_log.append(client_id, b"guardada")
+
+    node = ("127.0.0.1", 7002)
+    federation.handle_control(node, members_datagram(federation, []), 0.0)
+    moved = [client_id for client_id in range(1, 101) if federation.ring.owner(client_id) == node]
+    assert moved and all(server.offline_log.pending(client_id) == 1 for client_id in moved)
+    items = federation._pending[node]
+    handoffs = [item for item in items if item[0] == HANDOFF]
+    assert len(handoffs) == len(moved)
+
+    # O nó confirma metade das transferências e sai: o restante continua no log.
+    confirmed = handoffs[:len(handoffs) // 2]
+    federation.handle_batch(node, FED_PREFIX + b"".join(
+        ITEM_HEADER.pack(HANDOFF_ACK, HANDOFF_BODY.size) + item[ITEM_HEADER.size:] for item in confirmed))
+    confirmed_ids = {HANDOFF_BODY.unpack(item[ITEM_HEADER.size:])[0] for item in confirmed}
+    federation.handle_control(node, members_datagram(federation, [], kind=LEAVE), 0.0)
+    assert all(server.offline_log.pending(client_id) == (client_id not in confirmed_ids) for client_id in moved)
+    server.offline_log.close()
+    server.sock.close()
+
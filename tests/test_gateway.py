@@ -0,0 +1,107 @@
+import asyncio
+
+from twotter import AsyncTwotterServer, AsyncTwotterClient
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.entitites.gateway import TwotterGateway
+
+
+async def with_server(scenario):
+    server = AsyncTwotterServer(("127.0.0.1", 0))
+    server.admission.client_rate = 0
+    serving = asyncio.create_task(server.serve())
+    try:
+        await scenario(server, server.sock.getsockname())
+    finally:
+        server.stop()
+        await serving
+
+
+async def first(session):
+    async for message in session:
+        return message
+
+
+def test_gateway_hosts_many_ids_on_few_sockets():
+    async def scenario(server, address):
+        async with TwotterGateway(address, sockets=2) as gateway, AsyncTwotterClient(address, 1000, "externo") as outsider:
+            sessions = await gateway.connect_many([(client_id, f"bot{client_id}") for client_id in range(1, 301)])
+            assert len(server.clients) == 301
+            assert len(server.clients.snapshot().endpoints) == 3
+
+            # Unicast demultiplexado pelo destination_id.
+            sessions[0].send_message("para 42", 42)
+            message = await asyncio.wait_for(first(sessions[41]), 5)
+            assert (message.origin_id, message.text) == (1, "para 42")
+
+            # O broadcast chega uma vez por socket e é entregue a todas as sessões.
+            sent = server.outbox.stats["datagrams"]
+            outsider.send_message("todos", 0)
+            received = await asyncio.wait_for(asyncio.gather(*(first(session) for session in sessions)), 5)
+            assert all(message.text == "todos" for message in received)
+            assert server.outbox.stats["datagrams"] - sent <= 3
+
+            sessions[4].subscribe_channel("sala")
+            sessions[9].subscribe_channel("sala")
+            while not (sessions[4].channels.subscriptions and sessions[9].channels.subscriptions):
+                await asyncio.sleep(0.01)
+            assert await sessions[4].channel_list() == [("sala", 2)]
+            sessions[9].send_channel_message("na sala", "sala")
+            assert (await asyncio.wait_for(first(sessions[4]), 5)).text == "na sala"
+            assert sessions[5]._queue.empty()
+
+            assert (await sessions[7].roster_members())[-1] == 1000
+
+            sessions[0].close()
+            await asyncio.sleep(0.05)
+            assert 1 not in server.clients and 2 in server.clients
+        await asyncio.sleep(0.05)
+        assert len(server.clients) == 0
+
+    asyncio.run(with_server(scenario))
+
+
+def test_keepalives_refresh_sessions_and_cleanup_waits_for_last_session():
+    async def scenario(server, address):
+        async with TwotterGateway(address, keepalive_interval=0.05) as gateway:
+            await gateway.connect_many([(1, "a"), (2, "b")])
+            (endpoint,) = server.clients.snapshot().endpoints
+            server.clients.touch(1, 0.0)
+            await asyncio.sleep(0.2)
+            assert server.clients.last_seen(1) > 0
+            assert endpoint in server.v2_addresses
+
+            # Um KEEPALIVE forjado de outro endereço é descartado.
+            server.handle_message(TwotterMessage(MessageType.KEEPALIVE.value, 1, 0, "a", ""), ("127.0.0.1", 9), None)
+            assert server.metrics.dropped[MessageType.KEEPALIVE.value] == 1
+
+            server.remove_client(1)
+            assert endpoint in server.v2_addresses
+            server.remove_client(2)
+            assert endpoint not in server.v2_addresses
+
+    asyncio.run(with_server(scenario))
+
+
+def test_one_address_cannot_register_unbounded_sessions():
+    async def scenario(server, address):
+        server.max_sessions_per_address = 3
+        async with TwotterGateway(address) as gateway:
+            await gateway.connect_many([(1, "a"), (2, "b"), (3, "c")])
+            try:
+                await gateway.connect(4, "d", timeout=1)
+                assert False, "sessão acima do limite foi aceita"
+            except ConnectionError:
+                pass
+            assert len(server.clients) == 3
+
+    asyncio.run(with_server(scenario))
+
+
+def test_hello_is_rate_limited_per_source_address():
+    from twotter.entitites.admission import AdmissionController
+    admission = AdmissionController(hello_rate=1, hello_burst=2)
+    hello = TwotterMessage(MessageType.HELLO.value, 1, 0, "a", "")
+    results = [admission.admit(hello, 0.0, False, address=("127.0.0.1", 9)) for _ in range(3)]
+    assert results == [True, True, False] and admission.stats["hello_rate"] == 1
+    assert admission.admit(hello, 0.0, False, address=("127.0.0.1", 10))
+    assert admission.admit(hello, 1.0, False, address=("127.0.0.1", 9))
@@ -0,0 +1,33 @@
+from twotter.entitites.history import MessageHistory
+
+
+def test_bounded_with_monotonic_sequence():
+    history = MessageHistory(maxlen=3)
+    for i in range(5):
+        assert history.append(i) == i
+    assert list(history) == [2, 3, 4]
+    assert history.first_seq == 2
+    assert history.next_seq == 5
+
+
+def test_since_cursor():
+    history = MessageHistory(maxlen=3)
+    history.append("a")
+    messages, cursor = history.since(0)
+    assert messages == ["a"] and cursor == 1
+
+    assert history.since(cursor) == ([], 1)
+    for text in "bcde":
+        history.append(text)
+    # Mensagens que já saíram do histórico são puladas.
+    assert history.since(cursor) == (["c", "d", "e"], 5)
+
+
+def test_window_pages():
+    history = MessageHistory(maxlen=10)
+    for i in range(7):
+        history.append(i)
+    assert history.window(3) == [4, 5, 6]
+    assert history.window(3, 3) == [1, 2, 3]
+    assert history.window(3, 6) == [0]
+    assert history.window(3, 9) == []
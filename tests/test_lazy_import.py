@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import twotter
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+def run_python(code, cwd):
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    return subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True, check=True).stdout
+
+
+def test_client_import_loads_no_server_and_creates_no_log(tmp_path):
+    output = run_python(
+        "import sys\n"
+        "from twotter import TwotterClient\n"
+        "print(sorted(name for name in ('twotter.entitites.server', 'asyncio', 'importlib.metadata') if name in sys.modules))\n",
+        tmp_path)
+    assert output.strip() == "[]"
+    assert os.listdir(tmp_path) == []
+
+
+def test_creating_a_server_creates_no_log(tmp_path):
+    run_python(
+        "from twotter import TwotterServer\n"
+        "TwotterServer(('127.0.0.1', 0)).sock.close()\n",
+        tmp_path)
+    assert os.listdir(tmp_path) == []
+
+
+def test_lazy_attributes():
+    from twotter.entitites.server import TwotterServer
+    assert twotter.TwotterServer is TwotterServer
+    assert "AsyncTwotterClient" in dir(twotter) and isinstance(twotter.__version__, str)
+    with pytest.raises(AttributeError):
+        twotter.TwotterNothing
@@ -0,0 +1,18 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_loadgen_smoke(tmp_path):
+    output = tmp_path / "resultado.json"
+    env = dict(os.environ, PYTHONPATH=os.path.join(ROOT_DIR, "src"))
+    subprocess.run([sys.executable, os.path.join(ROOT_DIR, "benchmarks", "loadgen.py"), "--clients", "20",
+                    "--rate", "200", "--duration", "0.5", "--broadcast-ratio", "0.1", "--output", str(output)],
+                   cwd=tmp_path, env=env, capture_output=True, check=True, timeout=60)
+    results = json.loads(output.read_text())["results"]
+    assert results["errors"] == 0 and results["sent_per_sec"] > 0
+    assert set(results["kinds"]) == {"unicast", "broadcast", "roster"}
+    assert results["kinds"]["unicast"]["deliveries"] > 0
@@ -0,0 +1,37 @@
+import logging
+
+from twotter.utils.logger import BatchingLogWriter, MessageLogSampler, _DeferredQueueHandler
+
+
+def test_sampler_sampling_and_disable():
+    sampler = MessageLogSampler(sample_every=3)
+    assert [sampler.should_log() for _ in range(6)] == [False, False, True, False, False, True]
+    assert sampler.suppressed == 4
+
+    sampler.configure(enabled=False)
+    assert not sampler.should_log()
+
+
+def test_sampler_rate_limit():
+    sampler = MessageLogSampler(max_per_second=2)
+    results = [sampler.should_log() for _ in range(10)]
+    # Todas as chamadas ocorrem (quase sempre) dentro do mesmo segundo.
+    assert sum(results) <= 4
+
+
+def test_batching_writer(tmp_path):
+    path = tmp_path / "test.log"
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+    writer = BatchingLogWriter([handler])
+
+    test_logger = logging.getLogger("twotter.test_batching")
+    test_logger.propagate = False
+    test_logger.addHandler(_DeferredQueueHandler(writer.queue))
+    writer.start()
+    for i in range(10):
+        test_logger.warning("linha %d", i)
+    writer.stop()
+    handler.close()
+
+    assert path.read_text().splitlines() == [f"WARNING linha {i}" for i in range(10)]
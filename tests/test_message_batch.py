@@ -0,0 +1,44 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.utils import encode_message, decode_message, MESSAGE_SIZE
+from twotter.utils.message_batch import decode_batch, decode_frames, encode_batch, encode_messages
+
+MESSAGES = [
+    TwotterMessage(MessageType.HELLO.value, 1, 0, "😀", "v2,rel"),
+    TwotterMessage(MessageType.MESSAGE.value, 1, 2, "alice", "olá, ção"),
+    TwotterMessage(MessageType.MESSAGE.value, 2, 0, "b" * 30, "x" * 200),
+    TwotterMessage(MessageType.GET_ONLINE_CLIENTS.value, 3, 0, "", ""),
+]
+
+
+def test_batch_matches_single_message_codec():
+    frames = [encode_message(message) for message in MESSAGES]
+    assert encode_messages(MESSAGES) == b''.join(frames)
+
+    batch = decode_frames(frames)
+    assert len(batch) == 4
+    assert batch.origin_id.tolist() == [1, 1, 2, 3]
+    assert batch.destination_id.tolist() == [0, 2, 0, 0]
+    assert [batch[index] for index in range(4)] == [decode_message(frame) for frame in frames]
+    assert batch.texts == [decode_message(frame).text for frame in frames]
+    assert batch.usernames[0] == "😀" and batch.text(1) == "olá, ção"
+
+
+def test_columnar_encode_and_selection():
+    count = 5000
+    ids = np.arange(1, count + 1)
+    data = encode_batch(MessageType.MESSAGE, ids, ids[::-1], ["bot"] * count, [f"msg {i}" for i in range(count)])
+    assert data[MESSAGE_SIZE * 9:MESSAGE_SIZE * 10] == encode_message(TwotterMessage(MessageType.MESSAGE.value, 10, count - 9, "bot", "msg 9"))
+
+    batch = decode_batch(bytearray(data))
+    assert batch.tobytes() == data
+    selected = batch[batch.origin_id % 1000 == 0]
+    assert selected.origin_id.tolist() == [1000, 2000, 3000, 4000, 5000]
+    assert selected.texts[-1] == "msg 4999"
+    assert len(batch.of_type(MessageType.HELLO)) == 0
+
+    with pytest.raises(ValueError):
+        decode_batch(data[:-1])
@@ -0,0 +1,49 @@
+import struct
+
+import pytest
+
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.utils import (encode_message, encode_message_into, decode_message, decode_message_lazy,
+                           peek_header, MESSAGE_SIZE)
+
+
+def test_roundtrip():
+    message = TwotterMessage(MessageType.MESSAGE, 3, 7, "😀", "olá, mundo")
+    decoded = decode_message(encode_message(message))
+    assert (decoded.message_type, decoded.origin_id, decoded.destination_id) == (2, 3, 7)
+    assert decoded.username == "😀"
+    assert decoded.text == "olá, mundo"
+
+
+def test_encode_does_not_mutate_message_type():
+    message = TwotterMessage(MessageType.HELLO, 1, 0, "user", "")
+    encode_message(message)
+    assert message.message_type is MessageType.HELLO
+
+
+def test_encode_into_reusable_buffer():
+    buffer = bytearray(MESSAGE_SIZE * 2)
+    first = TwotterMessage(MessageType.MESSAGE, 1, 2, "a", "primeira")
+    second = TwotterMessage(MessageType.MESSAGE, 2, 1, "b", "segunda")
+    assert encode_message_into(first, buffer) == MESSAGE_SIZE
+    encode_message_into(second, buffer, MESSAGE_SIZE)
+    assert bytes(buffer[:MESSAGE_SIZE]) == encode_message(first)
+    assert bytes(buffer[MESSAGE_SIZE:]) == encode_message(second)
+
+
+def test_peek_header_over_memoryview():
+    data = encode_message(TwotterMessage(MessageType.GET_ONLINE_CLIENTS, 9, 0, "u", "texto"))
+    assert peek_header(memoryview(data)) == (4, 9, 0)
+
+
+def test_lazy_message():
+    data = encode_message(TwotterMessage(MessageType.MESSAGE, 5, 0, "user", "oi"))
+    lazy = decode_message_lazy(memoryview(data))
+    assert (lazy.message_type, lazy.origin_id, lazy.destination_id) == (2, 5, 0)
+    assert lazy._text is None
+    assert lazy.text == "oi"
+    assert lazy.username == "user"
+    assert lazy.to_message() == decode_message(data)
+
+    with pytest.raises(struct.error):
+        decode_message_lazy(data[:-1])
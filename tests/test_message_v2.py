@@ -0,0 +1,54 @@
+import socket
+
+from twotter import TwotterServer
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.utils import encode_message, decode_message
+from twotter.utils.message_v2 import (V2_PREFIX, encode_record, decode_records, decode_datagram, pack_records,
+                                      parse_features)
+
+
+def test_records_roundtrip_and_pack_within_mtu():
+    messages = [TwotterMessage(MessageType.MESSAGE, i, 0, "usuário\0\0", "olá " * 30) for i in range(40)]
+    records = [encode_record(message) for message in messages]
+    assert len(records[0]) < 177
+
+    datagrams = pack_records(records, 1472)
+    assert len(datagrams) > 1
+    assert all(len(datagram) <= 1472 for datagram in datagrams)
+    decoded = [message for datagram in datagrams for message in decode_records(datagram)]
+    assert [message.origin_id for message in decoded] == list(range(40))
+    assert decoded[0].username == "usuário"
+    assert decoded[0].text == "olá " * 30
+    assert decode_datagram(encode_message(messages[0]))[0].origin_id == 0
+    assert parse_features(" v2, rel ,") == {"v2", "rel"}
+
+
+def test_server_negotiates_v2_and_keeps_v1_interop():
+    server = TwotterServer(("127.0.0.1", 0))
+    new = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    old = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for sock in (new, old):
+        sock.bind(("127.0.0.1", 0))
+        sock.settimeout(2)
+
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 1, 0, "novo", "v2")), new.getsockname())
+    assert parse_features(decode_message(new.recv(2048)).text) == {"v2"}
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 2, 0, "antigo", "")), old.getsockname())
+    assert decode_message(old.recv(2048)).text == ""
+
+    # Um datagrama v2 com duas mensagens do cliente novo.
+    batch = pack_records([encode_record(TwotterMessage(MessageType.MESSAGE, 1, 2, "novo", "oi")),
+                          encode_record(TwotterMessage(MessageType.MESSAGE, 1, 0, "novo", "todos"))])
+    assert len(batch) == 1
+    server.process_datagram(batch[0], new.getsockname())
+    server.flush()
+    server.fanout.stop()
+
+    assert [decode_message(old.recv(2048)).text for _ in range(2)] == ["oi", "todos"]
+    datagram = new.recv(2048)
+    assert datagram[:1] == V2_PREFIX
+    assert [message.text for message in decode_records(datagram)] == ["todos"]
+
+    new.close()
+    old.close()
+    server.sock.close()
@@ -0,0 +1,41 @@
+from twotter import TwotterServer
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.utils import encode_message
+from twotter.utils.metrics import ServerMetrics, MetricsDumper
+
+
+def test_counters_and_histogram_snapshot():
+    metrics = ServerMetrics()
+    metrics.observe(MessageType.MESSAGE.value, 1500)
+    metrics.observe(MessageType.MESSAGE.value, 3000)
+    metrics.count_forwarded(MessageType.MESSAGE.value)
+    metrics.count_dropped(99)
+    metrics.add_gauge("answer", lambda: 42)
+
+    snapshot = metrics.snapshot()
+    message = snapshot["types"]["MESSAGE"]
+    assert message["received"] == 2
+    assert message["forwarded"] == 1
+    assert message["service_time"]["count"] == 2
+    assert message["service_time"]["max_us"] == 4.096
+    assert snapshot["types"]["OTHER"]["dropped"] == 1
+    assert snapshot["gauges"]["answer"] == 42
+
+
+def test_server_records_messages(tmp_path):
+    server = TwotterServer(("127.0.0.1", 0))
+    address = ("127.0.0.1", 40000)
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 1, 0, "a", "")), address)
+    server.process_datagram(encode_message(TwotterMessage(MessageType.MESSAGE, 1, 5, "a", "oi")), address)
+    server.process_datagram(b"lixo", address)
+
+    snapshot = server.metrics.snapshot()
+    assert snapshot["types"]["HELLO"]["received"] == 1
+    assert snapshot["types"]["MESSAGE"]["dropped"] == 1
+    assert snapshot["types"]["OTHER"]["errored"] == 1
+    assert snapshot["gauges"]["clients"] == 1
+
+    path = tmp_path / "stats.json"
+    MetricsDumper(server.metrics, str(path)).dump()
+    assert path.exists()
+    server.sock.close()
@@ -0,0 +1,173 @@
+import os
+import socket
+
+from twotter import TwotterServer
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.entitites.offline_log import OfflineMessageLog
+from twotter.entitites.reliability import ACK_HEADER, DATA_HEADER, REL_ACK, REL_DATA
+from twotter.utils import encode_message, decode_message
+from twotter.utils.message_v2 import V2_PREFIX, decode_records, encode_record
+
+
+def test_messages_survive_reopen_and_are_delivered_once(tmp_path):
+    log = OfflineMessageLog(str(tmp_path), max_per_client=3)
+    for i in range(4):
+        log.append(7, f"para 7: {i}".encode())
+    log.append(8, b"para 8")
+    assert log.stats["rejected"] == 1
+    assert log.take(7) == [b"para 7: 0", b"para 7: 1", b"para 7: 2"]
+    log.close()
+
+    # Uma entrada incompleta no final (queda durante a escrita) é descartada.
+    with open(os.path.join(str(tmp_path), "messages.log"), "ab") as f:
+        f.write(b"\0\0\0")
+
+    log = OfflineMessageLog(str(tmp_path))
+    assert log.take(7) == []
+    assert log.pending(8) == 1
+    log.append(7, b"depois")
+    log.close()
+
+    log = OfflineMessageLog(str(tmp_path))
+    assert log.take(7) == [b"depois"]
+    assert log.take(8) == [b"para 8"]
+    log.close()
+
+
+def test_compaction_keeps_only_pending_messages(tmp_path):
+    log = OfflineMessageLog(str(tmp_path))
+    for client_id in range(1, 2001):
+        log.append(client_id, b"x" * 100)
+        log.append(client_id, b"y" * 100)
+    for client_id in range(1, 2001, 2):
+        log.take(client_id)
+    size = os.path.getsize(log.log_path)
+
+    log.compact()
+    assert os.path.getsize(log.log_path) < size * 0.6
+    assert log.take(2) == [b"x" * 100, b"y" * 100]
+    assert log.take(1) == []
+    log.close()
+
+    log = OfflineMessageLog(str(tmp_path))
+    assert log.take(2) == []
+    assert log.take(2000) == [b"x" * 100, b"y" * 100]
+    log.close()
+
+
+def test_server_delivers_stored_messages_on_hello(tmp_path):
+    server = TwotterServer(("127.0.0.1", 0))
+    server.enable_offline_log(str(tmp_path))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for sock in (sender, receiver):
+        sock.bind(("127.0.0.1", 0))
+        sock.settimeout(2)
+
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 1, 0, "a", "")), sender.getsockname())
+    sender.recv(2048)
+    for text in ("primeira", "segunda"):
+        server.process_datagram(encode_message(TwotterMessage(MessageType.MESSAGE, 1, 2, "a", text)), sender.getsockname())
+
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 2, 0, "b", "")), receiver.getsockname())
+    assert decode_message(receiver.recv(2048)).message_type == MessageType.HELLO.value
+    assert [decode_message(receiver.recv(2048)).text for _ in range(2)] == ["primeira", "segunda"]
+    assert server.offline_log.pending(2) == 0
+
+    sender.close()
+    receiver.close()
+    server.offline_log.close()
+    server.sock.close()
+
+
+def test_reliable_delivery_keeps_messages_until_acked(tmp_path):
+    server = TwotterServer(("127.0.0.1", 0))
+    server.enable_offline_log(str(tmp_path))
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(2)
+    address = receiver.getsockname()
+    server.offline_log.append(2, encode_record(TwotterMessage(MessageType.MESSAGE, 1, 2, "a", "guardada")))
+
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 2, 0, "b", "v2,rel")), address)
+    assert decode_message(receiver.recv(2048)).text == "v2,rel"
+    datagram = receiver.recv(2048)
+    assert datagram[0] == REL_DATA
+    assert decode_records(datagram[DATA_HEADER.size:])[0].text == "guardada"
+
+    # Sem a confirmação do cliente a mensagem continua no log.
+    server.flush()
+    assert server.offline_log.pending(2) == 1
+    server.process_datagram(ACK_HEADER.pack(REL_ACK, 1, 0), address)
+    server.flush()
+    assert server.offline_log.pending(2) == 0
+
+    receiver.close()
+    server.offline_log.close()
+    server.sock.close()
+
+
+def test_unconfirmed_messages_stay_for_the_next_connection(tmp_path):
+    server = TwotterServer(("127.0.0.1", 0))
+    server.enable_offline_log(str(tmp_path))
+    address = ("127.0.0.1", 9)
+    server.offline_log.append(2, encode_record(TwotterMessage(MessageType.MESSAGE, 1, 2, "a", "guardada")))
+
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 2, 0, "b", "v2,rel")), address)
+    server.remove_client(2)
+    server.flush()
+    assert server.offline_log.pending(2) == 1
+
+    server.offline_log.close()
+    server.sock.close()
+
+
+class FailingSocket:
+    '''
+    Socket que passa a falhar no envio depois de sends envios.
+    '''
+    def __init__(self, sock, sends):
+        self.sock = sock
+        self.sends = sends
+
+    def sendto(self, data, address):
+        if self.sends == 0:
+            raise OSError("sem buffer")
+        self.sends -= 1
+        return self.sock.sendto(data, address)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+def test_failed_send_requeues_stored_messages(tmp_path):
+    server = TwotterServer(("127.0.0.1", 0))
+    server.enable_offline_log(str(tmp_path))
+    for text in ("primeira", "segunda", "terceira"):
+        server.offline_log.append(2, encode_record(TwotterMessage(MessageType.MESSAGE, 1, 2, "a", text)))
+    real_sock = server.sock
+    # A resposta ao HELLO e a primeira mensagem saem; as seguintes falham.
+    server.sock = FailingSocket(real_sock, 2)
+
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 2, 0, "b", "")), ("127.0.0.1", 9))
+    assert [decode_records(V2_PREFIX + record)[0].text for record in server.offline_log.peek(2)] == ["segunda", "terceira"]
+
+    server.offline_log.close()
+    real_sock.close()
+
+
+def test_global_limits_reject_new_destinations_and_bytes(tmp_path):
+    log = OfflineMessageLog(str(tmp_path), max_destinations=3, max_live_bytes=2000)
+    assert all(log.append(client_id, b"x") for client_id in (1, 2, 3))
+    assert not log.append(4, b"x")
+    assert log.append(3, b"y") and 4 not in log.destinations()
+
+    log.take(1)
+    assert log.append(4, b"x")
+    assert not log.append(4, b"z" * 2000)
+    assert log.stats["rejected"] == 2
+    log.close()
+
+    log = OfflineMessageLog(str(tmp_path), max_destinations=3)
+    assert not log.append(5, b"x") and log.append(2, b"x")
+    log.close()
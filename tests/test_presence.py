@@ -0,0 +1,112 @@
+import socket
+import threading
+
+import pytest
+
+from twotter import TwotterServer, TwotterClient
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.entitites.presence import (Roster, format_snapshot, parse_snapshot, parse_delta, MAX_TEXT_LENGTH,
+                                        PRESENCE_UNAVAILABLE_TEXT)
+from twotter.utils import encode_message, decode_message
+
+
+def test_snapshot_is_split_to_fit_text_field():
+    texts = format_snapshot(12, range(1, 200))
+    assert len(texts) > 1
+    assert all(len(text) <= MAX_TEXT_LENGTH for text in texts)
+    ids = []
+    for text in texts:
+        version, part, total, chunk = parse_snapshot(text)
+        assert version == 12 and total == len(texts)
+        ids.extend(chunk)
+    assert ids == list(range(1, 200))
+    assert parse_snapshot(format_snapshot(3, [])[0]) == (3, 1, 1, [])
+
+
+def test_roster_detects_gaps_and_buffers_while_syncing():
+    roster = Roster()
+    # Delta que chega antes do snapshot é aplicado depois dele.
+    assert roster.apply_delta(6, 9, True)
+    roster.apply_snapshot(5, 1, 2, [1, 2])
+    assert not roster.synced
+    roster.apply_snapshot(5, 2, 2, [3])
+    assert roster.synced
+    assert roster.members() == [1, 2, 3, 9]
+
+    assert roster.apply_delta(7, 2, False)
+    assert roster.members() == [1, 3, 9]
+    assert roster.apply_delta(7, 2, False)  # duplicado, ignorado
+    assert not roster.apply_delta(9, 4, True)  # delta 8 perdido
+    assert not roster.synced
+
+
+def test_server_pushes_deltas_to_subscribers():
+    server = TwotterServer(("127.0.0.1", 0))
+    watcher = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    watcher.bind(("127.0.0.1", 0))
+    watcher.settimeout(2)
+    address = watcher.getsockname()
+
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 1, 0, "a", "")), address)
+    assert decode_message(watcher.recv(1024)).message_type == MessageType.HELLO.value
+    server.process_datagram(encode_message(TwotterMessage(MessageType.PRESENCE_SUBSCRIBE, 1, 0, "a", "")), address)
+    snapshot = decode_message(watcher.recv(1024))
+    assert snapshot.message_type == MessageType.PRESENCE_SNAPSHOT.value
+    assert parse_snapshot(snapshot.text) == (1, 1, 1, [1])
+
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 2, 0, "b", "")), ("127.0.0.1", 40002))
+    server.process_datagram(encode_message(TwotterMessage(MessageType.BYE, 2, 0, "b", "")), ("127.0.0.1", 40002))
+    server.fanout.stop()
+    deltas = [parse_delta(decode_message(watcher.recv(1024)).text) for _ in range(2)]
+    assert deltas == [(2, 2, True), (3, 2, False)]
+
+    watcher.close()
+    server.sock.close()
+
+
+def test_presence_subscription_is_refused_without_shared_state():
+    server = TwotterServer(("127.0.0.1", 0))
+    server.presence_enabled = False
+    watcher = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    watcher.bind(("127.0.0.1", 0))
+    watcher.settimeout(2)
+    address = watcher.getsockname()
+
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 1, 0, "a", "")), address)
+    watcher.recv(1024)
+    server.process_datagram(encode_message(TwotterMessage(MessageType.PRESENCE_SUBSCRIBE, 1, 0, "a", "")), address)
+    assert decode_message(watcher.recv(1024)).message_type == MessageType.ERROR.value
+    assert not server.presence.subscribers
+
+    watcher.close()
+    server.sock.close()
+
+
+def test_client_falls_back_to_online_query_when_presence_is_refused():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    server.settimeout(2)
+
+    def accept():
+        data, address = server.recvfrom(2048)
+        server.sendto(encode_message(TwotterMessage(MessageType.HELLO, 0, 1, "a", "")), address)
+
+    thread = threading.Thread(target=accept)
+    thread.start()
+    client = TwotterClient(server.getsockname(), 1, "a", wire_version=1)
+    thread.join()
+    data, address = server.recvfrom(2048)
+    assert decode_message(data).message_type == MessageType.PRESENCE_SUBSCRIBE.value
+
+    server.sendto(encode_message(TwotterMessage(MessageType.ERROR, 0, 1, "server", PRESENCE_UNAVAILABLE_TEXT)), address)
+    data, _ = server.recvfrom(2048)
+    assert decode_message(data).message_type == MessageType.GET_ONLINE_CLIENTS.value
+    assert not client.presence_supported
+
+    # A inscrição recusada não é refeita.
+    client.presence_requested_at = 0
+    assert not client.ensure_presence()
+    server.settimeout(0.3)
+    with pytest.raises(socket.timeout):
+        server.recvfrom(2048)
+    server.close()
@@ -0,0 +1,121 @@
+import socket
+import threading
+
+from twotter import TwotterServer
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.entitites.registry import ClientRegistry
+from twotter.entitites.shared_registry import SharedClientTable, SharedClientRegistry
+from twotter.utils import encode_message, decode_message
+
+
+def test_slots_reverse_index_and_snapshots():
+    registry = ClientRegistry()
+    assert registry.add(1, ("127.0.0.1", 1), 10.0)
+    assert registry.add(2, ("127.0.0.1", 2), 11.0)
+    assert not registry.add(1, ("127.0.0.1", 9), 12.0)
+
+    snapshot = registry.snapshot()
+    assert snapshot.ids == (1, 2)
+    assert snapshot.addresses == (("127.0.0.1", 1), ("127.0.0.1", 2))
+    # Sem entradas ou saídas, o mesmo snapshot é reutilizado.
+    registry.touch(1, 20.0)
+    assert registry.snapshot() is snapshot
+    assert registry.last_seen(1) == 20.0
+
+    assert registry.client_ids_at(("127.0.0.1", 2)) == (2,)
+    assert registry.verify(2, ("127.0.0.1", 2))
+    assert not registry.verify(1, ("127.0.0.1", 2))
+
+    assert registry.remove(1) == ("127.0.0.1", 1)
+    assert registry.remove(1) is None
+    assert snapshot.ids == (1, 2)
+    assert registry.snapshot().ids == (2,)
+    assert not registry.verify(1, ("127.0.0.1", 1))
+
+    registry.add(3, ("127.0.0.1", 3), 30.0)
+    assert len(registry._addresses) == 2  # O slot do cliente 1 foi reaproveitado.
+    assert registry[3] == ("127.0.0.1", 3) and registry.last_seen(3) == 30.0
+
+
+def test_readers_see_consistent_snapshots_during_writes():
+    registry = ClientRegistry()
+    stop = threading.Event()
+
+    def writer():
+        client_id = 0
+        while not stop.is_set():
+            client_id += 1
+            registry.add(client_id, ("127.0.0.1", client_id % 60000), 0.0)
+            if client_id > 50:
+                registry.remove(client_id - 50)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(2000):
+            snapshot = registry.snapshot()
+            assert len(snapshot.ids) == len(snapshot.addresses)
+            assert all(address[1] == client_id % 60000 for client_id, address in zip(snapshot.ids, snapshot.addresses))
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_shared_registry_has_the_same_interface():
+    registry = SharedClientRegistry(SharedClientTable(capacity=8))
+    assert registry.add(5, ("127.0.0.1", 5000), 1.0)
+    assert not registry.add(5, ("127.0.0.1", 6000), 2.0)
+    snapshot = registry.snapshot()
+    assert snapshot.ids == (5,) and registry.snapshot() is snapshot
+    assert registry.verify(5, ("127.0.0.1", 5000))
+    assert not registry.verify(5, ("127.0.0.1", 6000))
+    assert registry.client_ids_at(("127.0.0.1", 5000)) == (5,)
+    assert registry.remove(5) == ("127.0.0.1", 5000)
+    assert registry.snapshot().ids == () and len(registry) == 0
+
+
+def test_shared_registry_session_checks_do_not_scan_the_table(monkeypatch):
+    table = SharedClientTable(capacity=8)
+    registry = SharedClientRegistry(table)
+    gateway = ("127.0.0.1", 5000)
+    registry.add(1, gateway, 1.0)
+    registry.add(2, gateway, 1.0)
+    # Cliente registrado por outro worker: aparece na tabela, não no índice local.
+    table.set(3, ("127.0.0.1", 7000), 1.0)
+
+    scans = []
+    entries = table.entries
+    monkeypatch.setattr(table, "entries", lambda: scans.append(1) or entries())
+    for _ in range(3):
+        assert registry.has_sessions(gateway) and registry.has_sessions(("127.0.0.1", 7000))
+        assert not registry.has_sessions(("127.0.0.1", 9))
+    assert len(scans) == 1
+
+    assert registry.has_local_sessions(gateway) and not registry.has_local_sessions(("127.0.0.1", 7000))
+    registry.remove(1)
+    assert registry.has_local_sessions(gateway)
+    registry.remove(2)
+    assert not registry.has_local_sessions(gateway)
+    assert len(scans) == 1
+
+
+def test_server_rejects_spoofed_origin():
+    server = TwotterServer(("127.0.0.1", 0))
+    victim = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    victim.bind(("127.0.0.1", 0))
+    victim.settimeout(2)
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 1, 0, "a", "")), victim.getsockname())
+    victim.recv(1024)
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 2, 0, "b", "")), ("127.0.0.1", 40002))
+
+    # Pacotes com o origin_id do cliente 1 vindos de outro endereço são ignorados.
+    attacker = ("127.0.0.1", 40003)
+    server.process_datagram(encode_message(TwotterMessage(MessageType.MESSAGE, 1, 2, "a", "forjada")), attacker)
+    server.process_datagram(encode_message(TwotterMessage(MessageType.BYE, 1, 0, "a", "")), attacker)
+    assert 1 in server.clients
+    assert server.metrics.dropped[MessageType.MESSAGE.value] == 1
+
+    server.process_datagram(encode_message(TwotterMessage(MessageType.BYE, 1, 0, "a", "")), victim.getsockname())
+    assert 1 not in server.clients
+    victim.close()
+    server.sock.close()
@@ -0,0 +1,267 @@
+import socket
+import threading
+import time
+
+from twotter import TwotterServer, TwotterClient
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.entitites.admission import AdmissionController, REJECTION_TEXTS
+from twotter.entitites.reliability import (ReliablePeer, REL_ACK, REL_DATA, MIN_RTO_IN_SECONDS, MAX_RTO_IN_SECONDS,
+                                           ACK_DELAY_IN_SECONDS, CHANNEL_RESET_TEXT)
+from twotter.utils import encode_message, decode_message
+from twotter.utils.message_v2 import V2_PREFIX, encode_record, decode_records, parse_features
+
+
+def exchange(sender, receiver, datagrams, now, drop=lambda datagram: False):
+    '''
+    Entrega os datagramas ao receptor, descartando os escolhidos por drop, e devolve os payloads entregues.
+    '''
+    delivered = []
+    for datagram in datagrams:
+        if not drop(datagram):
+            delivered.extend(receiver.receive(datagram, now))
+    for ack in receiver.poll(now):
+        sender.receive(ack, now)
+    return delivered
+
+
+def test_no_loss_costs_one_ack_per_batch():
+    sender, receiver = ReliablePeer(), ReliablePeer()
+    datagrams = [sender.send(bytes([i]), 0.0) for i in range(10)]
+    delivered = [payload for datagram in datagrams for payload in receiver.receive(datagram, 0.01)]
+    assert delivered == [bytes([i]) for i in range(10)]
+
+    # O ACK puro espera ACK_DELAY_IN_SECONDS e confirma o lote inteiro.
+    assert receiver.poll(0.01) == []
+    acks = receiver.poll(0.01 + ACK_DELAY_IN_SECONDS)
+    assert len(acks) == 1 and acks[0][0] == REL_ACK
+    sender.receive(acks[0], 0.07)
+    assert not sender.busy
+    assert sender.poll(5.0) == []
+    assert sender.rto == MIN_RTO_IN_SECONDS
+
+
+def test_lossy_link_delivers_everything_in_order():
+    sender, receiver = ReliablePeer(window=8), ReliablePeer()
+    payloads = [str(i).encode() for i in range(100)]
+    outgoing = [datagram for datagram in (sender.send(payload, 0.0) for payload in payloads) if datagram]
+    counter = iter(range(1, 10 ** 6))
+    delivered = []
+    now = 0.0
+    while sender.busy and now < 120:
+        # Perde um a cada três datagramas.
+        delivered += exchange(sender, receiver, outgoing, now, drop=lambda datagram: next(counter) % 3 == 0)
+        now += 0.05
+        outgoing = sender.poll(now)
+    assert delivered == payloads
+    assert sender.stats["retransmitted"] > 0
+    assert not sender.failed
+
+
+def test_selective_acks_trigger_fast_retransmit():
+    sender, receiver = ReliablePeer(), ReliablePeer()
+    datagrams = [sender.send(bytes([i]), 0.0) for i in range(5)]
+    assert exchange(sender, receiver, datagrams[1:], 0.01) == []
+    # Antes de vencer o RTO, o buraco já é retransmitido.
+    retransmitted = sender.poll(0.02)
+    assert len(retransmitted) == 1
+    assert receiver.receive(retransmitted[0], 0.03) == [bytes([i]) for i in range(5)]
+    assert sender.stats["fast_retransmitted"] == 1
+
+
+def test_server_negotiates_reliable_delivery():
+    server = TwotterServer(("127.0.0.1", 0))
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.bind(("127.0.0.1", 0))
+    client.settimeout(2)
+    address = client.getsockname()
+
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 1, 0, "a", "v2,rel")), address)
+    assert parse_features(decode_message(client.recv(2048)).text) == {"v2", "rel"}
+    # Um HELLO repetido recebe a mesma resposta em vez de um erro.
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 1, 0, "a", "v2,rel")), address)
+    assert decode_message(client.recv(2048)).message_type == MessageType.HELLO.value
+
+    channel = ReliablePeer()
+    request = V2_PREFIX + encode_record(TwotterMessage(MessageType.GET_ONLINE_CLIENTS, 1, 0, "a", ""))
+    server.process_datagram(channel.send(request, 0.0), address)
+    server.flush()
+
+    payloads = channel.receive(client.recv(2048), 0.01)
+    assert [message.text for payload in payloads for message in decode_records(payload)] == ["1"]
+    assert not channel.busy or channel.poll(0.01 + ACK_DELAY_IN_SECONDS)[0][0] == REL_ACK
+
+    client.close()
+    server.sock.close()
+
+
+def test_idle_client_retransmits_message_sent_while_waiting():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    server.settimeout(3)
+    channel = ReliablePeer()
+
+    def accept():
+        data, address = server.recvfrom(2048)
+        hello = decode_message(data)
+        server.sendto(encode_message(TwotterMessage(MessageType.HELLO, 0, hello.origin_id, "a", "v2,rel")), address)
+
+    thread = threading.Thread(target=accept)
+    thread.start()
+    client = TwotterClient(server.getsockname(), 1, "a")
+    thread.join()
+    # A inscrição de presença é confirmada; depois disso o canal do cliente fica ocioso.
+    data, address = server.recvfrom(2048)
+    channel.receive(data, time.monotonic())
+    for ack in channel.poll(time.monotonic() + ACK_DELAY_IN_SECONDS):
+        server.sendto(ack, address)
+    time.sleep(0.3)
+    assert not client.channel.busy
+
+    client.send_message("olá", 2)
+    first, _ = server.recvfrom(2048)  # Perdida: não é confirmada.
+    retransmitted, _ = server.recvfrom(2048)
+    assert first[0] == REL_DATA and retransmitted == first
+    server.close()
+
+
+def test_reliable_data_from_unknown_address_opens_no_channel():
+    server = TwotterServer(("127.0.0.1", 0))
+    channel = ReliablePeer()
+    request = V2_PREFIX + encode_record(TwotterMessage(MessageType.GET_ONLINE_CLIENTS, 1, 0, "a", ""))
+    for port in range(40000, 40100):
+        server.process_datagram(channel.send(request, 0.0), ("127.0.0.1", port))
+    assert not server.reliability.peers and not server.reliability.active
+    server.sock.close()
+
+
+def test_failed_channel_is_dropped_and_delivery_resumes_after_hello():
+    server = TwotterServer(("127.0.0.1", 0))
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.bind(("127.0.0.1", 0))
+    client.settimeout(2)
+    address = client.getsockname()
+    hello = encode_message(TwotterMessage(MessageType.HELLO, 1, 0, "a", "v2,rel"))
+    server.process_datagram(hello, address)
+    client.recv(2048)
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 2, 0, "b", "")), ("127.0.0.1", 40002))
+
+    # O cliente 1 para de responder: as retransmissões se esgotam.
+    server.process_datagram(encode_message(TwotterMessage(MessageType.MESSAGE, 2, 1, "b", "perdida")), ("127.0.0.1", 40002))
+    server.flush()
+    peer = server.reliability.peers[address]
+    now = time.monotonic()
+    while not peer.failed:
+        now += MAX_RTO_IN_SECONDS
+        server.reliability.poll(now)
+    server.flush()
+    assert 1 not in server.clients and address not in server.reliability
+    data = client.recv(2048)
+    while data[0] == REL_DATA:
+        data = client.recv(2048)
+    assert decode_message(data).text == CHANNEL_RESET_TEXT
+
+    # Um novo HELLO abre um novo canal, e a entrega volta a funcionar.
+    server.process_datagram(hello, address)
+    assert decode_message(client.recv(2048)).message_type == MessageType.HELLO.value
+    channel = ReliablePeer()
+    server.process_datagram(encode_message(TwotterMessage(MessageType.MESSAGE, 2, 1, "b", "entregue")), ("127.0.0.1", 40002))
+    server.flush()
+    payloads = channel.receive(client.recv(2048), time.monotonic())
+    assert [message.text for payload in payloads for message in decode_records(payload)] == ["entregue"]
+
+    client.close()
+    server.sock.close()
+
+
+def test_client_restarts_channel_when_server_resets_it():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    server.settimeout(3)
+
+    def accept():
+        data, address = server.recvfrom(2048)
+        server.sendto(encode_message(TwotterMessage(MessageType.HELLO, 0, 1, "a", "v2,rel")), address)
+
+    thread = threading.Thread(target=accept)
+    thread.start()
+    client = TwotterClient(server.getsockname(), 1, "a")
+    thread.join()
+    subscribe, address = server.recvfrom(2048)
+    assert subscribe[0] == REL_DATA
+
+    # O servidor encerra o canal sem confirmar a inscrição: o cliente refaz o HELLO.
+    server.sendto(encode_message(TwotterMessage(MessageType.ERROR, 0, 0, "server", CHANNEL_RESET_TEXT)), address)
+    data, _ = server.recvfrom(2048)
+    while data[0] == REL_DATA:
+        data, _ = server.recvfrom(2048)
+    assert decode_message(data).message_type == MessageType.HELLO.value
+    client.send_message("durante", 2)
+    server.sendto(encode_message(TwotterMessage(MessageType.HELLO, 0, 1, "a", "v2,rel")), address)
+
+    # A inscrição não confirmada e a mensagem enviada durante a espera seguem pelo novo canal.
+    channel = ReliablePeer()
+    payloads = []
+    while len(payloads) < 2:
+        data, _ = server.recvfrom(2048)
+        if data[0] == REL_DATA:
+            payloads += channel.receive(data, time.monotonic())
+    messages = [message for payload in payloads for message in decode_records(payload)]
+    assert [message.message_type for message in messages] == [MessageType.PRESENCE_SUBSCRIBE.value,
+                                                              MessageType.MESSAGE.value]
+    assert not client.reconnecting
+    server.close()
+
+
+def test_client_confirms_a_burst_with_one_ack():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    server.settimeout(0.5)
+
+    def accept():
+        data, address = server.recvfrom(2048)
+        server.sendto(encode_message(TwotterMessage(MessageType.HELLO, 0, 1, "a", "v2,rel")), address)
+
+    thread = threading.Thread(target=accept)
+    thread.start()
+    client = TwotterClient(server.getsockname(), 1, "a")
+    thread.join()
+    channel = ReliablePeer()
+    data, address = server.recvfrom(2048)
+    channel.receive(data, time.monotonic())  # A inscrição de presença é confirmada de carona no lote.
+
+    for i in range(10):
+        record = encode_record(TwotterMessage(MessageType.MESSAGE, 2, 1, "b", str(i)))
+        server.sendto(channel.send(V2_PREFIX + record, time.monotonic()), address)
+    acks = []
+    try:
+        while True:
+            data, _ = server.recvfrom(2048)
+            acks.append(data)
+    except socket.timeout:
+        pass
+    assert [data[0] for data in acks] == [REL_ACK]
+    assert [message.text for message in client.received_messages] == [str(i) for i in range(10)]
+    server.close()
+
+
+def test_shed_reliable_message_is_reported_to_sender():
+    server = TwotterServer(("127.0.0.1", 0))
+    server.admission = AdmissionController(client_rate=1, client_burst=1)
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.bind(("127.0.0.1", 0))
+    client.settimeout(2)
+    address = client.getsockname()
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, 1, 0, "a", "v2,rel")), address)
+    client.recv(2048)
+
+    channel = ReliablePeer()
+    for text in ("primeira", "segunda"):
+        record = encode_record(TwotterMessage(MessageType.MESSAGE, 1, 1, "a", text))
+        server.process_datagram(channel.send(V2_PREFIX + record, time.monotonic()), address)
+    server.flush()
+    messages = [message for payload in channel.receive(client.recv(2048), time.monotonic())
+                for message in decode_records(payload)]
+    assert [(message.message_type, message.text) for message in messages] == [
+        (MessageType.MESSAGE.value, "primeira"), (MessageType.ERROR.value, REJECTION_TEXTS["client_rate"])]
+    client.close()
+    server.sock.close()
@@ -0,0 +1,83 @@
+import random
+import socket
+
+from twotter import TwotterServer
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.entitites.server import STATUS_INTERVAL_IN_SECONDS
+from twotter.utils import encode_message, decode_message
+from twotter.utils.scheduler import Scheduler
+
+
+def run(scheduler, start, end, step):
+    now = start
+    while now < end:
+        scheduler.run_due(now)
+        now += step
+
+
+def test_call_every_applies_jitter():
+    scheduler = Scheduler(rng=random.Random(1))
+    times = []
+    job = scheduler.call_every(1.0, lambda: times.append(now), 0.0, jitter=0.2)
+    now = 0.0
+    while now < 50:
+        scheduler.run_due(now)
+        now += 0.01
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert job.runs == len(times) and 35 < len(times) < 65
+    assert all(0.79 <= gap <= 1.22 for gap in gaps) and max(gaps) - min(gaps) > 0.1
+
+
+def test_spread_work_covers_every_key_once_per_round():
+    seen = []
+    scheduler = Scheduler(packets_per_second=0)
+    scheduler.spread_every(10.0, lambda: range(1000), seen.append, 0.0, jitter=0)
+    per_tick = []
+    now = 0.0
+    while now < 30.5:
+        before = len(seen)
+        scheduler.run_due(now)
+        per_tick.append(len(seen) - before)
+        now += 0.1
+    # Duas rodadas completas (de 10 a 20 e de 20 a 30), no máximo 10 chaves a cada 0,1 s.
+    assert len(seen) >= 2000 and max(per_tick) <= 11
+    first, second = seen[:1000], seen[1000:2000]
+    assert sorted(first) == list(range(1000)) and first == second
+
+
+def test_pacing_budget_stretches_rounds_instead_of_bursting():
+    seen = []
+    scheduler = Scheduler(packets_per_second=100)
+    job = scheduler.spread_every(1.0, lambda: range(500), seen.append, 0.0, jitter=0)
+    run(scheduler, 0.0, 3.0, 0.01)
+    # Em 2 s de rodada o orçamento permite cerca de 200 pacotes, nunca as 500 chaves de uma vez.
+    assert 180 <= len(seen) <= 210 and job.runs == 0
+    run(scheduler, 3.0, 7.0, 0.01)
+    assert job.runs == 1 and scheduler.stats["overruns"] == 1
+
+
+def test_status_message_reaches_each_client_once_per_interval():
+    server = TwotterServer(("127.0.0.1", 0))
+    clients = []
+    for client_id in range(1, 6):
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        client.bind(("127.0.0.1", 0))
+        client.settimeout(0.5)
+        server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, client_id, 0, "a", "")),
+                                client.getsockname())
+        client.recv(2048)
+        clients.append(client)
+
+    server.scheduler.spread_every(STATUS_INTERVAL_IN_SECONDS, server.status_round, server.send_status_message,
+                                  0.0, jitter=0)
+    run(server.scheduler, 0.0, 2 * STATUS_INTERVAL_IN_SECONDS + 1, 0.5)
+    for client in clients:
+        assert decode_message(client.recv(2048)).text == "Servidor online, 5 clientes conectados"
+        client.setblocking(False)
+        try:
+            client.recv(2048)
+            assert False, "mais de uma mensagem de status na rodada"
+        except BlockingIOError:
+            pass
+        client.close()
+    server.sock.close()
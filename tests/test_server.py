@@ -0,0 +1,42 @@
+import pytest
+
+from twotter import TwotterServer
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.entitites.server import CLIENT_TIMEOUT_IN_SECONDS
+from twotter.utils import encode_message
+
+
+@pytest.fixture
+def server():
+    server = TwotterServer(("127.0.0.1", 0))
+    yield server
+    server.sock.close()
+
+
+def send(server, message, address=("127.0.0.1", 40000)):
+    server.process_datagram(encode_message(message), address)
+
+
+def test_any_packet_refreshes_and_expiry_removes(server):
+    send(server, TwotterMessage(MessageType.HELLO, 1, 0, "a", ""), ("127.0.0.1", 40001))
+    send(server, TwotterMessage(MessageType.HELLO, 2, 0, "b", ""), ("127.0.0.1", 40002))
+    start = server.clients.last_seen(1)
+
+    server.clients.touch(1, start - 100)
+    server.clients.touch(2, start - 100)
+    server.expiry.touch(1, start - 100)
+    server.expiry.touch(2, start - 100)
+    send(server, TwotterMessage(MessageType.GET_ONLINE_CLIENTS, 1, 0, "a", ""), ("127.0.0.1", 40001))
+    assert server.clients.last_seen(1) >= start
+
+    server.remove_inactive_clients(start - 100 + CLIENT_TIMEOUT_IN_SECONDS + 2)
+    assert 2 not in server.clients and server.clients.last_seen(2) is None
+    assert 1 in server.clients
+
+
+def test_bye_removes_all_client_state(server):
+    send(server, TwotterMessage(MessageType.HELLO, 1, 0, "a", ""))
+    send(server, TwotterMessage(MessageType.BYE, 1, 0, "a", ""))
+    assert 1 not in server.clients
+    assert server.clients.last_seen(1) is None
+    assert 1 not in server.expiry
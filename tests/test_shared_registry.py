@@ -0,0 +1,61 @@
+import multiprocessing
+
+import pytest
+
+from twotter.entitites.shared_registry import SharedClientTable, MAX_DELETED_FRACTION
+
+
+def test_mapping_views():
+    table = SharedClientTable(capacity=8)
+    table.addresses[7] = ("127.0.0.1", 5000)
+    table.times[7] = 123.0
+
+    assert 7 in table.addresses
+    assert table.addresses[7] == ("127.0.0.1", 5000)
+    assert table.times[7] == 123.0
+    assert list(table.addresses.values()) == [("127.0.0.1", 5000)]
+
+    del table.addresses[7]
+    assert 7 not in table.addresses
+    assert table.times.pop(7, None) is None
+    assert len(table.addresses) == 0
+
+
+def test_capacity_limit():
+    table = SharedClientTable(capacity=2)
+    table.addresses[1] = ("127.0.0.1", 1)
+    table.addresses[2] = ("127.0.0.1", 2)
+    with pytest.raises(MemoryError):
+        table.addresses[3] = ("127.0.0.1", 3)
+    # Slots removidos podem ser reutilizados.
+    del table.addresses[1]
+    table.addresses[3] = ("127.0.0.1", 3)
+    assert sorted(table.addresses) == [2, 3]
+
+
+def _register(table, client_id):
+    table.addresses[client_id] = ("10.0.0.1", 4000 + client_id)
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="requer fork")
+def test_visible_across_processes():
+    table = SharedClientTable(capacity=16)
+    process = multiprocessing.get_context("fork").Process(target=_register, args=(table, 3))
+    process.start()
+    process.join()
+    assert table.addresses[3] == ("10.0.0.1", 4003)
+
+
+def test_churn_does_not_fill_the_table_with_tombstones():
+    table = SharedClientTable(capacity=64)
+    size = len(table._slots)
+    for client_id in range(1, 20000):
+        table.addresses[client_id] = ("127.0.0.1", client_id % 65536)
+        if client_id > 32:
+            del table.addresses[client_id - 32]
+    assert len(table) == 32
+    assert table._deleted.value <= MAX_DELETED_FRACTION * size
+    assert sum(slot.state == 0 for slot in table._slots) >= size // 2
+    assert sorted(table.addresses) == list(range(19968, 20000))
+    assert table.addresses[19999] == ("127.0.0.1", 19999 % 65536)
+    assert 5 not in table.addresses
@@ -0,0 +1,38 @@
+from twotter.utils.timing_wheel import TimingWheel
+
+
+def test_expires_only_after_timeout():
+    wheel = TimingWheel(timeout=10, now=0)
+    wheel.touch("a", 0)
+    assert wheel.advance(10) == []
+    assert wheel.advance(11.5) == ["a"]
+    assert "a" not in wheel
+
+
+def test_touch_postpones_expiry():
+    wheel = TimingWheel(timeout=10, now=0)
+    wheel.touch("a", 0)
+    wheel.touch("b", 0)
+    wheel.touch("a", 8)
+    assert wheel.advance(12) == ["b"]
+    assert wheel.advance(18) == []
+    assert wheel.advance(19) == ["a"]
+
+
+def test_remove_and_long_pause():
+    wheel = TimingWheel(timeout=5, now=0)
+    for key in range(100):
+        wheel.touch(key, key % 7)
+    wheel.remove(3)
+    # Uma pausa maior que a roda inteira ainda expira tudo o que venceu.
+    assert sorted(wheel.advance(1000)) == [key for key in range(100) if key != 3]
+    assert len(wheel) == 0
+
+
+def test_keys_from_future_laps_stay():
+    wheel = TimingWheel(timeout=5, now=0)
+    # Toque registrado muito à frente do tick atual da roda.
+    wheel.touch("late", 100)
+    assert wheel.advance(50) == []
+    assert "late" in wheel
+    assert wheel.advance(106) == ["late"]
@@ -0,0 +1,56 @@
+from twotter import TwotterServer
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.utils import encode_message
+from twotter.utils.message_v2 import V2_PREFIX, encode_record
+from twotter.utils.trace import (read_trace, replay_trace, StubSocket, HandlerProfile, SamplingProfiler,
+                                 TraceRecord)
+
+
+def test_recorded_trace_replays_through_handlers(tmp_path):
+    path = str(tmp_path / "trace.bin")
+    live = TwotterServer(("127.0.0.1", 0))
+    live.enable_trace(path)
+    datagrams = [
+        (encode_message(TwotterMessage(MessageType.HELLO, 1, 0, "a", "")), ("127.0.0.1", 40001)),
+        (encode_message(TwotterMessage(MessageType.HELLO, 2, 0, "b", "v2")), ("127.0.0.1", 40002)),
+        (encode_message(TwotterMessage(MessageType.MESSAGE, 1, 2, "a", "oi")), ("127.0.0.1", 40001)),
+        (V2_PREFIX + encode_record(TwotterMessage(MessageType.MESSAGE, 2, 0, "b", "todos"))
+         + encode_record(TwotterMessage(MessageType.GET_ONLINE_CLIENTS, 2, 0, "b", "")), ("127.0.0.1", 40002)),
+    ]
+    for data, address in datagrams:
+        live.process_datagram(data, address)
+    live.trace.close()
+    live.sock.close()
+    # Uma entrada final incompleta é ignorada.
+    with open(path, "ab") as file:
+        file.write(b"\x00" * 5)
+
+    records = read_trace(path)
+    assert [(record.data, record.address) for record in records] == datagrams
+    assert records == sorted(records, key=lambda record: record.timestamp)
+
+    stub = StubSocket()
+    server = TwotterServer(sock=stub)
+    server.admission.client_rate = 0
+    profile = HandlerProfile(server)
+    sampler = SamplingProfiler(interval=0.0005)
+    sampler.start()
+    result = replay_trace(server, records * 50, realtime=False)
+    sampler.stop()
+    server.fanout.stop()
+
+    assert result["datagrams"] == 200
+    assert sorted(server.clients) == [1, 2]
+    calls = {name: count for name, count, _, _, _ in profile.report()}
+    assert calls["process_datagram"] == 200 and calls["handle_message"] == 250
+    assert calls["handle_msg_message"] == 100 and calls["handle_get_online_clients_message"] == 50
+    assert stub.sent > 0
+    assert all(0 <= own <= cumulative <= 100 for _, own, cumulative in sampler.report())
+
+
+def test_realtime_replay_keeps_original_spacing():
+    trace = [TraceRecord(0.0, ("127.0.0.1", 40001), encode_message(TwotterMessage(MessageType.HELLO, 1, 0, "a", ""))),
+             TraceRecord(0.2, ("127.0.0.1", 40001), encode_message(TwotterMessage(MessageType.MESSAGE, 1, 1, "a", "x")))]
+    server = TwotterServer(sock=StubSocket())
+    assert replay_trace(server, trace, realtime=True)["elapsed_seconds"] >= 0.2
+    assert replay_trace(TwotterServer(sock=StubSocket()), trace, realtime=True, speed=4)["elapsed_seconds"] < 0.2
@@ -0,0 +1,110 @@
+import socket
+import threading
+
+from twotter import TwotterServer
+from twotter.entitites import TwotterMessage, MessageType
+from twotter.entitites.reliability import ReliablePeer, CHANNEL_RESET_TEXT
+from twotter.entitites.warm_restart import encode_snapshot, restore_snapshot, take_over
+from twotter.utils import encode_message, decode_message
+from twotter.utils.message_v2 import V2_PREFIX, encode_record, decode_records
+
+
+def udp_client():
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.bind(("127.0.0.1", 0))
+    client.settimeout(2)
+    return client
+
+
+def hello(server, client, client_id, features=""):
+    server.process_datagram(encode_message(TwotterMessage(MessageType.HELLO, client_id, 0, "a", features)),
+                            client.getsockname())
+    client.recv(2048)
+
+
+def test_snapshot_restores_clients_and_reliable_channels():
+    old = TwotterServer(("127.0.0.1", 0))
+    plain, v2, reliable = udp_client(), udp_client(), udp_client()
+    hello(old, plain, 1)
+    hello(old, v2, 2, "v2")
+    hello(old, reliable, 3, "v2,rel")
+    old.handle_message(TwotterMessage(MessageType.PRESENCE_SUBSCRIBE.value, 2, 0, "a", ""), v2.getsockname(), b'')
+    old.handle_message(TwotterMessage(MessageType.CHANNEL_SUBSCRIBE.value, 1, 0, "a", "geral"), plain.getsockname(), b'')
+    old.flush()
+    assert decode_message(plain.recv(2048)).text == "geral"
+
+    # O cliente confiável recebe uma mensagem pelo seu canal antes do reinício.
+    channel = ReliablePeer()
+    old.send_to_address(TwotterMessage(MessageType.MESSAGE, 1, 3, "a", "antes"), reliable.getsockname())
+    old.flush()
+    assert [message.text for payload in channel.receive(reliable.recv(2048), 0.0)
+            for message in decode_records(payload)] == ["antes"]
+
+    # Um snapshot periódico não leva os canais confiáveis: o cliente confiável
+    # é restaurado sem canal e recebe o pedido para recomeçá-lo.
+    cold = TwotterServer(("127.0.0.1", 0))
+    assert restore_snapshot(cold, encode_snapshot(old)) == 3
+    assert sorted(cold.clients) == [1, 2, 3] and cold.v2_addresses == {v2.getsockname(), reliable.getsockname()}
+    assert reliable.getsockname() not in cold.reliability
+    assert cold.presence.subscribers == {2} and cold.presence.version == old.presence.version
+    assert cold.channels.members(next(iter(cold.channels.names))) == (1,)
+    cold.flush()
+    assert [message.text for message in decode_records(reliable.recv(2048))] == [CHANNEL_RESET_TEXT]
+    # Enquanto o cliente não recomeça o canal, seus dados confiáveis renovam o pedido.
+    stale = ReliablePeer()
+    stale.next_seq = 7
+    cold.process_datagram(stale.send(V2_PREFIX + encode_record(TwotterMessage(MessageType.MESSAGE, 3, 1, "a", "x")), 0.0),
+                          reliable.getsockname())
+    cold.flush()
+    assert [message.text for message in decode_records(reliable.recv(2048))] == [CHANNEL_RESET_TEXT]
+    # O novo HELLO abre o canal, e a entrega confiável volta a funcionar.
+    hello(cold, reliable, 3, "v2,rel")
+    fresh = ReliablePeer()
+    cold.process_datagram(fresh.send(V2_PREFIX + encode_record(TwotterMessage(MessageType.MESSAGE, 3, 1, "a", "de novo")), 0.0),
+                          reliable.getsockname())
+    assert decode_message(plain.recv(2048)).text == "de novo"
+    cold.sock.close()
+
+    # No handover o canal continua de onde parou.
+    warm = TwotterServer(("127.0.0.1", 0))
+    assert restore_snapshot(warm, encode_snapshot(old, reliability=True)) == 3
+    warm.send_to_address(TwotterMessage(MessageType.MESSAGE, 1, 3, "a", "depois"), reliable.getsockname())
+    warm.flush()
+    assert [message.text for payload in channel.receive(reliable.recv(2048), 0.1)
+            for message in decode_records(payload)] == ["depois"]
+    request = V2_PREFIX + encode_record(TwotterMessage(MessageType.MESSAGE, 3, 1, "a", "oi"))
+    warm.process_datagram(channel.send(request, 0.1), reliable.getsockname())
+    assert decode_message(plain.recv(2048)).text == "oi"
+
+    for sock in (plain, v2, reliable, old.sock, warm.sock):
+        sock.close()
+
+
+def test_handover_passes_socket_and_state_to_new_process(tmp_path):
+    path = str(tmp_path / "handover.sock")
+    old = TwotterServer(("127.0.0.1", 0))
+    old.periodic_tasks = False
+    address = old.sock.getsockname()
+    old.enable_handover(path)
+    serving = threading.Thread(target=old.run, daemon=True)
+    serving.start()
+
+    alice, bob = udp_client(), udp_client()
+    for client_id, client in ((1, alice), (2, bob)):
+        client.sendto(encode_message(TwotterMessage(MessageType.HELLO, client_id, 0, "a", "")), address)
+        client.recv(2048)
+
+    handover = take_over(path)
+    new = TwotterServer(address, sock=handover.sock)
+    new.periodic_tasks = False
+    # Enviada durante o handover: fica na fila do socket e é lida pelo novo processo.
+    alice.sendto(encode_message(TwotterMessage(MessageType.MESSAGE, 1, 2, "a", "sem perdas")), address)
+    assert new.restore_snapshot(handover.snapshot) == 2
+    handover.confirm()
+    serving.join(5)
+    assert not serving.is_alive() and old.handed_over
+
+    threading.Thread(target=new.run, daemon=True).start()
+    assert decode_message(bob.recv(2048)).text == "sem perdas"
+    assert new.sock.getsockname() == address
+    assert take_over(str(tmp_path / "nenhum.sock")) is None
@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+import pytest
+
+from twotter import TwotterClient
+from twotter.entitites.workers import run_workers
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "SO_REUSEPORT")
+                                or "fork" not in multiprocessing.get_all_start_methods(),
+                                reason="requer SO_REUSEPORT e fork")
+
+CLIENTS = 16
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_workers_deliver_across_processes():
+    # Worker que tratou o HELLO de cada cliente, gravado pelos próprios workers.
+    worker_of = multiprocessing.Array('i', [-1] * (CLIENTS + 1), lock=False)
+
+    def record_worker(server, index):
+        handle = server.handle_oi_message
+
+        def handle_oi_message(message, client_address):
+            worker_of[message.origin_id] = index
+            handle(message, client_address)
+
+        server.handle_oi_message = handle_oi_message
+
+    address = ("127.0.0.1", free_port())
+    # O processo pai dos workers não pode ser daemon, pois cria processos.
+    parent = multiprocessing.get_context("fork").Process(
+        target=run_workers, args=(2,), kwargs={"address": address, "server_setup": record_worker})
+    parent.start()
+    try:
+        clients = [TwotterClient(address, client_id, f"c{client_id}", wire_version=1)
+                   for client_id in range(1, CLIENTS + 1)]
+        pairs = [(a, b) for a in clients for b in clients if worker_of[a.client_id] != worker_of[b.client_id]]
+        if not pairs:
+            pytest.skip("todos os clientes foram atendidos pelo mesmo worker")
+        sender, receiver = pairs[0]
+        sender.send_message("entre workers", receiver.client_id)
+
+        deadline = time.monotonic() + 3
+        while time.monotonic() < deadline:
+            if any(message.text == "entre workers" for message in receiver.received_messages):
+                break
+            time.sleep(0.05)
+        else:
+            pytest.fail("a mensagem não chegou ao cliente atendido pelo outro worker")
+    finally:
+        # Com SIGINT o pai encerra os workers antes de sair.
+        os.kill(parent.pid, signal.SIGINT)
+        parent.join(5)
+        if parent.is_alive():
+            parent.terminate()